@@ -1,79 +1,294 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, abort, session
-from werkzeug.utils import secure_filename
+import click
+import mimetypes
+from itertools import chain
+from dataclasses import replace
+from datetime import datetime, timedelta
+from time import perf_counter, sleep
+from jinja2 import FileSystemBytecodeCache
+from flask import (
+    Flask, render_template, request, redirect, url_for, flash, abort, session, g, has_request_context, jsonify,
+    send_from_directory, Response, before_render_template, template_rendered, stream_with_context,
+)
 import re
 import json
+import secrets
 import sqlite3
+import threading
 from pathlib import Path
-from datetime import datetime
 
 from supabase_service import (
     supabase_enabled,
+    on_menu_change,
     list_categories,
     list_menu_items,
     upsert_category,
     insert_menu_item,
+    update_menu_item,
     get_menu_item,
-    insert_booking,
-    insert_booking_items,
-    list_bookings,
-    get_booking,
-    list_booking_items,
+    list_menu_items_by_ids,
+    create_bookings,
+    list_bookings_page,
+    list_bookings_export_page,
+    list_booking_image_paths,
+    get_booking_with_items,
+    is_transient_error,
+    stats as supabase_stats,
 )
+from assets import AssetManifest, build_assets
+from availability import AvailabilityIndex, NoCapacity, SeatingModel, migration_slot_usage, parse_day, parse_time
+from booking_export import FORMATS as EXPORT_FORMATS, iter_pages, iter_rows
+from booking_outbox import BookingOutbox
+from cart_store import CartFull, CartStore, SQLiteCartBackend
+from db import SQLiteDatabase, ensure_column
+from image_pipeline import ImageProcessingError, generate_variants, resolve_static, variants_for
+from menu_cache import StaleWhileRevalidateCache
+from menu_catalog import MenuCatalog
+from menu_snapshot import SharedSnapshot, SharedValue
+from menu_store import JsonMenuStore
+from metrics import MetricsRegistry, begin_request, count_event, current_request, end_request, timed
+from page_cache import PageCache, cache_pages
+from pricing import format_cents, money, parse_cents
+from records import Booking, BookingLine, MenuItem
+from upload_store import HASHED_URL_RE, UploadRejected, UploadStore
 
 app = Flask(__name__)
-app.secret_key = "change_this_secret_key"
+
+
+def _load_secret_key() -> str:
+    """SECRET_KEY из окружения; без него — ключ в instance/secret_key, общий для всех воркеров."""
+    key = os.getenv("SECRET_KEY")
+    if key:
+        return key
+    path = Path(app.instance_path) / "secret_key"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        # O_EXCL: из одновременно стартующих воркеров файл создаст ровно один
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    else:
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+    for _ in range(50):
+        key = path.read_text().strip()
+        if key:
+            return key
+        sleep(0.01)  # другой воркер ещё дописывает файл
+    raise RuntimeError(f"{path} пуст — удалите его или задайте SECRET_KEY")
+
+
+app.secret_key = _load_secret_key()
+
+# скомпилированные шаблоны на диске, общие для воркеров: новый воркер не разбирает их заново
+JINJA_CACHE_DIR = Path(app.instance_path) / "jinja_cache"
+JINJA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+app.jinja_options = {**app.jinja_options, "bytecode_cache": FileSystemBytecodeCache(str(JINJA_CACHE_DIR))}
 
 # If SUPABASE_URL + SUPABASE_ANON_KEY are provided, the app uses Supabase (Postgres).
 USE_SUPABASE = supabase_enabled()
 
 DB_PATH = Path(__file__).with_name("bookings.sqlite3")
 MENU_DATA_PATH = Path(__file__).with_name("menu_data.json")  # fallback (when Supabase is not configured)
-UPLOAD_DIR = Path(__file__).with_name("static") / "uploads"
+STATIC_DIR = Path(__file__).with_name("static")
+UPLOAD_DIR = STATIC_DIR / "uploads"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB") or 10) * 1024 * 1024
+# запас на остальные поля формы; больший запрос werkzeug отклонит с 413, не дочитывая тело
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES + 1024 * 1024
+
+ASSETS = AssetManifest(STATIC_DIR)
+PAGE_CACHE = PageCache(max_entries=int(os.getenv("PAGE_CACHE_ENTRIES") or 512))
+
+# картинки блюд хранятся по sha256 содержимого: uploads/ab/<sha256>.jpg
+UPLOAD_STORE = UploadStore(STATIC_DIR, Path(app.instance_path) / "uploads.sqlite3", MAX_UPLOAD_BYTES)
+
+# брони для Supabase сначала ложатся в локальный журнал, в Supabase их отправляет фоновый поток
+BOOKING_OUTBOX = (
+    BookingOutbox(
+        Path(app.instance_path) / "booking_outbox.sqlite3", create_bookings, is_transient=is_transient_error
+    )
+    if USE_SUPABASE else None
+)
+
+# корзины на сервере: в cookie сессии только токен и ревизия, содержимое — в instance/carts.sqlite3
+CART_STORE = CartStore(
+    SQLiteCartBackend(Path(app.instance_path) / "carts.sqlite3"),
+    ttl_seconds=float(os.getenv("CART_TTL_DAYS") or 14) * 24 * 3600,
+    cache_entries=int(os.getenv("CART_CACHE_ENTRIES") or 4096),
+    max_lines=int(os.getenv("CART_MAX_LINES") or 50),
+)
 
-def _table_columns(con: sqlite3.Connection, table: str) -> set:
-    cols = set()
-    cur = con.execute(f"PRAGMA table_info({table})")
-    for row in cur.fetchall():
-        # row: (cid, name, type, notnull, dflt_value, pk)
-        cols.add(row[1])
-    return cols
+# столы и часы посадки; занятость по слотам — таблица slot_usage в bookings.sqlite3
+SEATING = SeatingModel.load(Path(os.getenv("SEATING_CONFIG") or Path(__file__).with_name("seating.json")))
+AVAILABILITY = AvailabilityIndex(SEATING)
+
+BOOKINGS_DB = SQLiteDatabase(DB_PATH)
+
+
+def _migration_001_bookings(con: sqlite3.Connection) -> None:
+    """Таблица бронирований + колонки, которые раньше добавлялись по одной (безопасно для старой базы)."""
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS bookings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            guests INTEGER NOT NULL,
+            comment TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    ensure_column(con, "bookings", "email", "TEXT")
+    ensure_column(con, "bookings", "notes", "TEXT")
+    ensure_column(con, "bookings", "cart_items", "TEXT")   # JSON строка (до миграции 3)
+    ensure_column(con, "bookings", "cart_total", "TEXT")   # "$48" и т.п.
 
 
-def _ensure_column(con: sqlite3.Connection, table: str, col: str, col_sql: str) -> None:
-    cols = _table_columns(con, table)
-    if col not in cols:
-        con.execute(f"ALTER TABLE {table} ADD COLUMN {col} {col_sql}")
+def _migration_002_booking_filter_indexes(con: sqlite3.Connection) -> None:
+    # индексы под фильтры админки; все кончаются id (у двух последних — неявный rowid), поэтому
+    # отфильтрованный список листается по индексу фильтра без сортировки (_sqlite_booking_query)
+    con.execute("CREATE INDEX IF NOT EXISTS bookings_date_idx ON bookings(date, id)")
+    con.execute("CREATE INDEX IF NOT EXISTS bookings_phone_idx ON bookings(phone COLLATE NOCASE)")
+    con.execute("CREATE INDEX IF NOT EXISTS bookings_name_idx ON bookings(name COLLATE NOCASE)")
 
 
-def init_db():
-    """
-    Создаёт таблицу бронирований (если её нет) и при необходимости
-    добавляет новые колонки в уже существующую таблицу.
+def _legacy_cart_lines(cart_json: str) -> list[dict]:
+    """Строки заказа из старого JSON в bookings.cart_items (форматы менялись — отсюда эвристики)."""
+    try:
+        raw_items = json.loads(cart_json or "[]")
+    except ValueError:
+        return []
+
+    lines = []
+    for it in raw_items if isinstance(raw_items, list) else []:
+        if not isinstance(it, dict):
+            continue
+        try:
+            qty = int(it.get("qty") or 0)
+        except (TypeError, ValueError):
+            continue
+        if qty <= 0:
+            continue
+
+        if "unit_price_cents" in it:
+            unit_cents = int(it.get("unit_price_cents") or 0)
+        elif "unit" in it:
+            unit_cents = parse_cents(it.get("unit"))
+        else:
+            unit_cents = parse_cents(it.get("price_str") or it.get("price"))
+
+        try:
+            menu_item_id = int(it.get("id")) if it.get("id") is not None else None
+        except (TypeError, ValueError):
+            menu_item_id = None
+
+        lines.append({
+            "menu_item_id": menu_item_id,
+            "title": (it.get("title") or "").strip(),
+            "qty": qty,
+            "unit_price_cents": unit_cents,
+            "line_total_cents": unit_cents * qty,
+            "image_path": (it.get("img") or it.get("image_path") or "").lstrip("/"),
+        })
+    return lines
+
+
+def _insert_booking_items(con: sqlite3.Connection, booking_id: int, lines: list[dict]) -> int:
+    con.executemany(
+        """
+        INSERT INTO booking_items (booking_id, menu_item_id, title, qty, unit_price_cents, line_total_cents, image_path)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (booking_id, ln["menu_item_id"], ln["title"], ln["qty"],
+             ln["unit_price_cents"], ln["line_total_cents"], ln["image_path"])
+            for ln in lines
+        ],
+    )
+    return sum(ln["line_total_cents"] for ln in lines)
+
+
+def _migration_003_booking_items(con: sqlite3.Connection) -> None:
+    """Заказ — отдельной таблицей (как booking_items в Supabase), сумма — в копейках.
+
+    Старые брони переносятся из JSON cart_items порциями: курсор не тянет всю таблицу в память.
+    Сам cart_items остаётся как был: разбор эвристический, и нераспознанную строку можно
+    будет восстановить. Колонку удалит отдельная миграция, когда перенос проверят.
     """
-    with sqlite3.connect(DB_PATH) as con:
-        con.execute("""
-            CREATE TABLE IF NOT EXISTS bookings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                phone TEXT NOT NULL,
-                date TEXT NOT NULL,
-                time TEXT NOT NULL,
-                guests INTEGER NOT NULL,
-                comment TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS booking_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            booking_id INTEGER NOT NULL REFERENCES bookings(id) ON DELETE CASCADE,
+            menu_item_id INTEGER,
+            title TEXT NOT NULL,
+            qty INTEGER NOT NULL DEFAULT 1,
+            unit_price_cents INTEGER NOT NULL DEFAULT 0,
+            line_total_cents INTEGER NOT NULL DEFAULT 0,
+            image_path TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS booking_items_booking_id_idx ON booking_items(booking_id)")
+    con.execute("CREATE INDEX IF NOT EXISTS booking_items_menu_item_id_idx ON booking_items(menu_item_id)")
+    ensure_column(con, "bookings", "cart_total_cents", "INTEGER")
+
+    cur = con.execute(
+        "SELECT id, cart_items, cart_total FROM bookings "
+        "WHERE cart_items IS NOT NULL AND cart_items != '' ORDER BY id"
+    )
+    while True:
+        rows = cur.fetchmany(500)
+        if not rows:
+            break
+        for booking_id, cart_json, cart_total in rows:
+            lines_total = _insert_booking_items(con, booking_id, _legacy_cart_lines(cart_json))
+            total_cents = parse_cents(cart_total) or lines_total
+            con.execute(
+                "UPDATE bookings SET cart_total_cents = ? WHERE id = ?",
+                (total_cents, booking_id),
             )
-        """)
+    con.execute(
+        "UPDATE bookings SET cart_total_cents = 0 WHERE cart_total_cents IS NULL"
+    )
 
-        # миграции (безопасно для уже существующей базы)
-        _ensure_column(con, "bookings", "email", "TEXT")
-        _ensure_column(con, "bookings", "notes", "TEXT")
-        _ensure_column(con, "bookings", "cart_items", "TEXT")   # JSON строка
-        _ensure_column(con, "bookings", "cart_total", "TEXT")   # "$48" и т.п.
 
-        con.commit()
+def _migration_004_slot_usage(con: sqlite3.Connection) -> None:
+    """Счётчики занятости столов; заполняются по будущим броням (прошедшие дни не нужны)."""
+    migration_slot_usage(con)
+    today = datetime.now().strftime("%Y-%m-%d")
+    rows = con.execute("SELECT date, time, guests FROM bookings WHERE date >= ?", (today,)).fetchall()
+    AVAILABILITY.rebuild(con, rows, today)
+
+
+def _migration_005_slot_usage_source(con: sqlite3.Connection) -> None:
+    """Откуда пересобраны счётчики столов: в режиме Supabase их нужно засеять из Supabase."""
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS slot_usage_source (
+            source TEXT PRIMARY KEY,
+            rebuilt_at REAL NOT NULL
+        )
+    """)
+
+
+# порядок важен: номер миграции = позиция в списке (PRAGMA user_version)
+BOOKINGS_MIGRATIONS = [
+    _migration_001_bookings,
+    _migration_002_booking_filter_indexes,
+    _migration_003_booking_items,
+    _migration_004_slot_usage,
+    _migration_005_slot_usage_source,
+]
+
+
+def init_db() -> None:
+    """Доводит схему bookings.sqlite3 до текущей версии. Вызывается один раз при старте."""
+    BOOKINGS_DB.migrate(BOOKINGS_MIGRATIONS)
+
+
+init_db()
 
 
 # ======= ДАННЫЕ МЕНЮ =======
@@ -93,7 +308,7 @@ DEFAULT_MENU_ITEMS = [
         "id": 1,
         "cat": "zakuski",
         "title": "Escargots de Bourgogne",
-        "price": "₸18",
+        "price_cents": 1800,
         "desc": "Бургундские улитки с чесночным травяным маслом и свежей петрушкой",
         "img": "img/menu/zakuski_1.jpg",
     },
@@ -101,7 +316,7 @@ DEFAULT_MENU_ITEMS = [
         "id": 2,
         "cat": "zakuski",
         "title": "Foie Gras Terrine",
-        "price": "₸24",
+        "price_cents": 2400,
         "desc": "Террин из утиной печени с инжирным конфитюром и поджаренной бриошью",
         "img": "img/menu/zakuski_2.jpg",
         "ingredients": ["утиная печень", "инжир", "бриошь", "портвейн", "коньяк"],
@@ -111,7 +326,7 @@ DEFAULT_MENU_ITEMS = [
         "id": 3,
         "cat": "zakuski",
         "title": "Soupe à l'Oignon",
-        "price": "₸14",
+        "price_cents": 1400,
         "desc": "Классический луковый суп с сыром Грюйер и гренками из закваски",
         "img": "img/menu/zakuski_3.jpg",
     },
@@ -119,7 +334,7 @@ DEFAULT_MENU_ITEMS = [
         "id": 4,
         "cat": "zakuski",
         "title": "Huîtres",
-        "price": "₸22",
+        "price_cents": 2200,
         "desc": "Свежие устрицы с соусом миньонет и лимоном",
         "img": "img/menu/zakuski_4.jpg",
     },
@@ -129,7 +344,7 @@ DEFAULT_MENU_ITEMS = [
         "id": 5,
         "cat": "mains",
         "title": "Coq au Vin",
-        "price": "$38",
+        "price_cents": 3800,
         "desc": "Тушеная курица в красном вине с жемчужным луком и грибами",
         "img": "img/menu/mains_1.jpg",
     },
@@ -137,7 +352,7 @@ DEFAULT_MENU_ITEMS = [
         "id": 6,
         "cat": "mains",
         "title": "Boeuf Bourguignon",
-        "price": "₸42",
+        "price_cents": 4200,
         "desc": "Медленно тушеная говядина в бургундском винном соусе с корнеплодами",
         "img": "img/menu/mains_2.jpg",
     },
@@ -145,7 +360,7 @@ DEFAULT_MENU_ITEMS = [
         "id": 7,
         "cat": "mains",
         "title": "Sole Meunière",
-        "price": "$46",
+        "price_cents": 4600,
         "desc": "Жареная камбала со сливочным маслом, лимоном и каперсами",
         "img": "img/menu/mains_3.jpg",
     },
@@ -155,7 +370,7 @@ DEFAULT_MENU_ITEMS = [
         "id": 8,
         "cat": "desserts",
         "title": "Crème Brûlée",
-        "price": "₸12",
+        "price_cents": 1200,
         "desc": "Классический ванильный крем с карамелизированной сахарной корочкой",
         "img": "img/menu/desserts_1.jpg",
     },
@@ -163,7 +378,7 @@ DEFAULT_MENU_ITEMS = [
         "id": 9,
         "cat": "desserts",
         "title": "Tarte Tatin",
-        "price": "₸14",
+        "price_cents": 1400,
         "desc": "Перевернутый карамелизированный яблочный тарт с ванильным мороженым",
         "img": "img/menu/desserts_2.jpg",
     },
@@ -171,7 +386,7 @@ DEFAULT_MENU_ITEMS = [
         "id": 10,
         "cat": "desserts",
         "title": "Soufflé au Chocolat",
-        "price": "₸16",
+        "price_cents": 1600,
         "desc": "Легкое шоколадное суфле (время приготовления 20 мин)",
         "img": "img/menu/desserts_3.jpg",
     },
@@ -179,7 +394,7 @@ DEFAULT_MENU_ITEMS = [
         "id": 11,
         "cat": "desserts",
         "title": "Profiteroles",
-        "price": "₸13",
+        "price_cents": 1300,
         "desc": "Заварные пирожные с ванильным мороженым и теплым шоколадным соусом",
         "img": "img/menu/desserts_4.jpg",
     },
@@ -189,7 +404,7 @@ DEFAULT_MENU_ITEMS = [
         "id": 12,
         "cat": "drinks",
         "title": "Chardonnay (glass)",
-        "price": "₸11",
+        "price_cents": 1100,
         "desc": "Сухое белое вино, бокал",
         "img": "img/menu/drinks_1.jpg",
     },
@@ -197,7 +412,7 @@ DEFAULT_MENU_ITEMS = [
         "id": 13,
         "cat": "drinks",
         "title": "Bordeaux Rouge (glass)",
-        "price": "₸12",
+        "price_cents": 1200,
         "desc": "Красное вино, бокал",
         "img": "img/menu/drinks_2.jpg",
     },
@@ -205,7 +420,7 @@ DEFAULT_MENU_ITEMS = [
         "id": 14,
         "cat": "drinks",
         "title": "Espresso",
-        "price": "₸4",
+        "price_cents": 400,
         "desc": "Классический эспрессо",
         "img": "img/menu/drinks_3.jpg",
     },
@@ -213,7 +428,7 @@ DEFAULT_MENU_ITEMS = [
         "id": 15,
         "cat": "drinks",
         "title": "Signature Cocktail",
-        "price": "₸14",
+        "price_cents": 1400,
         "desc": "Авторский коктейль бармена",
         "img": "img/menu/drinks_4.jpg",
     },
@@ -228,50 +443,16 @@ def _slugify(text: str) -> str:
     return text or "category"
 
 
-def load_menu_data() -> tuple[list[dict], list[dict]]:
-    """Fallback меню (локально).
-
-    Если Supabase настроен — меню берём из Supabase, а JSON используется только
-    когда Supabase не подключен.
-    """
-    if USE_SUPABASE:
-        return list(DEFAULT_CATEGORIES), list(DEFAULT_MENU_ITEMS)
-
-    if MENU_DATA_PATH.exists():
-        try:
-            data = json.loads(MENU_DATA_PATH.read_text(encoding="utf-8"))
-            cats = data.get("categories") or []
-            items = data.get("items") or []
-            # Если categories является списком, считаем данные валидными даже при пустом items.
-            # Это позволяет держать меню пустым, не возвращаясь к демонстрационным блюдам.
-            if isinstance(cats, list) and cats:
-                # items может быть пустым списком — это тоже валидно
-                return cats, items if isinstance(items, list) else []
-        except Exception:
-            pass
-
-    # если файла нет или повреждён, сохраняем дефолтные категории (без позиций)
-    save_menu_data(DEFAULT_CATEGORIES, [])
-    return list(DEFAULT_CATEGORIES), []
-
-
-def save_menu_data(categories: list[dict], items: list[dict]) -> None:
-    if USE_SUPABASE:
-        return
-    payload = {"categories": categories, "items": items}
-    MENU_DATA_PATH.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+# menu_data.json: кеш по mtime, запись — под файловой блокировкой через temp + os.replace
+MENU_STORE = JsonMenuStore(MENU_DATA_PATH, DEFAULT_CATEGORIES)
 
 
 # ---------------------------
 #    MENU DATA (Supabase)
 # ---------------------------
 
-_MENU_CACHE: dict = {"ts": 0.0, "categories": [], "items": []}
 _MENU_CACHE_SECONDS = 30
-
-
-def _price_cents_from_str(price_str: str) -> int:
-    return int(round(parse_price_to_float(price_str) * 100))
+_MENU_CATALOG: "MenuCatalog | None" = None
 
 
 def _split_csv(text: str) -> list[str]:
@@ -301,176 +482,273 @@ def ensure_supabase_seed() -> None:
         return
 
 
-def get_menu_data(force: bool = False) -> tuple[list[dict], list[dict]]:
-    """Возвращает (categories, items). При Supabase — тянет из БД + кеш на 30 секунд."""
-    global _MENU_CACHE
-
-    if not USE_SUPABASE:
-        return load_menu_data()
+def _map_menu_item_supabase(r: dict) -> dict:
+    return {
+        "id": r.get("id"),
+        "cat": r.get("category_slug"),
+        "title": r.get("title") or "",
+        "price_cents": int(r.get("price_cents") or 0),
+        "desc": r.get("description") or "",
+        "img": (r.get("image_path") or "img/placeholder.jpg").lstrip("/"),
+        "img_variants": r.get("image_variants") or {},
+        "ingredients": _split_csv(r.get("ingredients") or ""),
+        "allergens": _split_csv(r.get("allergens") or ""),
+        "wine_title": r.get("wine_title") or "",
+        "wine_text": r.get("wine_text") or "",
+    }
 
-    now_ts = datetime.utcnow().timestamp()
-    if (not force) and _MENU_CACHE["categories"] and (now_ts - _MENU_CACHE["ts"] < _MENU_CACHE_SECONDS):
-        return _MENU_CACHE["categories"], _MENU_CACHE["items"]
 
-    try:
+def _load_menu_from_supabase() -> tuple[list[dict], list[dict]]:
+    cats_raw = list_categories()
+    items_raw = list_menu_items()
+    if not cats_raw:
+        ensure_supabase_seed()
         cats_raw = list_categories()
         items_raw = list_menu_items()
-        if not cats_raw:
-            ensure_supabase_seed()
-            cats_raw = list_categories()
-            items_raw = list_menu_items()
-
-        categories = [{"slug": c.get("slug"), "label": c.get("label")} for c in (cats_raw or [])]
-
-        items: list[dict] = []
-        for r in (items_raw or []):
-            price_cents = int(r.get("price_cents") or 0)
-            items.append({
-                "id": r.get("id"),
-                "cat": r.get("category_slug"),
-                "title": r.get("title") or "",
-                "price_cents": price_cents,
-                "price": money(price_cents),
-                "desc": r.get("description") or "",
-                "img": (r.get("image_path") or "img/placeholder.jpg").lstrip("/"),
-                "ingredients": _split_csv(r.get("ingredients") or ""),
-                "allergens": _split_csv(r.get("allergens") or ""),
-                "wine_title": r.get("wine_title") or "",
-                "wine_text": r.get("wine_text") or "",
-            })
-
-        _MENU_CACHE = {"ts": now_ts, "categories": categories, "items": items}
-        return categories, items
-    except Exception:
-        # тихий fallback
-        return list(DEFAULT_CATEGORIES), list(DEFAULT_MENU_ITEMS)
+
+    categories = [{"slug": c.get("slug"), "label": c.get("label")} for c in (cats_raw or [])]
+    items = [_map_menu_item_supabase(r) for r in (items_raw or [])]
+    return categories, items
 
 
-def group_menu_items():
-    categories, items = get_menu_data()
-    grouped = {c["slug"]: [] for c in categories}
-    for item in items:
-        grouped.setdefault(item["cat"], []).append(item)
-    return grouped
+# Снимок меню один на хост: в Supabase ходит один воркер (leader), остальные
+# читают тот же файл и перечитывают его только при смене версии.
+_MENU_SNAPSHOT = SharedSnapshot(
+    Path(os.getenv("MENU_SNAPSHOT_PATH") or Path(app.instance_path) / "menu_snapshot.json")
+)
 
 
-def get_item_by_id(item_id: int):
-    _, items = get_menu_data()
-    for x in items:
-        if int(x.get("id") or 0) == int(item_id):
-            return x
-    # if Supabase enabled, try direct fetch
-    if USE_SUPABASE:
+def _load_shared_menu() -> SharedValue:
+    snap = _MENU_SNAPSHOT.read()
+    if snap is not None and not _MENU_SNAPSHOT.is_stale(snap, _MENU_CACHE_SECONDS):
+        return snap
+
+    with _MENU_SNAPSHOT.leader():
+        # пока ждали блокировку, снимок мог опубликовать другой воркер
+        snap = _MENU_SNAPSHOT.read()
+        if snap is not None and not _MENU_SNAPSHOT.is_stale(snap, _MENU_CACHE_SECONDS):
+            return snap
+        dirty_generation = _MENU_SNAPSHOT.dirty_generation()
         try:
-            r = get_menu_item(int(item_id))
-            if r:
-                price_cents = int(r.get("price_cents") or 0)
-                return {
-                    "id": r.get("id"),
-                    "cat": r.get("category_slug"),
-                    "title": r.get("title") or "",
-                    "price_cents": price_cents,
-                    "price": money(price_cents),
-                    "desc": r.get("description") or "",
-                    "img": (r.get("image_path") or "img/placeholder.jpg").lstrip("/"),
-                    "ingredients": _split_csv(r.get("ingredients") or ""),
-                    "allergens": _split_csv(r.get("allergens") or ""),
-                    "wine_title": r.get("wine_title") or "",
-                    "wine_text": r.get("wine_text") or "",
-                }
+            value = _load_menu_from_supabase()
         except Exception:
-            pass
-    return None
+            if snap is not None:
+                return snap  # Supabase недоступен — лучше устаревшее меню, чем демо
+            raise
+        return _MENU_SNAPSHOT.publish(value, dirty_generation)
+
+
+def _on_menu_written() -> None:
+    _MENU_SNAPSHOT.mark_dirty()
+    _MENU_CACHE.invalidate()
+
+
+# Устаревшая копия отдаётся сразу, обновление — в одном фоновом потоке;
+# записи из админки (upsert_category / insert_menu_item) инвалидируют снимок через хук.
+_MENU_CACHE = StaleWhileRevalidateCache(_load_shared_menu, fresh_seconds=_MENU_CACHE_SECONDS)
+on_menu_change(_on_menu_written)
 
 
-def parse_price_to_float(price_str: str) -> float:
-    # "$24" / "24" / "24.50" / "24,50" -> 24.5
-    if not price_str:
-        return 0.0
-    s = price_str.strip().replace(",", ".")
-    s = re.sub(r"[^0-9.]", "", s)
+def _get_supabase_menu() -> tuple[tuple, list[dict], list[dict]]:
+    if _MENU_SNAPSHOT.changed():
+        # другой воркер опубликовал новую версию
+        _MENU_CACHE.invalidate()
     try:
-        return float(s) if s else 0.0
-    except ValueError:
-        return 0.0
+        shared = _MENU_CACHE.get().value
+    except Exception:
+        # тихий fallback
+        return ("fallback",), list(DEFAULT_CATEGORIES), list(DEFAULT_MENU_ITEMS)
+    categories, items = shared.value
+    return ("supabase", shared.version), categories, items
 
 
-def fmt_money(val: float) -> str:
-    # красиво: $48 или $48.50
-    if abs(val - int(val)) < 1e-9:
-        return f"₸{int(val)}"
-    return f"₸{val:.2f}"
+def _current_menu_catalog() -> tuple[MenuCatalog, bool]:
+    """(каталог, взят ли он из кеша без пересборки)."""
+    global _MENU_CATALOG
+
+    catalog = _MENU_CATALOG
+    if USE_SUPABASE:
+        version, categories, items = _get_supabase_menu()
+        if catalog is not None and catalog.version == version:
+            return catalog, True
+    else:
+        version = MENU_STORE.version()
+        if catalog is not None and catalog.version == version:
+            return catalog, True
+        # версия — от того же stat, по которому читались данные: запись между чтением и
+        # повторным stat не должна пометить старое меню новой версией
+        version, categories, items = MENU_STORE.load_versioned()
 
+    catalog = MenuCatalog(version, categories, items, to_cents=parse_cents, fmt=format_cents)
+    _MENU_CATALOG = catalog
+    return catalog, False
 
-def money(value) -> str:
-    """Jinja-хелпер: принимает cents (int) или $-строку/float и возвращает '$12.34'."""
-    if value is None:
-        return "—"
-    # если пришла строка "$48" — парсим как доллары
-    if isinstance(value, str):
-        return fmt_money(parse_price_to_float(value))
 
-    # float считаем долларами
-    if isinstance(value, float):
-        return fmt_money(value)
+def get_menu_catalog() -> MenuCatalog:
+    """Каталог меню (индекс по id, группы, готовые цены) — пересобирается только при смене версии."""
+    with timed("menu"):
+        catalog, hit = _current_menu_catalog()
+    count_event("menu_cache_hit" if hit else "menu_cache_miss")
+    return catalog
 
-    # int считаем центами
+
+def _fetch_menu_item_detail(item_id: int) -> dict | None:
     try:
-        cents = int(value)
+        r = get_menu_item(item_id)
     except Exception:
-        return "—"
-    return fmt_money(cents / 100.0)
-
+        return None
+    return _map_menu_item_supabase(r) if r else None
 
-def _to_cents_from_price_str(price_str: str) -> int:
-    return int(round(parse_price_to_float(price_str) * 100))
 
+def get_item_by_id(item_id: int) -> MenuItem | None:
+    catalog = get_menu_catalog()
+    if USE_SUPABASE:
+        # в снимке меню только поля карточки; состав и вино догружаются и живут до новой версии
+        return catalog.detail(item_id, _fetch_menu_item_detail)
+    return catalog.get(item_id)
 
-def build_cart_view():
-    """
-    Собирает корзину из session["cart"] (без JS).
-    session["cart"] хранит {"2": 3, "5": 1}
-    """
-    cart = session.get("cart", {})  # {"2": 3, "5": 1}
-    items = []
-    total_cents = 0
-    count = 0
 
+def _parse_cart(cart: dict) -> list[tuple[int, int]]:
+    lines = []
     for k, qty in cart.items():
         try:
             item_id = int(k)
             qty = int(qty)
         except ValueError:
             continue
-        if qty <= 0:
-            continue
+        if qty > 0:
+            lines.append((item_id, qty))
+    return lines
+
+
+def _resolve_cart_items(item_ids: list[int]) -> dict[int, MenuItem]:
+    """Позиции корзины: из каталога, а отсутствующие в нём — одним batch-запросом в Supabase."""
+    catalog = get_menu_catalog()
+    found: dict[int, MenuItem] = {}
+    missing: list[int] = []
+    for item_id in item_ids:
+        item = catalog.get(item_id)
+        if item is not None:
+            found[item_id] = item
+        else:
+            missing.append(item_id)
+
+    if missing and USE_SUPABASE:
+        try:
+            for r in list_menu_items_by_ids(missing):
+                item = catalog.prepare(_map_menu_item_supabase(r))
+                found[item.id] = item
+        except Exception:
+            pass
+    return found
 
-        item = get_item_by_id(item_id)
+
+def _cart_token(create: bool = False) -> str | None:
+    """Токен корзины из сессии; старую корзину-словарь в cookie переносим в CART_STORE."""
+    token = session.get("cart")
+    if isinstance(token, dict):  # {"2": 3, "5": 1} — так корзина жила в cookie раньше
+        legacy = _parse_cart(token)
+        token = session["cart"] = CART_STORE.new_token()
+        session["cart_rev"] = 0
+        for item_id, qty in legacy:
+            try:
+                session["cart_rev"] = CART_STORE.add(token, item_id, qty)
+            except CartFull:
+                break
+    if not token and create:
+        token = session["cart"] = CART_STORE.new_token()
+        session["cart_rev"] = 0
+    return token
+
+
+def _cart_lines() -> list[tuple[int, int]]:
+    token = _cart_token()
+    if not token:
+        return []
+    return list(CART_STORE.get(token, int(session.get("cart_rev") or 0)).items())
+
+
+def _change_cart(item_id: int, delta: int | None = None) -> str | None:
+    """+delta к количеству позиции (отрицательное убавляет); delta=None — убрать позицию.
+
+    Вернёт текст ошибки, если позицию добавить нельзя: её нет в меню или корзина уже полна.
+    """
+    if delta is not None and delta > 0 and item_id not in _resolve_cart_items([item_id]):
+        return "Такой позиции нет в меню."
+    token = _cart_token(create=True)
+    try:
+        if delta is None:
+            session["cart_rev"] = CART_STORE.remove(token, item_id)
+        else:
+            session["cart_rev"] = CART_STORE.add(token, item_id, delta)
+    except CartFull as e:
+        return f"В корзине уже {e.args[0]} разных позиций — больше добавить нельзя."
+    finally:
+        g.pop("cart_view", None)
+    return None
+
+
+def _clear_cart() -> None:
+    token = _cart_token()
+    if token:
+        CART_STORE.clear(token)
+    session.pop("cart", None)
+    session.pop("cart_rev", None)
+    g.pop("cart_view", None)
+
+
+def build_cart_view():
+    """
+    Собирает корзину (без JS) из CART_STORE по токену из сессии.
+    Содержимое — {id позиции: количество}, например {2: 3, 5: 1}
+    """
+    lines = _cart_lines()
+    if not lines:
+        return [], format_cents(0), 0, 0
+
+    resolved = _resolve_cart_items([item_id for item_id, _ in lines])
+
+    items = []
+    total_cents = 0
+    count = 0
+
+    for item_id, qty in lines:
+        item = resolved.get(item_id)
         if not item:
             continue
 
-        # Prefer cents from DB (Supabase). Fallback to parsing "$12".
-        unit_cents = int(item.get("price_cents") or 0)
-        if unit_cents <= 0:
-            unit_cents = _to_cents_from_price_str(item.get("price", "0"))
-
+        # цена уже посчитана в каталоге (price_cents + готовая строка price)
+        unit_cents = item.price_cents
         line_cents = unit_cents * qty
 
         items.append({
             "id": item_id,
-            "title": item.get("title", ""),
-            "img": item.get("img", ""),
-            "price_str": money(unit_cents),
+            "title": item.title,
+            "img": item.img,
+            "img_variants": item.img_variants,
+            "price_str": item.price,
             "unit_price_cents": unit_cents,
             "qty": qty,
             "line_total_cents": line_cents,
-            "line_str": money(line_cents),
+            "line_str": format_cents(line_cents),
         })
 
         total_cents += line_cents
         count += qty
 
-    return items, money(total_cents), count, total_cents
+    return items, format_cents(total_cents), count, total_cents
+
+
+def get_cart_view():
+    """build_cart_view(), посчитанный не больше одного раза за запрос."""
+    if not has_request_context():
+        return build_cart_view()
+    view = g.get("cart_view")
+    if view is None:
+        with timed("cart"):
+            view = build_cart_view()
+        g.cart_view = view
+    return view
 
 
 @app.context_processor
@@ -478,8 +756,12 @@ def inject_cart_into_all_templates():
     """
     Теперь cart_count / cart_items / cart_total доступны в ЛЮБОМ шаблоне,
     включая booking.html и base.html (фиксит ошибку 'cart_count is undefined').
+    Админские шаблоны корзину не показывают — для них её не считаем.
     """
-    cart_items, cart_total, cart_count, cart_total_cents = build_cart_view()
+    if has_request_context() and (request.endpoint or "").startswith("admin_"):
+        cart_items, cart_total, cart_count, cart_total_cents = [], format_cents(0), 0, 0
+    else:
+        cart_items, cart_total, cart_count, cart_total_cents = get_cart_view()
     return dict(
         cart_items=cart_items,
         cart_total=cart_total,
@@ -489,7 +771,157 @@ def inject_cart_into_all_templates():
     )
 
 
+# ============================
+#     ЗАМЕРЫ ЗАПРОСОВ
+# ============================
+
+# гистограммы по маршрутам — в памяти воркера (у каждого процесса gunicorn свои)
+METRICS = MetricsRegistry(prefix="monet")
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS") or 1000)
+SERVER_TIMING = (os.getenv("SERVER_TIMING") or "1") != "0"
+
+
+@app.before_request
+def _begin_request_timings():
+    begin_request()
+
+
+@before_render_template.connect_via(app)
+def _render_started(_sender, template, context, **_extra):
+    g.setdefault("render_started", []).append(perf_counter())
+
+
+@template_rendered.connect_via(app)
+def _render_finished(_sender, template, context, **_extra):
+    started = g.get("render_started")
+    timings = current_request()
+    if started and timings is not None:
+        timings.add("render", perf_counter() - started.pop())
+
+
+@app.after_request
+def _finish_request_timings(response):
+    """Server-Timing в ответ, запрос — в гистограммы, медленный — в лог с разбивкой по фазам."""
+    timings = current_request()
+    if timings is None:
+        return response
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = timings.server_timing()
+    METRICS.observe(request.endpoint or "unmatched", request.method, response.status_code, timings)
+    elapsed_ms = timings.elapsed() * 1000
+    if elapsed_ms >= SLOW_REQUEST_MS:
+        # только путь: в query string бывают телефон и email гостя
+        app.logger.warning(
+            "медленный запрос %s %s -> %s: %.0f мс (%s)",
+            request.method, request.path, response.status_code, elapsed_ms, timings.breakdown(),
+        )
+    return response
+
+
+@app.teardown_request
+def _end_request_timings(_exc):
+    end_request()
+
+
+# ============================
+#     ПРОГРЕВ ВОРКЕРА
+# ============================
+
+# шаги прогрева и их длительность; пустой dict — воркер ещё не прогрет
+WARMUP: dict[str, float] = {}
+_WARMUP_LOCK = threading.Lock()
+
+
+def warm_up() -> dict[str, float]:
+    """Компилирует все шаблоны и собирает каталог меню до первого запроса.
+
+    Вызывается из gunicorn.conf.py (post_worker_init) — воркер начинает принимать
+    соединения уже прогретым. Ошибка в шаблоне валит старт воркера, а не первый запрос.
+    """
+    steps: dict[str, float] = {}
+
+    started = perf_counter()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    steps["templates"] = perf_counter() - started
+
+    started = perf_counter()
+    # в режиме Supabase здесь же импортируется клиент и открывается пул соединений
+    get_menu_catalog()
+    steps["menu"] = perf_counter() - started
+
+    started = perf_counter()
+    ASSETS.version()
+    BOOKINGS_DB.connection()
+    try:
+        ensure_slot_usage_seeded()
+    except Exception:
+        # Supabase недоступен — воркер всё равно поднимаем; брони засеют счётчики при первой заявке
+        app.logger.warning("счётчики столов не засеяны из Supabase", exc_info=True)
+    steps["storage"] = perf_counter() - started
+
+    WARMUP.update(steps)
+    return steps
+
+
+@app.before_request
+def _warm_up_lazily():
+    # без gunicorn (flask run, тесты) post_worker_init не вызывается — прогреваемся на первом запросе
+    if WARMUP:
+        return
+    with _WARMUP_LOCK:
+        if not WARMUP:
+            warm_up()
+
+
+@app.route("/ready")
+def ready():
+    """Готовность для балансировщика: 200 после warm_up(), до этого 503."""
+    if not WARMUP:
+        return jsonify(ready=False), 503
+    return jsonify(ready=True, warmup_ms={step: round(sec * 1000, 1) for step, sec in WARMUP.items()})
+
+
+def asset_url(name: str) -> str:
+    """URL ассета с хешем содержимого из static/dist; до `flask build-assets` — обычный /static."""
+    hashed = ASSETS.resolve(name)
+    if hashed is None:
+        return url_for("static", filename=name)
+    return url_for("asset", filename=hashed)
+
+
+app.add_template_global(asset_url)
+
+
+@app.route("/assets/<path:filename>")
+def asset(filename: str):
+    encoding = ASSETS.pick_encoding(filename, request.headers.get("Accept-Encoding", ""))
+    suffix = {"br": ".br", "gzip": ".gz"}.get(encoding, "")
+    response = send_from_directory(
+        ASSETS.dist,
+        filename + suffix,
+        mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        max_age=31536000,
+    )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+# кеш готового HTML: ключ — путь, query, версия меню и ассетов.
+# Шаблоны таких страниц не должны выводить cart_* — корзина в ключ не входит.
+cached_page = cache_pages(
+    PAGE_CACHE,
+    version=lambda: (get_menu_catalog().version, ASSETS.version()),
+    on_lookup=lambda hit: count_event("page_cache_hit" if hit else "page_cache_miss"),
+)
+
+
 @app.route("/")
+@cached_page
 def index():
     features = [
         {
@@ -546,39 +978,88 @@ def index():
     )
 
 
+def _menu_search_args(catalog: MenuCatalog) -> tuple[str, int]:
+    """?q=...&exclude=Орехи&exclude=Глютен (или через запятую) -> (запрос, маска аллергенов)."""
+    query = (request.args.get("q") or "").strip()[:100]
+    names = [n for raw in request.args.getlist("exclude") for n in raw.split(",")]
+    return query, catalog.search_index.allergen_mask(names)
+
+
 @app.route("/menu")
+@cached_page
 def menu():
     section = (request.args.get("section") or "zakuski").strip()
-    categories, _ = get_menu_data()
-    slugs = {c["slug"] for c in categories}
-    if section not in slugs:
+    catalog = get_menu_catalog()
+    if section not in catalog.slugs:
         section = "zakuski"
 
-    grouped = group_menu_items()
+    query, exclude_mask = _menu_search_args(catalog)
+    grouped = catalog.grouped
+    found = None
+    if query or exclude_mask:
+        found = catalog.search_index.search(query, exclude_mask)
+        grouped = {}
+        for item in found:
+            grouped.setdefault(item.cat, []).append(item)
 
     return render_template(
         "menu.html",
         active="menu",
-        categories=categories,
+        categories=catalog.categories,
         active_section=section,
-        grouped=grouped
+        grouped=grouped,
+        query=query,
+        allergens=catalog.search_index.allergens,
+        excluded=catalog.search_index.allergen_names(exclude_mask),
+        found=found,
     )
 
 
+@app.route("/menu/search")
+def menu_search():
+    """Поиск по меню для виджетов: ?q=сыр&exclude=Орехи&section=mains&limit=20 -> JSON."""
+    catalog = get_menu_catalog()
+    index = catalog.search_index
+    query, exclude_mask = _menu_search_args(catalog)
+    section = (request.args.get("section") or "").strip() or None
+    try:
+        limit = min(max(int(request.args.get("limit") or 50), 1), 200)
+    except ValueError:
+        abort(400)
+
+    items = index.search(query, exclude_mask, cat=section, limit=limit)
+    return jsonify({
+        "query": query,
+        "excluded": index.allergen_names(exclude_mask),
+        "allergens": list(index.allergens),
+        "items": [{
+            "id": item.id,
+            "cat": item.cat,
+            "title": item.title,
+            "price": item.price,
+            "price_cents": item.price_cents,
+            "desc": item.desc,
+            "allergens": list(item.allergens),
+            "img": asset_url(item.img),
+            "url": url_for("dish", item_id=item.id),
+        } for item in items],
+    })
+
+
 @app.route("/dish/<int:item_id>", methods=["GET", "POST"])
+@cached_page
 def dish(item_id: int):
     item = get_item_by_id(item_id)
     if not item:
         abort(404)
-
-    # если у блюда пока нет этих полей — не ломаемся
-    item.setdefault("ingredients", [])
-    item.setdefault("allergens", [])
-    item.setdefault("wine_title", "Винное сопровождение")
-    item.setdefault(
-        "wine_text",
-        "Наш сомелье рекомендует сочетать это блюдо с избранными винами из нашей тщательно подобранной винной карты. "
-        "Спросите вашего официанта о персональных рекомендациях для улучшения вашего гастрономического опыта."
+    # если у блюда пока нет этих полей — подставляем текст по умолчанию (запись каталога не меняется)
+    item = replace(
+        item,
+        wine_title=item.wine_title or "Винное сопровождение",
+        wine_text=item.wine_text or (
+            "Наш сомелье рекомендует сочетать это блюдо с избранными винами из нашей тщательно подобранной винной карты. "
+            "Спросите вашего официанта о персональных рекомендациях для улучшения вашего гастрономического опыта."
+        ),
     )
 
     # qty берём из query (без JS + и - просто меняют параметр)
@@ -595,7 +1076,7 @@ def dish(item_id: int):
         "desserts": "Десерт",
         "drinks": "Напиток",
     }
-    category_badge = badge_map.get(item.get("cat"), "Блюдо")
+    category_badge = badge_map.get(item.cat, "Блюдо")
 
     if request.method == "POST":
         action = (request.form.get("action") or "").strip()
@@ -608,13 +1089,11 @@ def dish(item_id: int):
                 form_qty = qty
             form_qty = max(1, min(form_qty, 99))
 
-            cart = session.get("cart", {})  # { "12": 3, ... }
-            key = str(item_id)
-            cart[key] = int(cart.get(key, 0)) + form_qty
-            session["cart"] = cart
-            session.modified = True
-
-            flash("Добавлено в корзину ✅", "success")
+            error = _change_cart(item_id, form_qty)
+            if error:
+                flash(error, "error")
+            else:
+                flash("Добавлено в корзину ✅", "success")
             return redirect(url_for("dish", item_id=item_id, qty=qty))
 
     return render_template(
@@ -626,6 +1105,57 @@ def dish(item_id: int):
     )
 
 
+def _slot_source() -> str:
+    return "supabase:" + (os.getenv("SUPABASE_URL") or "").rstrip("/")
+
+
+def _mark_slot_source(con: sqlite3.Connection) -> None:
+    con.execute(
+        "INSERT OR REPLACE INTO slot_usage_source (source, rebuilt_at) VALUES (?, ?)",
+        (_slot_source(), datetime.now().timestamp()),
+    )
+
+
+def _supabase_slot_rows(today: str) -> list[tuple[str, str, int]]:
+    """(дата, время, гости) будущих броней: из Supabase и ещё не отправленные из журнала."""
+    # журнал читаем первым: бронь, отправленная между двумя чтениями, посчитается дважды
+    # (лишний занятый стол), а не ни разу (перебронирование)
+    rows = BOOKING_OUTBOX.pending_slots() if BOOKING_OUTBOX is not None else []
+    before_id = None
+    while True:
+        page = list_bookings_page(500, before_id=before_id, date_from=today)
+        rows += [(r.get("booking_date"), r.get("booking_time"), r.get("guests")) for r in page]
+        if len(page) < 500:
+            return rows
+        before_id = page[-1]["id"]
+
+
+_SLOT_USAGE_SEEDED = not USE_SUPABASE
+
+
+def ensure_slot_usage_seeded() -> None:
+    """В режиме Supabase счётчики столов один раз засеваются будущими бронями из Supabase.
+
+    Без этого брони, сделанные до перехода на локальные счётчики (или до пустой
+    bookings.sqlite3 на новом сервере), не занимали бы столы. Ошибка Supabase пробрасывается:
+    принимать брони, не зная занятости, нельзя.
+    """
+    global _SLOT_USAGE_SEEDED
+    if _SLOT_USAGE_SEEDED:
+        return
+    source = _slot_source()
+    seeded_sql = "SELECT 1 FROM slot_usage_source WHERE source = ?"
+    if BOOKINGS_DB.connection().execute(seeded_sql, (source,)).fetchone() is None:
+        today = datetime.now().strftime("%Y-%m-%d")
+        rows = _supabase_slot_rows(today)
+        with BOOKINGS_DB.transaction() as con:
+            # другой воркер мог успеть засеять (и уже принять брони) — тогда не затираем
+            if con.execute(seeded_sql, (source,)).fetchone() is None:
+                AVAILABILITY.rebuild(con, rows, today)
+                _mark_slot_source(con)
+    _SLOT_USAGE_SEEDED = True
+
+
 @app.route("/booking", methods=["GET", "POST"])
 def booking():
     """
@@ -638,36 +1168,24 @@ def booking():
 
         # ===== корзина (кнопки) =====
         if action in {"cart_inc", "cart_dec", "cart_remove", "cart_clear"}:
-            cart = session.get("cart", {})
-
             if action == "cart_clear":
-                session["cart"] = {}
-                session.modified = True
+                _clear_cart()
                 return redirect(url_for("booking") + "#cart")
 
-            item_id = (request.form.get("item_id") or "").strip()
-            if item_id:
-                key = str(item_id)
-                try:
-                    current = int(cart.get(key, 0))
-                except ValueError:
-                    current = 0
-
+            try:
+                item_id = int((request.form.get("item_id") or "").strip())
+            except ValueError:
+                item_id = None
+            error = None
+            if item_id is not None:
                 if action == "cart_inc":
-                    cart[key] = current + 1
-
+                    error = _change_cart(item_id, 1)
                 elif action == "cart_dec":
-                    new_val = current - 1
-                    if new_val <= 0:
-                        cart.pop(key, None)
-                    else:
-                        cart[key] = new_val
-
+                    error = _change_cart(item_id, -1)  # до нуля — позиция уходит из корзины
                 elif action == "cart_remove":
-                    cart.pop(key, None)
-
-                session["cart"] = cart
-                session.modified = True
+                    error = _change_cart(item_id)
+            if error:
+                flash(error, "error")
 
             return redirect(url_for("booking") + "#cart")
 
@@ -693,13 +1211,74 @@ def booking():
             except ValueError:
                 flash("Количество гостей должно быть от 1 до 20.", "error")
                 return redirect(url_for("booking"))
+            if guests_int > SEATING.max_party:
+                flash("Для такой большой компании позвоните нам — подберём зал целиком.", "error")
+                return redirect(url_for("booking"))
+
+            try:
+                date = parse_day(date)
+            except ValueError:
+                flash("Укажите дату в формате ГГГГ-ММ-ДД.", "error")
+                return redirect(url_for("booking"))
+            try:
+                time = parse_time(time)
+                SEATING.slot_of(time)
+            except ValueError as e:
+                flash(str(e), "error")
+                return redirect(url_for("booking"))
+            # сравниваем дату и время целиком: слот, который уже начался сегодня, тоже в прошлом
+            now = datetime.now().strftime("%Y-%m-%d %H:%M")
+            if f"{date} {time}" <= now:
+                flash("Эта дата уже прошла." if date < now[:10] else "Это время уже прошло.", "error")
+                return redirect(url_for("booking"))
 
-            cart_items, cart_total, cart_count, cart_total_cents = build_cart_view()
+            try:
+                ensure_slot_usage_seeded()
+            except Exception:
+                flash("Не удалось проверить свободные столы. Попробуйте через минуту.", "error")
+                return redirect(url_for("booking"))
+
+            cart_items, cart_total, cart_count, cart_total_cents = get_cart_view()
+
+            # что заказали (если есть корзина)
+            lines = [{
+                "menu_item_id": int(ci.get("id") or 0) or None,
+                "title": ci.get("title") or "",
+                "qty": int(ci.get("qty") or 0),
+                "unit_price_cents": int(ci.get("unit_price_cents") or 0),
+                "line_total_cents": int(ci.get("line_total_cents") or 0),
+                "image_path": (ci.get("img") or "").lstrip("/"),
+            } for ci in cart_items or []]
+
+            # сохраняем бронь; столы занимаются в той же транзакции (BEGIN IMMEDIATE),
+            # поэтому две одновременные заявки на последний стол не пройдут обе
+            try:
+                if USE_SUPABASE:
+                    with BOOKINGS_DB.transaction() as con:
+                        alloc = AVAILABILITY.reserve(con, date, time, guests_int)
+                else:
+                    with BOOKINGS_DB.transaction() as con:
+                        AVAILABILITY.reserve(con, date, time, guests_int)
+                        cur = con.execute(
+                            """
+                            INSERT INTO bookings (name, email, phone, date, time, guests, comment, notes, cart_total_cents)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            """,
+                            (full_name, email, phone, date, time, guests_int, notes, notes, int(cart_total_cents))
+                        )
+                        _insert_booking_items(con, cur.lastrowid, lines)
+            except NoCapacity:
+                wanted = SEATING.slot_of(time)
+                free = [s["time"] for s in AVAILABILITY.open_slots(BOOKINGS_DB.connection(), date, date, guests_int)]
+                nearby = sorted(sorted(free, key=lambda t: abs(SEATING.slot_of(t) - wanted))[:5])
+                hint = f" Ближайшее свободное время: {', '.join(nearby)}." if nearby else " На этот день мест нет."
+                flash(f"На {time} свободных столов нет.{hint}", "error")
+                return redirect(url_for("booking"))
 
-            # сохраняем бронь
             if USE_SUPABASE:
+                # пишем в локальный журнал и сразу отвечаем; в Supabase бронь уйдёт фоном
                 try:
-                    booking_row = insert_booking({
+                    BOOKING_OUTBOX.enqueue({
                         "full_name": full_name,
                         "email": email or None,
                         "phone": phone,
@@ -707,141 +1286,356 @@ def booking():
                         "booking_time": time,
                         "guests": guests_int,
                         "notes": notes,
-                        "cart_total_cents": int(cart_total_cents or 0),
-                    })
-                    booking_id = int(booking_row.get("id"))
-
-                    # что заказали (если есть корзина)
-                    items_payload = []
-                    for ci in cart_items or []:
-                        items_payload.append({
-                            "booking_id": booking_id,
-                            "menu_item_id": int(ci.get("id") or 0),
-                            "title": ci.get("title") or "",
-                            "qty": int(ci.get("qty") or 0),
-                            "unit_price_cents": int(ci.get("unit_price_cents") or 0),
-                            "line_total_cents": int(ci.get("line_total_cents") or 0),
-                            "image_path": (ci.get("img") or "").lstrip("/"),
-                        })
-                    insert_booking_items(items_payload)
-
+                        "cart_total_cents": int(cart_total_cents),
+                    }, lines)
                 except Exception:
-                    flash("Не удалось сохранить бронь в Supabase. Проверь .env и политики RLS.", "error")
+                    # любая ошибка журнала — столы возвращаем, иначе они останутся занятыми навсегда
+                    app.logger.exception("бронь не записана в журнал отправки")
+                    with BOOKINGS_DB.transaction() as con:
+                        AVAILABILITY.release(con, alloc)
+                    flash("Не удалось сохранить бронь. Попробуйте ещё раз.", "error")
                     return redirect(url_for("booking"))
-            else:
-                cart_json = json.dumps(cart_items, ensure_ascii=False)
-                with sqlite3.connect(DB_PATH) as con:
-                    con.execute(
-                        """
-                        INSERT INTO bookings (name, email, phone, date, time, guests, comment, notes, cart_items, cart_total)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """,
-                        (full_name, email, phone, date, time, guests_int, notes, notes, cart_json, cart_total)
-                    )
-                    con.commit()
 
             # по желанию: очищаем корзину после отправки
-            session["cart"] = {}
-            session.modified = True
+            _clear_cart()
 
             flash("Заявка отправлена! Мы свяжемся с вами для подтверждения ✅", "success")
             return redirect(url_for("booking"))
 
     # GET (или если просто надо отрисовать)
-    return render_template("booking.html", active="booking")
+    return render_template("booking.html", active="booking", seating=SEATING)
+
+
+@app.route("/booking/slots")
+def booking_slots():
+    """Свободные слоты посадки: ?date=YYYY-MM-DD&guests=2&days=1 (days до 14)."""
+    try:
+        day_from = parse_day(request.args.get("date") or datetime.now().strftime("%Y-%m-%d"))
+        guests = int(request.args.get("guests") or 2)
+        days = int(request.args.get("days") or 1)
+    except ValueError:
+        abort(400)
+    if not (1 <= guests <= 20 and 1 <= days <= 14):
+        abort(400)
+
+    try:
+        ensure_slot_usage_seeded()
+    except Exception:
+        abort(503)
+    day_to = (datetime.fromisoformat(day_from) + timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    slots = AVAILABILITY.open_slots(BOOKINGS_DB.connection(), day_from, day_to, guests)
+    resp = jsonify({"date_from": day_from, "date_to": day_to, "guests": guests, "slots": slots})
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
 
 
 # ============================
 #         ADMIN
 # ============================
 
-def _db_connect() -> sqlite3.Connection:
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
-    return con
+def _map_booking_row(row: sqlite3.Row) -> Booking:
+    d = dict(row)
+    return Booking(
+        id=d["id"],
+        full_name=(d.get("name") or "").strip(),
+        email=(d.get("email") or "").strip(),
+        phone=(d.get("phone") or "").strip(),
+        date=(d.get("date") or "").strip(),
+        time=(d.get("time") or "").strip(),
+        guests=d.get("guests"),
+        notes=(d.get("notes") or d.get("comment") or "").strip(),
+        created_at=d.get("created_at"),
+        total_cents=int(d.get("cart_total_cents") or 0),
+        items_count=int(d.get("items_count") or 0),
+        items_summary=d.get("items_summary") or "",
+    )
+
 
+def _map_booking_supabase(d: dict) -> Booking:
+    lines = d.get("booking_items") or []
+    return Booking(
+        id=d["id"],
+        full_name=(d.get("full_name") or "").strip(),
+        email=(d.get("email") or "").strip(),
+        phone=(d.get("phone") or "").strip(),
+        date=str(d.get("booking_date") or "").strip(),
+        time=str(d.get("booking_time") or "").strip(),
+        guests=d.get("guests"),
+        notes=(d.get("notes") or "").strip(),
+        created_at=d.get("created_at"),
+        total_cents=int(d.get("cart_total_cents") or 0),
+        items_count=sum(int(it.get("qty") or 0) for it in lines),
+        items_summary=", ".join(f"{it.get('title') or ''} ×{int(it.get('qty') or 0)}" for it in lines),
+    )
 
-def _map_booking_row(row: sqlite3.Row) -> dict:
-    d = dict(row)
-    total_str = (d.get("cart_total") or "").strip()
-    total_cents = _to_cents_from_price_str(total_str)
 
-    return {
-        "id": d.get("id"),
-        "full_name": (d.get("name") or "").strip(),
-        "email": (d.get("email") or "").strip(),
-        "phone": (d.get("phone") or "").strip(),
-        "date": (d.get("date") or "").strip(),
-        "time": (d.get("time") or "").strip(),
-        "guests": d.get("guests"),
-        "notes": (d.get("notes") or d.get("comment") or "").strip(),
-        "created_at": d.get("created_at"),
-        "cart_items": d.get("cart_items"),
-        "cart_total": total_str,
-        "total_cents": total_cents,
-    }
+def _map_booking_line(d) -> BookingLine:
+    return BookingLine(
+        title=(d["title"] or "").strip(),
+        image_path=(d["image_path"] or "img/placeholder.jpg").lstrip("/"),
+        qty=int(d["qty"] or 0),
+        unit_price_cents=int(d["unit_price_cents"] or 0),
+        line_total_cents=int(d["line_total_cents"] or 0),
+    )
 
 
-def _map_booking_supabase(d: dict) -> dict:
-    total_cents = int(d.get("cart_total_cents") or 0)
-    return {
-        "id": d.get("id"),
-        "full_name": (d.get("full_name") or "").strip(),
-        "email": (d.get("email") or "").strip(),
-        "phone": (d.get("phone") or "").strip(),
-        "date": str(d.get("booking_date") or "").strip(),
-        "time": str(d.get("booking_time") or "").strip(),
-        "guests": d.get("guests"),
-        "notes": (d.get("notes") or "").strip(),
-        "created_at": d.get("created_at"),
-        "cart_total": money(total_cents),
-        "total_cents": total_cents,
-    }
+ADMIN_BOOKINGS_PAGE_SIZE = 50
+
+
+def _like_prefix(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _booking_filters() -> dict:
+    """Фильтры списка броней из query: даты (YYYY-MM-DD), начало телефона / имени."""
+    def arg(name: str) -> str:
+        return (request.args.get(name) or "").strip()
+
+    filters = {"date_from": arg("date_from"), "date_to": arg("date_to"), "phone": arg("phone"), "name": arg("name")}
+    for key in ("date_from", "date_to"):
+        try:
+            datetime.strptime(filters[key], "%Y-%m-%d")
+        except ValueError:
+            filters[key] = ""
+    return filters
+
+
+def _ascii_lower(text: str) -> str:
+    # COLLATE NOCASE складывает регистр только у ASCII — кириллицу не трогаем, как и LIKE
+    return "".join(c.lower() if c.isascii() else c for c in text)
+
+
+def _sqlite_booking_query(filters: dict, cursor_id: int | None, desc: bool) -> tuple[list[str], list, str]:
+    """Условия и ORDER BY страницы броней; cursor_id — последняя бронь предыдущей страницы.
+
+    С фильтром список листается по его индексу: (date, id), (phone NOCASE, id) или
+    (name NOCASE, id) — страница читается из индекса подряд, без сортировки всей выборки.
+    Курсор (ключ, id) подставляется константами вместо границы фильтра со своей стороны:
+    иначе SQLite ищет от границы и отбрасывает уже показанные строки по одной.
+    """
+    key = collate = ""
+    lower = upper = None  # (оператор, значение) — границы ключа
+    if filters["date_from"] or filters["date_to"]:
+        key = "date"
+        lower = (">=", filters["date_from"]) if filters["date_from"] else None
+        upper = ("<=", filters["date_to"]) if filters["date_to"] else None
+    else:
+        for column in ("phone", "name"):
+            if filters[column]:
+                # префикс — диапазон [prefix, prefix с последним символом + 1) в NOCASE
+                prefix = _ascii_lower(filters[column])
+                key, collate = column, " COLLATE NOCASE"
+                lower, upper = (">=", prefix), ("<", prefix[:-1] + chr(ord(prefix[-1]) + 1))
+                break
+
+    where, params = [], []
+    for column in ("phone", "name"):
+        if filters[column] and column != key:
+            where.append(f"{column} LIKE ? ESCAPE '\\'")
+            params.append(_like_prefix(filters[column]))
+
+    if cursor_id and not key:
+        where.append("id < ?" if desc else "id > ?")
+        params.append(cursor_id)
+    elif cursor_id:
+        row = BOOKINGS_DB.connection().execute(f"SELECT {key} FROM bookings WHERE id = ?", (cursor_id,)).fetchone()
+        if row is None:
+            where.append("0")  # курсорной брони нет — дальше листать не от чего
+        else:
+            where.append(f"({key}, id) {'<' if desc else '>'} (?{collate}, ?)")
+            params += [row[0], cursor_id]
+        if desc:
+            upper = None
+        else:
+            lower = None
+    for bound in (lower, upper):
+        if bound:
+            where.append(f"{key} {bound[0]} ?{collate}")
+            params.append(bound[1])
+
+    direction = " DESC" if desc else ""
+    order = f"{key}{collate}{direction}, id{direction}" if key else f"id{direction}"
+    return where, params, order
+
+
+def _sqlite_bookings_page(filters: dict, before_id: int | None, limit: int) -> list[dict]:
+    where, params, order = _sqlite_booking_query(filters, before_id, desc=True)
+
+    # состав заказа — подзапросами по индексу booking_items(booking_id), тем же запросом
+    sql = (
+        "SELECT id, name, email, phone, date, time, guests, comment, notes, cart_total_cents, created_at, "
+        "(SELECT COALESCE(SUM(qty), 0) FROM booking_items i WHERE i.booking_id = bookings.id) AS items_count, "
+        "(SELECT GROUP_CONCAT(title || ' ×' || qty, ', ') FROM booking_items i WHERE i.booking_id = bookings.id) "
+        "AS items_summary "
+        "FROM bookings"
+    )
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {order} LIMIT ?"
+    params.append(limit)
+
+    con = BOOKINGS_DB.connection()
+    return [_map_booking_row(r) for r in con.execute(sql, params).fetchall()]
+
+
+def _sqlite_export_page(filters: dict, after_id: int | None, limit: int) -> list[tuple[Booking, list[BookingLine]]]:
+    where, params, order = _sqlite_booking_query(filters, after_id, desc=False)
+    sql = "SELECT id, name, email, phone, date, time, guests, comment, notes, cart_total_cents, created_at FROM bookings"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {order} LIMIT ?"
+    params.append(limit)
+
+    con = BOOKINGS_DB.connection()
+    bookings = [_map_booking_row(r) for r in con.execute(sql, params).fetchall()]
+    if not bookings:
+        return []
+    lines: dict[int, list[BookingLine]] = {b.id: [] for b in bookings}
+    # позиции всей страницы — одним запросом по индексу booking_items(booking_id)
+    rows = con.execute(
+        "SELECT booking_id, title, qty, unit_price_cents, line_total_cents, image_path FROM booking_items "
+        f"WHERE booking_id IN ({', '.join('?' * len(lines))}) ORDER BY booking_id, id",
+        list(lines),
+    )
+    for r in rows:
+        lines[r["booking_id"]].append(_map_booking_line(r))
+    return [(b, lines[b.id]) for b in bookings]
+
+
+def _supabase_export_page(filters: dict, after_id: int | None, limit: int) -> list[tuple[Booking, list[BookingLine]]]:
+    rows = list_bookings_export_page(
+        limit,
+        after_id=after_id,
+        date_from=filters["date_from"] or None,
+        date_to=filters["date_to"] or None,
+        phone_prefix=filters["phone"] or None,
+        name_prefix=filters["name"] or None,
+    )
+    return [
+        (_map_booking_supabase(r), [_map_booking_line(it) for it in r.get("booking_items") or []])
+        for r in rows
+    ]
+
+
+@app.route("/admin/bookings/export.<fmt>")
+def admin_bookings_export(fmt: str):
+    """Брони с позициями заказа в CSV/XLSX потоком: те же фильтры, что в списке, страницы по id.
+
+    Файл не собирается в памяти — первые байты уходят сразу после первой страницы.
+    """
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    filters = _booking_filters()
+    fetch_page = _supabase_export_page if USE_SUPABASE else _sqlite_export_page
+    pages = iter_pages(lambda after_id, limit: fetch_page(filters, after_id, limit))
+    try:
+        # первую страницу читаем до ответа: если Supabase недоступен, покажем ошибку, а не обрезанный файл
+        first = next(pages, None)
+    except Exception:
+        if not USE_SUPABASE:
+            raise
+        flash("Supabase недоступен: выгрузка не удалась", "error")
+        return redirect(url_for("admin_bookings", **{k: v for k, v in filters.items() if v}))
+
+    chunks, content_type = EXPORT_FORMATS[fmt]
+    rows = iter_rows(chain([first] if first else [], pages))
+    period = "_".join(filter(None, (filters["date_from"], filters["date_to"])))
+    filename = f"bookings_{period}.{fmt}" if period else f"bookings.{fmt}"
+
+    response = Response(stream_with_context(chunks(rows)), content_type=content_type)
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response.headers["Cache-Control"] = "no-store"
+    response.headers["X-Accel-Buffering"] = "no"  # nginx отдаёт куски сразу, не копя ответ
+    return response
+
+
+@app.route("/admin/metrics")
+def admin_metrics():
+    """Метрики этого воркера в формате Prometheus: маршруты, фазы, кеши, Supabase, журнал броней."""
+    gauges = [
+        ("page_cache_entries", "Страниц в кеше HTML.", len(PAGE_CACHE), {}),
+        ("cart_cache_entries", "Корзин в кеше воркера.", len(CART_STORE), {}),
+        ("cart_cache_hits", "Чтения корзины из кеша воркера.", CART_STORE.hits, {}),
+        ("cart_cache_misses", "Чтения корзины из хранилища.", CART_STORE.misses, {}),
+    ]
+    if USE_SUPABASE:
+        sb = supabase_stats()
+        gauges += [
+            ("supabase_breaker_open", "1 — предохранитель Supabase разомкнут.", int(sb["state"] != "closed"),
+             {"state": sb["state"]}),
+            ("supabase_calls", "Вызовы Supabase с запуска воркера.", sb["calls"], {}),
+            ("supabase_failures", "Ошибки Supabase (сеть, таймауты, 5xx).", sb["failures"], {}),
+            ("supabase_rejected", "Вызовы, отклонённые разомкнутым предохранителем.", sb["rejected"], {}),
+            ("supabase_error_rate", "Доля ошибок среди последних вызовов.", round(sb["error_rate"], 4), {}),
+        ]
+    if BOOKING_OUTBOX is not None:
+        backlog = BOOKING_OUTBOX.backlog()
+        gauges += [
+            ("booking_outbox_backlog", "Брони, ещё не отправленные в Supabase.", backlog.pending, {}),
+            ("booking_outbox_failed", "Брони, исчерпавшие попытки отправки.", backlog.failed, {}),
+            ("booking_outbox_oldest_seconds", "Возраст самой старой неотправленной брони.",
+             round(BOOKING_OUTBOX.oldest_pending_age() or 0, 1), {}),
+        ]
+    return Response(METRICS.render(gauges), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.route("/admin/bookings")
 def admin_bookings():
+    """Список броней: keyset-пагинация по id (?before=<id>) + фильтры, стоимость страницы не растёт с базой."""
+    filters = _booking_filters()
+    try:
+        before_id = int(request.args.get("before") or 0) or None
+    except ValueError:
+        before_id = None
+    # берём на одну запись больше — так узнаём, есть ли следующая страница
+    limit = ADMIN_BOOKINGS_PAGE_SIZE + 1
+
+    outbox_backlog = None
     if USE_SUPABASE:
+        outbox_backlog = BOOKING_OUTBOX.backlog()
         try:
-            bookings_raw = list_bookings()
+            bookings_raw = list_bookings_page(
+                limit,
+                before_id=before_id,
+                date_from=filters["date_from"] or None,
+                date_to=filters["date_to"] or None,
+                phone_prefix=filters["phone"] or None,
+                name_prefix=filters["name"] or None,
+            )
             bookings = [_map_booking_supabase(b) for b in (bookings_raw or [])]
         except Exception:
             bookings = []
             flash("Supabase недоступен: проверь .env и политики RLS", "error")
-        return render_template("admin_bookings.html", active="admin", bookings=bookings)
+    else:
+        bookings = _sqlite_bookings_page(filters, before_id, limit)
 
-    # fallback SQLite
-    init_db()
-    with _db_connect() as con:
-        cur = con.execute(
-            "SELECT id, name, email, phone, date, time, guests, comment, notes, cart_items, cart_total, created_at "
-            "FROM bookings ORDER BY id DESC"
-        )
-        bookings = [_map_booking_row(r) for r in cur.fetchall()]
-    return render_template("admin_bookings.html", active="admin", bookings=bookings)
+    next_before = None
+    if len(bookings) > ADMIN_BOOKINGS_PAGE_SIZE:
+        bookings = bookings[:ADMIN_BOOKINGS_PAGE_SIZE]
+        next_before = bookings[-1].id
+
+    return render_template(
+        "admin_bookings.html",
+        active="admin",
+        bookings=bookings,
+        filters=filters,
+        filter_args={k: v for k, v in filters.items() if v},
+        before_id=before_id,
+        next_before=next_before,
+        outbox_backlog=outbox_backlog,
+    )
 
 
 @app.route("/admin/bookings/<int:reservation_id>")
 def admin_booking_detail(reservation_id: int):
     if USE_SUPABASE:
-        reservation_raw = get_booking(reservation_id)
+        # бронь и её позиции — одним запросом (embedded select)
+        reservation_raw = get_booking_with_items(reservation_id)
         if not reservation_raw:
             abort(404)
         reservation = _map_booking_supabase(reservation_raw)
-        try:
-            items_raw = list_booking_items(reservation_id)
-        except Exception:
-            items_raw = []
-
-        items = []
-        for it in items_raw or []:
-            items.append({
-                "title": (it.get("title") or "").strip(),
-                "image_path": (it.get("image_path") or "img/placeholder.jpg").lstrip("/"),
-                "qty": int(it.get("qty") or 0),
-                "unit_price_cents": int(it.get("unit_price_cents") or 0),
-                "line_total_cents": int(it.get("line_total_cents") or 0),
-            })
+
+        items = [_map_booking_line(it) for it in reservation_raw.get("booking_items") or []]
 
         return render_template(
             "admin_booking_detail.html",
@@ -851,52 +1645,21 @@ def admin_booking_detail(reservation_id: int):
         )
 
     # fallback SQLite
-    init_db()
-    with _db_connect() as con:
-        cur = con.execute(
-            "SELECT id, name, email, phone, date, time, guests, comment, notes, cart_items, cart_total, created_at "
-            "FROM bookings WHERE id = ?",
-            (reservation_id,)
-        )
-        row = cur.fetchone()
-        if not row:
-            abort(404)
+    row = BOOKINGS_DB.connection().execute(
+        "SELECT id, name, email, phone, date, time, guests, comment, notes, cart_total_cents, created_at "
+        "FROM bookings WHERE id = ?",
+        (reservation_id,)
+    ).fetchone()
+    if not row:
+        abort(404)
 
     reservation = _map_booking_row(row)
 
-    # разбираем заказ (cart_items хранится как JSON)
-    raw_items = []
-    try:
-        if reservation.get("cart_items"):
-            raw_items = json.loads(reservation["cart_items"])
-    except Exception:
-        raw_items = []
-
-    items = []
-    for it in raw_items or []:
-        title = (it.get("title") or "").strip()
-        img = (it.get("img") or it.get("image_path") or "img/placeholder.jpg").lstrip("/")
-        qty = int(it.get("qty") or 0)
-        if qty <= 0:
-            continue
-
-        # unit price
-        if "unit_price_cents" in it:
-            unit_cents = int(it.get("unit_price_cents") or 0)
-        elif "unit" in it:
-            unit_cents = int(round(float(it.get("unit") or 0) * 100))
-        else:
-            unit_cents = _to_cents_from_price_str(it.get("price_str") or it.get("price") or "")
-
-        line_cents = unit_cents * qty
-
-        items.append({
-            "title": title,
-            "image_path": img,
-            "qty": qty,
-            "unit_price_cents": unit_cents,
-            "line_total_cents": line_cents,
-        })
+    items = [_map_booking_line(r) for r in BOOKINGS_DB.connection().execute(
+        "SELECT title, NULLIF(image_path, '') AS image_path, qty, unit_price_cents, line_total_cents "
+        "FROM booking_items WHERE booking_id = ? ORDER BY id",
+        (reservation_id,)
+    )]
 
     return render_template(
         "admin_booking_detail.html",
@@ -918,8 +1681,6 @@ def admin_menu_new():
     if tab not in {"item", "category"}:
         tab = "item"
 
-    categories, items = (get_menu_data() if USE_SUPABASE else load_menu_data())
-
     if request.method == "POST":
         form_type = (request.form.get("form_type") or "").strip()
 
@@ -934,24 +1695,24 @@ def admin_menu_new():
             if slug == "category":
                 slug = _slugify(label)
 
-            existing = {c.get("slug") for c in (categories or [])}
-            base = slug
-            i = 2
-            while slug in existing:
-                slug = f"{base}-{i}"
-                i += 1
+            def unique_slug(existing) -> str:
+                candidate, i = slug, 2
+                while candidate in existing:
+                    candidate = f"{slug}-{i}"
+                    i += 1
+                return candidate
 
             if USE_SUPABASE:
                 try:
-                    upsert_category(slug, label)
+                    upsert_category(unique_slug(get_menu_catalog().slugs), label)
                 except Exception:
                     flash("Не удалось добавить категорию в Supabase", "error")
                     return redirect(url_for("admin_menu_new", tab="category"))
-                # обновим кеш
-                get_menu_data(force=True)
             else:
-                categories.append({"slug": slug, "label": label})
-                save_menu_data(categories, items)
+                with MENU_STORE.edit() as data:
+                    # проверяем по свежему файлу под блокировкой — другой воркер мог добавить такую же
+                    existing = {c.get("slug") for c in data.categories}
+                    data.categories.append({"slug": unique_slug(existing), "label": label})
 
             flash("Категория добавлена ✅", "success")
             return redirect(url_for("admin_menu_new", tab="category"))
@@ -967,18 +1728,27 @@ def admin_menu_new():
                 flash("Заполните обязательные поля (*)", "error")
                 return redirect(url_for("admin_menu_new", tab="item"))
 
-            price_cents = int(round(parse_price_to_float(price) * 100))
+            price_cents = parse_cents(price)
 
             # картинка: либо путь, либо загрузка
             image_path = (request.form.get("image_path") or "").strip().lstrip("/")
             file = request.files.get("image_file")
             if file and file.filename:
-                filename = secure_filename(file.filename)
-                stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"{stamp}_{filename}"
-                dest = UPLOAD_DIR / filename
-                file.save(dest)
-                image_path = f"uploads/{filename}"
+                try:
+                    blob = UPLOAD_STORE.save(file.stream)
+                    image_variants = generate_variants(STATIC_DIR, blob.rel_path, reuse_existing=not blob.created)
+                except UploadRejected as e:
+                    flash(f"Картинка не загружена: {e}", "error")
+                    return redirect(url_for("admin_menu_new", tab="item"))
+                except ImageProcessingError:
+                    flash("Файл не похож на изображение (нужен JPEG, PNG или WebP)", "error")
+                    return redirect(url_for("admin_menu_new", tab="item"))
+                image_path = blob.rel_path
+            else:
+                if image_path and resolve_static(STATIC_DIR, image_path) is None:
+                    flash("Путь к картинке должен вести внутрь static/", "error")
+                    return redirect(url_for("admin_menu_new", tab="item"))
+                image_variants = variants_for(STATIC_DIR, image_path)
 
             if not image_path:
                 image_path = "img/placeholder.jpg"
@@ -997,6 +1767,7 @@ def admin_menu_new():
                     "allergens": allergens,
                     "price_cents": price_cents,
                     "image_path": image_path,
+                    "image_variants": image_variants or None,
                     "wine_title": wine_title or None,
                     "wine_text": wine_text or None,
                 }
@@ -1005,18 +1776,16 @@ def admin_menu_new():
                 except Exception:
                     flash("Не удалось добавить блюдо в Supabase", "error")
                     return redirect(url_for("admin_menu_new", tab="item"))
-                get_menu_data(force=True)
             else:
-                new_id = (max([x.get("id", 0) for x in items]) + 1) if items else 1
                 new_item = {
-                    "id": new_id,
                     "cat": category_slug,
                     "title": title,
-                    "price": money(price_cents),
                     "price_cents": price_cents,
                     "desc": description,
                     "img": image_path,
                 }
+                if image_variants:
+                    new_item["img_variants"] = image_variants
                 if ingredients:
                     new_item["ingredients"] = [s.strip() for s in ingredients.split(",") if s.strip()]
                 if allergens:
@@ -1026,25 +1795,212 @@ def admin_menu_new():
                 if wine_text:
                     new_item["wine_text"] = wine_text
 
-                items.append(new_item)
-                save_menu_data(categories, items)
+                with MENU_STORE.edit() as data:
+                    data.items.append({"id": data.allocate_id(), **new_item})
 
             flash("Блюдо добавлено ✅", "success")
             return redirect(url_for("admin_menu_new", tab="item"))
 
     # для рендера всегда берём актуальные категории
-    categories, _ = (get_menu_data() if USE_SUPABASE else load_menu_data())
     return render_template(
         "admin_menu_new.html",
         active="admin",
         tab=tab,
-        categories=categories,
+        categories=get_menu_catalog().categories,
     )
 
 
+@app.cli.command("build-assets")
+def build_assets_command():
+    """Собирает static/dist: CSS и картинки с хешем в имени + предсжатые .gz/.br."""
+    manifest = build_assets(STATIC_DIR)
+    click.echo(f"ассетов в манифесте: {len(manifest)}")
+
+
+@app.cli.command("warm-up")
+def warm_up_command():
+    """Прогрев как при старте воркера: заполняет instance/jinja_cache (удобно на шаге деплоя)."""
+    for step, seconds in warm_up().items():
+        click.echo(f"{step}: {seconds * 1000:.0f} мс")
+
+
+@app.cli.command("backfill-images")
+def backfill_images_command():
+    """Нарезает WebP/JPEG-варианты для static/uploads и записывает их в позиции меню."""
+    by_path: dict[str, dict | None] = {}
+    for path in sorted(UPLOAD_DIR.rglob("*")):
+        if path.is_file() and not {"variants", ".tmp"} & set(path.relative_to(UPLOAD_DIR).parts):
+            rel = path.relative_to(STATIC_DIR).as_posix()
+            by_path[rel] = variants_for(STATIC_DIR, rel)
+    click.echo(f"uploads: {sum(1 for v in by_path.values() if v)} из {len(by_path)} обработано")
+
+    def lookup(rel: str):
+        rel = (rel or "").lstrip("/")
+        if rel not in by_path:
+            by_path[rel] = variants_for(STATIC_DIR, rel)
+        return by_path[rel]
+
+    updated = 0
+    if USE_SUPABASE:
+        for r in list_menu_items():
+            variants = lookup(r.get("image_path") or "")
+            if variants and variants != r.get("image_variants"):
+                update_menu_item(int(r["id"]), {"image_variants": variants})
+                updated += 1
+    else:
+        with MENU_STORE.edit() as data:
+            for it in data.items:
+                variants = lookup(it.get("img") or "")
+                if variants and variants != it.get("img_variants"):
+                    it["img_variants"] = variants
+                    updated += 1
+    click.echo(f"позиций меню обновлено: {updated}")
+
+
+@app.cli.command("import-uploads")
+def import_uploads_command():
+    """Переносит старые загрузки (<timestamp>_<name>) в хранилище по хешу; дубликаты схлопываются.
+
+    Сами старые файлы остаются на месте: на них ссылаются booking_items.image_path уже
+    оформленных броней (в Supabase anon-ключ эти строки менять не может).
+    """
+    moved: dict[str, tuple[str, dict | None]] = {}
+    for path in sorted(UPLOAD_DIR.iterdir()):
+        if not path.is_file():
+            continue
+        try:
+            with path.open("rb") as f:
+                blob = UPLOAD_STORE.save(f)
+            variants = generate_variants(STATIC_DIR, blob.rel_path, reuse_existing=True)
+        except (UploadRejected, ImageProcessingError) as e:
+            click.echo(f"пропущен {path.name}: {e}")
+            continue
+        moved[f"uploads/{path.name}"] = (blob.rel_path, variants)
+    click.echo(f"в хранилище: {len(moved)} файлов, уникальных {len({v[0] for v in moved.values()})}")
+
+    relinked = 0
+    if USE_SUPABASE:
+        for r in list_menu_items():
+            old = (r.get("image_path") or "").lstrip("/")
+            if old in moved:
+                new_path, variants = moved[old]
+                update_menu_item(int(r["id"]), {"image_path": new_path, "image_variants": variants})
+                relinked += 1
+    else:
+        with MENU_STORE.edit() as data:
+            for it in data.items:
+                old = (it.get("img") or "").lstrip("/")
+                if old in moved:
+                    it["img"], it["img_variants"] = moved[old]
+                    relinked += 1
+    click.echo(f"позиций меню перепривязано: {relinked}")
+    click.echo("старые файлы оставлены: на них ссылаются позиции оформленных броней")
+
+
+def _referenced_images() -> set[str]:
+    """Картинки, которые ещё показываются: у блюд меню и у позиций оформленных броней."""
+    if USE_SUPABASE:
+        paths = {r.get("image_path") or "" for r in list_menu_items()}
+        paths.update(list_booking_image_paths())
+    else:
+        _, items = MENU_STORE.load()
+        paths = {it.get("img") or "" for it in items}
+    # локальные брони есть и в режиме Supabase — оставшиеся с работы на SQLite
+    rows = BOOKINGS_DB.connection().execute("SELECT DISTINCT image_path FROM booking_items WHERE image_path IS NOT NULL")
+    paths.update(r[0] for r in rows)
+    return {p.lstrip("/") for p in paths if p}
+
+
+@app.cli.command("gc-uploads")
+@click.option("--grace-hours", default=24.0, show_default=True, help="Не трогать блобы, загруженные недавно.")
+def gc_uploads_command(grace_hours: float):
+    """Удаляет загруженные картинки, на которые не ссылается ни одно блюдо и ни одна бронь."""
+    removed = UPLOAD_STORE.gc(_referenced_images(), grace_seconds=grace_hours * 3600)
+    for rel in removed:
+        click.echo(f"удалён {rel}")
+    click.echo(f"удалено: {len(removed)}")
+
+
+@app.cli.command("flush-bookings")
+def flush_bookings_command():
+    """Отправляет в Supabase брони из локального журнала, не дожидаясь фонового потока."""
+    if BOOKING_OUTBOX is None:
+        click.echo("Supabase не настроен — журнал не используется")
+        return
+    sent = BOOKING_OUTBOX.flush()
+    backlog = BOOKING_OUTBOX.backlog()
+    click.echo(f"отправлено: {sent}, в очереди: {backlog.pending}, не отправлено (попытки исчерпаны): {backlog.failed}")
+
+
+@app.cli.command("retry-failed-bookings")
+def retry_failed_bookings_command():
+    """Возвращает в очередь брони, исчерпавшие попытки отправки (после исправления причины)."""
+    if BOOKING_OUTBOX is None:
+        click.echo("Supabase не настроен — журнал не используется")
+        return
+    click.echo(f"возвращено в очередь: {BOOKING_OUTBOX.requeue_failed()}")
+
+
+@app.cli.command("rebuild-slots")
+def rebuild_slots_command():
+    """Пересчитывает занятость столов с сегодняшнего дня по броням (после правки seating.json)."""
+    today = datetime.now().strftime("%Y-%m-%d")
+    if USE_SUPABASE:
+        rows = _supabase_slot_rows(today)
+    else:
+        rows = BOOKINGS_DB.connection().execute(
+            "SELECT date, time, guests FROM bookings WHERE date >= ?", (today,)
+        ).fetchall()
+    with BOOKINGS_DB.transaction() as con:
+        count = AVAILABILITY.rebuild(con, rows, today)
+        if USE_SUPABASE:
+            _mark_slot_source(con)
+    click.echo(f"учтено броней: {count}")
+
+
+@app.cli.command("supabase-status")
+def supabase_status_command():
+    """Состояние предохранителя Supabase и счётчики вызовов в этом процессе (после пробного запроса)."""
+    if not USE_SUPABASE:
+        click.echo("Supabase не настроен")
+        return
+    try:
+        list_categories()
+    except Exception as e:
+        click.echo(f"пробный запрос не удался: {type(e).__name__}: {e}")
+    for key, value in supabase_stats().items():
+        click.echo(f"{key}: {value}")
+
+
+@app.before_request
+def _start_booking_outbox():
+    # поток поднимается в каждом воркере (после fork), в том числе чтобы дослать хвост после рестарта
+    if BOOKING_OUTBOX is not None:
+        BOOKING_OUTBOX.ensure_running()
+
+
+@app.after_request
+def _immutable_upload_cache(response):
+    """Файлы с хешем содержимого в имени никогда не меняются — кешируем навсегда."""
+    if response.status_code in (200, 304) and request.endpoint == "static" and HASHED_URL_RE.search(request.path):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    return response
+
+
+@app.errorhandler(413)
+def _upload_too_large(e):
+    # флеш про картинку уместен только в форме загрузки; остальным маршрутам — обычный 413
+    if request.endpoint != "admin_menu_new":
+        return e
+    flash(f"Файл больше {MAX_UPLOAD_BYTES // (1024 * 1024)} МБ", "error")
+    return redirect(url_for("admin_menu_new", tab="item"))
+
+
 if __name__ == "__main__":
     if USE_SUPABASE:
         ensure_supabase_seed()
-    else:
-        init_db()
+    warm_up()
     app.run(debug=True)
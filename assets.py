@@ -0,0 +1,110 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+try:
+    import brotli
+except ImportError:  # без brotli отдаём только .gz
+    brotli = None
+
+DIST_DIRNAME = "dist"
+MANIFEST_NAME = "manifest.json"
+
+# что собираем: стили и картинки оформления (загрузки блюд уже названы по хешу)
+DEFAULT_PATTERNS = ("css/*.css", "img/**/*")
+# сжимать имеет смысл только текст; jpg/webp уже сжаты
+COMPRESSIBLE_SUFFIXES = {".css", ".js", ".svg", ".json", ".txt", ".html"}
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def build_assets(static_root: Path, patterns: Iterable[str] = DEFAULT_PATTERNS) -> Dict[str, str]:
+    """Копирует ассеты в static/dist под именами с хешем содержимого, рядом кладёт .gz/.br.
+
+    Возвращает и сохраняет манифест {"css/style.css": "css/style.1a2b3c4d5e6f.css", ...}.
+    """
+    static_root = Path(static_root)
+    dist = static_root / DIST_DIRNAME
+    manifest: Dict[str, str] = {}
+
+    for pattern in patterns:
+        for src in sorted(static_root.glob(pattern)):
+            if not src.is_file() or dist in src.parents:
+                continue
+            logical = src.relative_to(static_root).as_posix()
+            data = src.read_bytes()
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            hashed = Path(logical).with_name(f"{src.stem}.{digest}{src.suffix}").as_posix()
+            manifest[logical] = hashed
+
+            target = dist / hashed
+            if target.exists():
+                continue
+            _atomic_write(target, data)
+            if src.suffix.lower() in COMPRESSIBLE_SUFFIXES:
+                _atomic_write(target.with_name(target.name + ".gz"), gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    _atomic_write(target.with_name(target.name + ".br"), brotli.compress(data, quality=11))
+
+    _atomic_write(dist / MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True).encode("utf-8"))
+    return manifest
+
+
+class AssetManifest:
+    """Манифест static/dist: логическое имя -> имя с хешем. Перечитывается, если файл поменялся."""
+
+    def __init__(self, static_root: Path) -> None:
+        self.dist = Path(static_root) / DIST_DIRNAME
+        self.path = self.dist / MANIFEST_NAME
+        self._stamp: Optional[tuple] = None
+        self._entries: Dict[str, str] = {}
+
+    def entries(self) -> Dict[str, str]:
+        try:
+            st = self.path.stat()
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            self._stamp, self._entries = None, {}
+            return self._entries
+        if stamp != self._stamp:
+            try:
+                self._entries = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self._entries = {}
+            self._stamp = stamp
+        return self._entries
+
+    def version(self) -> Optional[tuple]:
+        """mtime/size манифеста — меняется после каждой сборки."""
+        self.entries()
+        return self._stamp
+
+    def resolve(self, logical: str) -> Optional[str]:
+        return self.entries().get(logical.lstrip("/"))
+
+    def pick_encoding(self, hashed: str, accept_encoding: str) -> Optional[str]:
+        """'br' / 'gzip', если есть предсжатый файл и клиент его примет."""
+        accept = {part.split(";", 1)[0].strip().lower() for part in (accept_encoding or "").split(",")}
+        if "br" in accept and (self.dist / (hashed + ".br")).is_file():
+            return "br"
+        if "gzip" in accept and (self.dist / (hashed + ".gz")).is_file():
+            return "gzip"
+        return None
@@ -0,0 +1,250 @@
+import json
+import math
+import sqlite3
+from dataclasses import dataclass
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_SEATING = {
+    # вместимость стола -> сколько таких столов
+    "tables": {"2": 6, "4": 6, "6": 2, "8": 1},
+    "slot_minutes": 30,
+    # сколько стол занят одной бронью
+    "turn_minutes": 120,
+    "open": "12:00",
+    "close": "23:00",
+    # последняя посадка; по умолчанию close - turn_minutes
+    "last_seating": None,
+}
+
+
+class NoCapacity(ValueError):
+    pass
+
+
+def _minutes(hhmm: str) -> int:
+    """'19:30' / '19:30:00' -> 1170."""
+    parts = (hhmm or "").strip().split(":")
+    if len(parts) < 2:
+        raise ValueError(f"Некорректное время: {hhmm!r}")
+    h, m = int(parts[0]), int(parts[1])
+    if not (0 <= h < 24 and 0 <= m < 60):
+        raise ValueError(f"Некорректное время: {hhmm!r}")
+    return h * 60 + m
+
+
+@dataclass(frozen=True)
+class SeatingModel:
+    tables: Tuple[Tuple[int, int], ...]  # ((вместимость, количество), ...) по возрастанию
+    slot_minutes: int
+    turn_minutes: int
+    open_minutes: int
+    last_seating_minutes: int
+
+    @classmethod
+    def from_dict(cls, raw: Dict[str, Any]) -> "SeatingModel":
+        cfg = {**DEFAULT_SEATING, **(raw or {})}
+        tables = tuple(sorted((int(size), int(count)) for size, count in cfg["tables"].items() if int(count) > 0))
+        if not tables:
+            raise ValueError("В конфигурации зала нет ни одного стола")
+        slot = int(cfg["slot_minutes"])
+        turn = int(cfg["turn_minutes"])
+        last = _minutes(cfg["last_seating"]) if cfg.get("last_seating") else _minutes(cfg["close"]) - turn
+        return cls(tables, slot, turn, _minutes(cfg["open"]), last)
+
+    @classmethod
+    def load(cls, path: Path) -> "SeatingModel":
+        """Конфигурация из JSON-файла; нет файла — значения по умолчанию."""
+        try:
+            raw = json.loads(Path(path).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            raw = {}
+        return cls.from_dict(raw)
+
+    @property
+    def slots_per_turn(self) -> int:
+        return math.ceil(self.turn_minutes / self.slot_minutes)
+
+    @property
+    def capacity(self) -> Dict[int, int]:
+        return dict(self.tables)
+
+    @property
+    def max_party(self) -> int:
+        """Сколько гостей поместится, если сдвинуть все столы зала."""
+        return sum(size * count for size, count in self.tables)
+
+    @property
+    def open_label(self) -> str:
+        return f"{self.open_minutes // 60:02d}:{self.open_minutes % 60:02d}"
+
+    @property
+    def last_seating_label(self) -> str:
+        return f"{self.last_seating_minutes // 60:02d}:{self.last_seating_minutes % 60:02d}"
+
+    def slot_of(self, hhmm: str) -> int:
+        """Номер слота посадки (минуты от полуночи // slot_minutes); вне часов работы — ValueError."""
+        minutes = _minutes(hhmm)
+        if minutes < self.open_minutes or minutes > self.last_seating_minutes:
+            raise ValueError(f"Посадка возможна с {self.open_label} до {self.last_seating_label}")
+        return minutes // self.slot_minutes
+
+    def seating_slots(self) -> range:
+        return range(
+            math.ceil(self.open_minutes / self.slot_minutes),
+            self.last_seating_minutes // self.slot_minutes + 1,
+        )
+
+    def label(self, slot: int) -> str:
+        minutes = slot * self.slot_minutes
+        return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+    def pick_tables(self, guests: int, free: Optional[Dict[int, int]] = None) -> Optional[Tuple[Tuple[int, int], ...]]:
+        """Столы под компанию: ((вместимость, сколько столов), ...) или None, если из free не собрать.
+
+        Помещается за один стол — самый маленький подходящий. Больше самого большого стола —
+        сдвигаем столы: сначала самые большие, остаток — за самый маленький подходящий из свободных.
+        free — свободные столы по вместимости; None — без ограничений (перенос старых броней).
+        """
+        largest = self.tables[-1][0]
+        picked: Dict[int, int] = {}
+        left = guests
+        while left > 0:
+            avail = [size for size, count in self.tables if free is None or free.get(size, 0) - picked.get(size, 0) > 0]
+            fits = [size for size in avail if size >= left]
+            if fits:
+                size = fits[0]
+            elif avail and guests > largest:
+                size = avail[-1]
+            else:
+                return None
+            picked[size] = picked.get(size, 0) + 1
+            left -= size
+        return tuple(sorted(picked.items()))
+
+
+@dataclass(frozen=True)
+class Allocation:
+    day: str
+    first_slot: int
+    slots: int
+    tables: Tuple[Tuple[int, int], ...]  # ((вместимость, сколько столов), ...)
+
+
+def migration_slot_usage(con: sqlite3.Connection) -> None:
+    # занятость: сколько столов каждой вместимости занято в слоте дня; строки появляются только у занятых слотов
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS slot_usage (
+            day TEXT NOT NULL,
+            slot INTEGER NOT NULL,
+            table_size INTEGER NOT NULL,
+            used INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, slot, table_size)
+        ) WITHOUT ROWID
+    """)
+
+
+class AvailabilityIndex:
+    """Остаток столов по слотам, поддерживается инкрементально при каждой брони.
+
+    Бронь на слот s занимает стол на slots_per_turn слотов подряд. reserve() в одной
+    транзакции (BEGIN IMMEDIATE) проверяет остаток во всех этих слотах и увеличивает
+    счётчики — две параллельные брони на последний стол не пройдут обе. Остаток слота —
+    ёмкость из модели минус used: O(1) на слот, без просмотра броней.
+    """
+
+    def __init__(self, model: SeatingModel) -> None:
+        self.model = model
+
+    def _usage(self, con: sqlite3.Connection, day_from: str, day_to: str) -> Dict[Tuple[str, int, int], int]:
+        rows = con.execute(
+            "SELECT day, slot, table_size, used FROM slot_usage WHERE day BETWEEN ? AND ?",
+            (day_from, day_to),
+        )
+        return {(r[0], r[1], r[2]): r[3] for r in rows}
+
+    def _free(self, usage: Dict[Tuple[str, int, int], int], day: str, first_slot: int) -> Dict[int, int]:
+        """Сколько столов каждой вместимости свободно на весь оборот, начиная с first_slot."""
+        turn = range(first_slot, first_slot + self.model.slots_per_turn)
+        return {
+            size: max(total - max(usage.get((day, s, size), 0) for s in turn), 0)
+            for size, total in self.model.tables
+        }
+
+    def _apply(self, con: sqlite3.Connection, alloc: Allocation, delta: int) -> None:
+        con.executemany(
+            "INSERT INTO slot_usage (day, slot, table_size, used) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (day, slot, table_size) DO UPDATE SET used = MAX(used + excluded.used, 0)",
+            [(alloc.day, s, size, delta * count)
+             for size, count in alloc.tables
+             for s in range(alloc.first_slot, alloc.first_slot + alloc.slots)],
+        )
+
+    def reserve(self, con: sqlite3.Connection, day: str, hhmm: str, guests: int, force: bool = False) -> Allocation:
+        """Занимает столы под бронь. Вызывать внутри транзакции записи; нет мест — NoCapacity.
+
+        force=True — записать занятость без проверки (перенос старых броней).
+        """
+        first_slot = self.model.slot_of(hhmm) if not force else _minutes(hhmm) // self.model.slot_minutes
+        free = None if force else self._free(self._usage(con, day, day), day, first_slot)
+        tables = self.model.pick_tables(guests, free)
+        if tables is None:
+            raise NoCapacity("На это время свободных столов нет")
+        alloc = Allocation(day, first_slot, self.model.slots_per_turn, tables)
+        self._apply(con, alloc, +1)
+        return alloc
+
+    def release(self, con: sqlite3.Connection, alloc: Allocation) -> None:
+        self._apply(con, alloc, -1)
+
+    def open_slots(
+        self, con: sqlite3.Connection, day_from: str, day_to: str, guests: int
+    ) -> List[Dict[str, Any]]:
+        """Слоты, куда можно посадить guests, по дням: [{"date", "time", "tables_left"}]."""
+        usage = self._usage(con, day_from, day_to)
+        out = []
+        day = date.fromisoformat(day_from)
+        last = date.fromisoformat(day_to)
+        while day <= last:
+            iso = day.isoformat()
+            for slot in self.model.seating_slots():
+                left = self._tables_left(self._free(usage, iso, slot), guests)
+                if left > 0:
+                    out.append({"date": iso, "time": self.model.label(slot), "tables_left": left})
+            day += timedelta(days=1)
+        return out
+
+    def _tables_left(self, free: Dict[int, int], guests: int) -> int:
+        """Сколько таких компаний ещё можно посадить одновременно."""
+        left = 0
+        while True:
+            tables = self.model.pick_tables(guests, free)
+            if tables is None:
+                return left
+            left += 1
+            for size, count in tables:
+                free[size] -= count
+
+    def rebuild(self, con: sqlite3.Connection, bookings: Iterable[Tuple[str, str, int]], day_from: str) -> int:
+        """Пересобирает занятость с day_from по списку (date, time, guests). Для миграции/CLI."""
+        con.execute("DELETE FROM slot_usage WHERE day >= ?", (day_from,))
+        count = 0
+        for day, hhmm, guests in bookings:
+            try:
+                self.reserve(con, day, hhmm, int(guests), force=True)
+            except (TypeError, ValueError):
+                continue  # время/гости в старых записях могли быть мусором
+            count += 1
+        return count
+
+
+def parse_day(text: Optional[str]) -> str:
+    """'YYYY-MM-DD' -> та же строка; иначе ValueError."""
+    return date.fromisoformat((text or "").strip()).isoformat()
+
+
+def parse_time(text: Optional[str]) -> str:
+    """'19:30' / '19:30:00' -> '19:30'; иначе ValueError."""
+    minutes = _minutes(text or "")
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
@@ -0,0 +1,396 @@
+"""Локальная заглушка Supabase (PostgREST /rest/v1) для бенчмарков: данные в памяти, задержка и ошибки по настройке.
+
+    python bench/fake_postgrest.py --port 54321 --items 200 --latency-ms 20 --error-rate 0.01
+
+Понимает то, что шлёт supabase_service: select (в т.ч. вложенный booking_items(...)), фильтры
+eq/neq/lt/lte/gt/gte/in/like/ilike/is, order, limit/offset, insert/upsert (on_conflict), update и
+rpc/create_bookings. Служебные ручки:
+  GET  /_bench/stats   — {"requests": N, "by_route": {"GET menu_items": N, ...}}
+  POST /_bench/reset   — обнулить счётчики
+  POST /_bench/config  — {"latency_ms": 20, "jitter_ms": 5, "error_rate": 0.01}
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+# ключ в формате JWT: supabase-py проверяет форму ключа при создании клиента
+ANON_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.bench"
+
+_RESERVED = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+CATEGORIES = [
+    {"slug": "zakuski", "label": "Закуски"},
+    {"slug": "mains", "label": "Основные блюда"},
+    {"slug": "desserts", "label": "Десерты"},
+    {"slug": "drinks", "label": "Напитки"},
+]
+_INGREDIENTS = ["говядина", "лук", "морковь", "красное вино", "тимьян", "грибы", "сливки", "свёкла", "сыр", "чеснок"]
+_ALLERGENS = ["Глютен", "Молочные продукты", "Орехи", "Яйца", "Рыба", "Сельдерей"]
+
+
+def menu_rows(n: int) -> List[Dict[str, Any]]:
+    """Строки menu_items (все колонки) — как их хранит Supabase."""
+    rows = []
+    for i in range(1, n + 1):
+        digest = f"{i:064x}"
+        rows.append({
+            "id": i,
+            "category_slug": CATEGORIES[i % len(CATEGORIES)]["slug"],
+            "title": f"Блюдо №{i}",
+            "description": "Нежное филе с соусом из белого вина и сезонными овощами.",
+            "ingredients": ", ".join(_INGREDIENTS[i % 7:i % 7 + 4]),
+            "allergens": ", ".join(_ALLERGENS[i % 5:i % 5 + 2]),
+            "price_cents": 1000 + i,
+            "image_path": f"uploads/{digest[:2]}/{digest}.jpg",
+            "image_variants": {},
+            "wine_title": "Бордо, 2015",
+            "wine_text": "Насыщенное красное вино с нотами вишни.",
+            "created_at": "2026-10-16T10:00:00.000000+00:00",
+        })
+    return rows
+
+
+def menu_json(n: int) -> Dict[str, Any]:
+    """То же меню в формате menu_data.json (режим без Supabase)."""
+    items = [{
+        "id": r["id"], "cat": r["category_slug"], "title": r["title"], "price_cents": r["price_cents"],
+        "desc": r["description"], "img": r["image_path"], "img_variants": r["image_variants"],
+        "ingredients": r["ingredients"].split(", "), "allergens": r["allergens"].split(", "),
+        "wine_title": r["wine_title"], "wine_text": r["wine_text"],
+    } for r in menu_rows(n)]
+    return {"categories": CATEGORIES, "items": items, "next_id": n + 1}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _split_top(text: str) -> List[str]:
+    """'a,b,c(d,e)' -> ['a', 'b', 'c(d,e)']: запятые внутри скобок не делят."""
+    parts, depth, cur = [], 0, []
+    for ch in text:
+        if ch == "," and depth == 0:
+            parts.append("".join(cur))
+            cur = []
+            continue
+        depth += ch == "("
+        depth -= ch == ")"
+        cur.append(ch)
+    if cur:
+        parts.append("".join(cur))
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _like(pattern: str, flags: int = 0) -> "re.Pattern[str]":
+    out, i = [], 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\" and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        out.append(".*" if ch in "%*" else "." if ch == "_" else re.escape(ch))
+        i += 1
+    return re.compile("".join(out) + r"\Z", flags | re.S)
+
+
+def _coerce(sample: Any, raw: str) -> Any:
+    if isinstance(sample, bool):
+        return raw == "true"
+    if isinstance(sample, int):
+        try:
+            return int(raw)
+        except ValueError:
+            return raw
+    return raw
+
+
+def _matches(row: Dict[str, Any], column: str, expr: str) -> bool:
+    op, _, raw = expr.partition(".")
+    negate = op == "not"
+    if negate:
+        op, _, raw = raw.partition(".")
+    value = row.get(column)
+    if op == "is":
+        result = value is None if raw == "null" else value is (raw == "true")
+    elif op == "in":
+        items = [x.strip().strip('"') for x in raw.strip("()").split(",") if x.strip()]
+        result = value in [_coerce(value, x) for x in items]
+    elif op in ("like", "ilike"):
+        result = value is not None and bool(_like(raw, re.I if op == "ilike" else 0).match(str(value)))
+    elif value is None:
+        result = False
+    else:
+        other = _coerce(value, raw)
+        result = {
+            "eq": value == other, "neq": value != other,
+            "lt": value < other, "lte": value <= other,
+            "gt": value > other, "gte": value >= other,
+        }.get(op, False)
+    return not result if negate else result
+
+
+class FakeSupabase:
+    """Таблицы в памяти + счётчики запросов; один экземпляр на сервер."""
+
+    def __init__(self, items: int = 200, bookings: int = 500) -> None:
+        self.lock = threading.Lock()
+        self.latency_ms = 0.0
+        self.jitter_ms = 0.0
+        self.error_rate = 0.0
+        self.requests = 0
+        self.by_route: Dict[str, int] = {}
+        self._last_id: Dict[str, int] = {"categories": len(CATEGORIES), "menu_items": items}
+        self.tables: Dict[str, List[Dict[str, Any]]] = {
+            "categories": [{"id": i, **c} for i, c in enumerate(CATEGORIES, start=1)],
+            "menu_items": menu_rows(items),
+            "bookings": [],
+            "booking_items": [],
+        }
+        self._seed_bookings(bookings)
+
+    def _seed_bookings(self, count: int) -> None:
+        for i in range(count):
+            booking = self._insert("bookings", {
+                "full_name": f"Гость {i}",
+                "email": f"guest{i}@example.com",
+                "phone": f"+7700{i:07d}",
+                "booking_date": f"2026-{1 + i % 12:02d}-{1 + i % 28:02d}",
+                "booking_time": "19:00",
+                "guests": 2 + i % 4,
+                "notes": "",
+                "cart_total_cents": 0,
+            })
+            menu = self.tables["menu_items"]
+            for item in menu[i % max(len(menu), 1):][:2]:
+                self._insert("booking_items", {
+                    "booking_id": booking["id"], "menu_item_id": item["id"], "title": item["title"], "qty": 1,
+                    "unit_price_cents": item["price_cents"], "line_total_cents": item["price_cents"],
+                    "image_path": item["image_path"],
+                })
+
+    # ---- данные ----
+
+    def _insert(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        rows = self.tables.setdefault(table, [])
+        self._last_id[table] = self._last_id.get(table, 0) + 1
+        row = {"created_at": _now(), **row, "id": self._last_id[table]}
+        rows.append(row)
+        return row
+
+    def _children(self, child: str, fk: str, memo: Dict[Tuple[str, str], Dict[Any, list]]) -> Dict[Any, list]:
+        """Строки child, сгруппированные по внешнему ключу, — один проход на запрос, а не на каждую строку."""
+        key = (child, fk)
+        if key not in memo:
+            groups: Dict[Any, list] = {}
+            for r in self.tables.get(child, []):
+                groups.setdefault(r.get(fk), []).append(r)
+            memo[key] = groups
+        return memo[key]
+
+    def _project(self, table: str, row: Dict[str, Any], select: str,
+                 memo: Dict[Tuple[str, str], Dict[Any, list]]) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for part in _split_top(select or "*"):
+            if part == "*":
+                out.update(row)
+            elif "(" in part:
+                child, cols = part[:-1].split("(", 1)
+                fk = table[:-1] + "_id"  # bookings -> booking_id
+                out[child] = [
+                    self._project(child, r, cols, memo) for r in self._children(child, fk, memo).get(row["id"], [])
+                ]
+            else:
+                out[part] = row.get(part)
+        return out
+
+    def _filtered(self, table: str, params: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        rows = self.tables.get(table, [])
+        for column, expr in params:
+            if column not in _RESERVED:
+                rows = [r for r in rows if _matches(r, column, expr)]
+        return rows
+
+    def select(self, table: str, params: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        q = dict(params)
+        rows = list(self._filtered(table, params))
+        for key in reversed(_split_top(q.get("order", ""))):
+            column, _, direction = key.partition(".")
+            desc = direction.startswith("desc")
+            rows.sort(key=lambda r: (r.get(column) is None, r.get(column) or 0), reverse=desc)
+        offset = int(q.get("offset") or 0)
+        if "limit" in q:
+            rows = rows[offset:offset + int(q["limit"])]
+        elif offset:
+            rows = rows[offset:]
+        memo: Dict[Tuple[str, str], Dict[Any, list]] = {}
+        return [self._project(table, r, q.get("select", "*"), memo) for r in rows]
+
+    def insert(self, table: str, params: List[Tuple[str, str]], body: Any, upsert: bool) -> List[Dict[str, Any]]:
+        conflict = dict(params).get("on_conflict")
+        out = []
+        for row in body if isinstance(body, list) else [body]:
+            existing = None
+            if upsert and conflict:
+                existing = next((r for r in self.tables.get(table, []) if r.get(conflict) == row.get(conflict)), None)
+            if existing is not None:
+                existing.update(row)
+                out.append(existing)
+            else:
+                out.append(self._insert(table, row))
+        return out
+
+    def update(self, table: str, params: List[Tuple[str, str]], body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        rows = self._filtered(table, params)
+        for r in rows:
+            r.update(body)
+        return rows
+
+    def create_bookings(self, body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        # как функция create_bookings в supabase_schema.sql: идемпотентно по idempotency_key
+        out = []
+        for b in body.get("bookings") or []:
+            key = b.get("idempotency_key")
+            existing = next((r for r in self.tables["bookings"] if key and r.get("idempotency_key") == key), None)
+            if existing is None:
+                existing = self._insert("bookings", {k: v for k, v in b.items() if k != "items"})
+                for it in b.get("items") or []:
+                    self._insert("booking_items", {**it, "booking_id": existing["id"]})
+            out.append({"out_key": key, "out_booking_id": existing["id"]})
+        return out
+
+    # ---- счётчики ----
+
+    def count(self, route: str) -> None:
+        with self.lock:
+            self.requests += 1
+            self.by_route[route] = self.by_route.get(route, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"requests": self.requests, "by_route": dict(self.by_route)}
+
+    def reset(self) -> None:
+        with self.lock:
+            self.requests = 0
+            self.by_route = {}
+
+    def configure(self, cfg: Dict[str, Any]) -> None:
+        self.latency_ms = float(cfg.get("latency_ms", self.latency_ms))
+        self.jitter_ms = float(cfg.get("jitter_ms", self.jitter_ms))
+        self.error_rate = float(cfg.get("error_rate", self.error_rate))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего PostgREST
+    disable_nagle_algorithm = True  # заголовки и тело уходят отдельно — без этого +40 мс на delayed ACK
+    fake: FakeSupabase
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> Any:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"null") if length else None
+
+    def _bench(self, path: str) -> bool:
+        if not path.startswith("/_bench/"):
+            return False
+        fake = self.fake
+        body = self._body()
+        if path == "/_bench/stats":
+            self._send(200, fake.stats())
+        elif path == "/_bench/reset":
+            fake.reset()
+            self._send(200, {})
+        elif path == "/_bench/config":
+            fake.configure(body or {})
+            self._send(200, {"latency_ms": fake.latency_ms, "jitter_ms": fake.jitter_ms, "error_rate": fake.error_rate})
+        else:
+            self._send(404, {})
+        return True
+
+    def _handle(self) -> None:
+        url = urlsplit(self.path)
+        if self._bench(url.path):
+            return
+        if not url.path.startswith("/rest/v1/"):
+            self._send(404, {"message": "not found"})
+            return
+
+        fake = self.fake
+        target = url.path[len("/rest/v1/"):]
+        params = parse_qsl(url.query, keep_blank_values=True)
+        body = self._body()  # postgrest-py шлёт "{}" и в GET — тело читаем всегда, иначе собьётся keep-alive
+        fake.count(f"{self.command} {target}")
+
+        delay = fake.latency_ms + random.uniform(-fake.jitter_ms, fake.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if fake.error_rate and random.random() < fake.error_rate:
+            self._send(503, {"message": "injected failure"})
+            return
+
+        with fake.lock:
+            if target == "rpc/create_bookings":
+                self._send(200, fake.create_bookings(body or {}))
+            elif self.command == "GET":
+                self._send(200, fake.select(target, params))
+            elif self.command == "POST":
+                upsert = "merge-duplicates" in (self.headers.get("Prefer") or "")
+                self._send(201, fake.insert(target, params, body, upsert))
+            elif self.command == "PATCH":
+                self._send(200, fake.update(target, params, body or {}))
+            else:
+                self._send(405, {"message": "method not allowed"})
+
+    do_GET = do_POST = do_PATCH = do_DELETE = _handle
+
+
+def start(port: int = 0, items: int = 200, bookings: int = 500) -> Tuple[ThreadingHTTPServer, FakeSupabase]:
+    """Поднимает сервер в фоновом потоке; port=0 — свободный порт (server.server_port)."""
+    fake = FakeSupabase(items=items, bookings=bookings)
+    handler = type("Handler", (_Handler,), {"fake": fake})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-postgrest", daemon=True).start()
+    return server, fake
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--bookings", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, fake = start(args.port, args.items, args.bookings)
+    fake.configure({"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "error_rate": args.error_rate})
+    print(f"SUPABASE_URL=http://127.0.0.1:{server.server_port}")
+    print(f"SUPABASE_ANON_KEY={ANON_KEY}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
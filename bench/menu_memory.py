@@ -0,0 +1,122 @@
+"""Память и размер ответа для меню на N позиций: словари из select("*") против проекций + MenuItem.
+
+    python bench/menu_memory.py            # 5 000 позиций
+    python bench/menu_memory.py --items 20000
+
+Сравнивает то, что воркер держит в памяти после сборки каталога:
+  before — все колонки menu_items, позиция = dict (как было до records.MenuItem);
+  after  — колонки карточки (MENU_CARD_COLUMNS), позиция = MenuItem со __slots__.
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from menu_catalog import MenuCatalog  # noqa: E402
+from pricing import format_cents, parse_cents  # noqa: E402
+from supabase_service import MENU_CARD_COLUMNS  # noqa: E402
+
+CATEGORIES = [{"slug": s, "label": s.title()} for s in ("zakuski", "mains", "desserts", "drinks")]
+
+
+def fake_rows(n: int) -> list:
+    """Строки menu_items так, как их отдаёт PostgREST на select("*")."""
+    rows = []
+    for i in range(1, n + 1):
+        digest = f"{i:064x}"
+        rows.append({
+            "id": i,
+            "category_slug": CATEGORIES[i % len(CATEGORIES)]["slug"],
+            "title": f"Блюдо №{i}",
+            "description": "Нежное филе с соусом из белого вина и сезонными овощами. " * 2,
+            "ingredients": "говядина, лук, морковь, красное вино, тимьян, лавровый лист",
+            "allergens": "Глютен, Молочные продукты",
+            "price_cents": 1000 + i,
+            "image_path": f"uploads/{digest[:2]}/{digest}.jpg",
+            "image_variants": {
+                name: {"w": w, "webp": f"uploads/{digest[:2]}/variants/{digest}-{w}.webp",
+                       "fallback": f"uploads/{digest[:2]}/variants/{digest}-{w}.jpg"}
+                for name, w in (("thumb", 240), ("card", 640), ("hero", 1280))
+            },
+            "wine_title": "Бордо, 2015",
+            "wine_text": "Сомелье рекомендует насыщенное красное вино с нотами вишни и табака. " * 3,
+            "created_at": "2026-10-16T10:00:00.000000+00:00",
+        })
+    return rows
+
+
+def map_row(r: dict) -> dict:
+    # то же, что app._map_menu_item_supabase
+    return {
+        "id": r.get("id"),
+        "cat": r.get("category_slug"),
+        "title": r.get("title") or "",
+        "price_cents": int(r.get("price_cents") or 0),
+        "desc": r.get("description") or "",
+        "img": (r.get("image_path") or "img/placeholder.jpg").lstrip("/"),
+        "img_variants": r.get("image_variants") or {},
+        "ingredients": [x.strip() for x in (r.get("ingredients") or "").split(",") if x.strip()],
+        "allergens": [x.strip() for x in (r.get("allergens") or "").split(",") if x.strip()],
+        "wine_title": r.get("wine_title") or "",
+        "wine_text": r.get("wine_text") or "",
+    }
+
+
+def build_before(payload: str):
+    # dict-каталог как до перехода на записи: копия строки + посчитанная цена
+    items = []
+    for r in json.loads(payload):
+        out = dict(map_row(r))
+        out["price"] = format_cents(out["price_cents"])
+        items.append(out)
+    by_id = {it["id"]: it for it in items}
+    return items, by_id
+
+
+def build_after(payload: str):
+    return MenuCatalog("bench", CATEGORIES, [map_row(r) for r in json.loads(payload)], parse_cents, format_cents)
+
+
+def measure(build, payload: str):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build(payload)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained, peak, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=5000)
+    args = parser.parse_args()
+
+    rows = fake_rows(args.items)
+    card_columns = MENU_CARD_COLUMNS.split(",")
+    payload_full = json.dumps(rows, ensure_ascii=False)
+    payload_card = json.dumps([{k: r[k] for k in card_columns} for r in rows], ensure_ascii=False)
+
+    results = {
+        "before": (len(payload_full.encode()), *measure(build_before, payload_full)),
+        "after": (len(payload_card.encode()), *measure(build_after, payload_card)),
+    }
+
+    print(f"menu items: {args.items}")
+    print(f"{'':8}{'payload':>12}{'retained':>12}{'peak':>12}{'build':>10}")
+    for name, (size, retained, peak, elapsed) in results.items():
+        print(f"{name:8}{size / 1024:>10.0f}KB{retained / 1024:>10.0f}KB{peak / 1024:>10.0f}KB{elapsed * 1000:>8.0f}ms")
+    before, after = results["before"], results["after"]
+    print(f"payload  -{(1 - after[0] / before[0]) * 100:.0f}%   retained  -{(1 - after[1] / before[1]) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
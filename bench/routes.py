@@ -0,0 +1,342 @@
+"""Латентность маршрутов: p50/p95/p99, RPS и запросов в Supabase на запрос; сравнение с базовой линией.
+
+    python bench/routes.py                                   # Flask test client, JSON/SQLite режим
+    python bench/routes.py --supabase --latency-ms 20        # + заглушка Supabase (bench/fake_postgrest.py)
+    python bench/routes.py --driver gunicorn --workers 2 --threads 4 --concurrency 8 --supabase
+    python bench/routes.py --supabase --save bench/baseline.json
+    python bench/routes.py --supabase --compare bench/baseline.json   # код выхода 1 при регрессии
+
+Приложение запускается на копии дерева во временном каталоге: bookings.sqlite3, menu_data.json
+и instance/ репозитория не трогаются; меню (--items позиций) кладётся в копию menu_data.json
+или в заглушку Supabase. Каждый маршрут — отдельная фаза (прогрев + --requests
+замеров), поэтому запросы в Supabase за фазу делятся на число запросов к этому маршруту.
+Брони из журнала уходят в Supabase фоном — эти вызовы попадают в ту фазу, во время которой случились.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import fake_postgrest  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+_COPY_IGNORE = shutil.ignore_patterns(
+    ".git", ".venv", "venv", "__pycache__", "bench", "instance", "claude-monet", "node_modules",
+    "*.sqlite3-wal", "*.sqlite3-shm", "*.lock",
+)
+
+
+@dataclass
+class Step:
+    name: str
+    method: str
+    path: Callable[["Context"], str]
+    data: Optional[Callable[["Context", int], Dict[str, str]]] = None
+    ok: tuple = (200,)
+
+
+@dataclass
+class Context:
+    dish_id: int = 1
+    booking_id: int = 1
+    counter: Iterator[int] = field(default_factory=itertools.count)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def next(self) -> int:
+        with self.lock:
+            return next(self.counter)
+
+
+def _booking_form(ctx: Context, _i: int) -> Dict[str, str]:
+    # даты/время разносим, чтобы не упереться в вместимость зала (availability)
+    n = ctx.next()
+    day = date.today() + timedelta(days=30 + n % 300)
+    hour = 12 + (n // 300) % 9
+    return {
+        "action": "booking_submit", "full_name": f"Bench {n}", "phone": f"+7701{n:07d}",
+        "email": "bench@example.com", "date": day.isoformat(), "time": f"{hour:02d}:00", "guests": "2",
+    }
+
+
+STEPS = [
+    Step("home", "GET", lambda c: "/"),
+    Step("menu", "GET", lambda c: "/menu"),
+    Step("menu_section", "GET", lambda c: "/menu?section=mains"),
+    Step("dish", "GET", lambda c: f"/dish/{c.dish_id}"),
+    Step("cart_add", "POST", lambda c: f"/dish/{c.dish_id}",
+         lambda c, i: {"action": "add_to_cart", "qty": "1"}, ok=(302,)),
+    Step("booking_page", "GET", lambda c: "/booking"),
+    Step("cart_inc", "POST", lambda c: "/booking",
+         lambda c, i: {"action": "cart_inc", "item_id": str(c.dish_id)}, ok=(302,)),
+    Step("cart_dec", "POST", lambda c: "/booking",
+         lambda c, i: {"action": "cart_dec", "item_id": str(c.dish_id)}, ok=(302,)),
+    Step("booking_submit", "POST", lambda c: "/booking", _booking_form, ok=(302,)),
+    Step("admin_bookings", "GET", lambda c: "/admin/bookings"),
+    Step("admin_booking_detail", "GET", lambda c: f"/admin/bookings/{c.booking_id}"),
+    Step("admin_menu_new", "GET", lambda c: "/admin/menu/new"),
+]
+
+
+# ---- клиенты ----
+
+class TestClientDriver:
+    """Flask test client в этом процессе: без сети, видна чистая стоимость Python-кода."""
+
+    def __init__(self, workdir: Path) -> None:
+        sys.path.insert(0, str(workdir))
+        os.chdir(workdir)
+        import app as app_module  # noqa: E402  (после настройки окружения)
+        self.app = app_module.app
+
+    def client(self) -> Any:
+        return self.app.test_client()
+
+    @staticmethod
+    def request(client: Any, method: str, path: str, data: Optional[Dict[str, str]]) -> tuple:
+        r = client.open(path, method=method, data=data)
+        body = r.get_data()
+        return r.status_code, body
+
+    def close(self) -> None:
+        pass
+
+
+class GunicornDriver:
+    """Настоящий gunicorn на локальном порту; клиенты — httpx с keep-alive, свой cookie jar у каждого."""
+
+    def __init__(self, workdir: Path, env: Dict[str, str], workers: int, threads: int) -> None:
+        import httpx
+
+        self.httpx = httpx
+        port = _free_port()
+        self.base = f"http://127.0.0.1:{port}"
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "app:app", "-b", f"127.0.0.1:{port}",
+             "-w", str(workers), "--threads", str(threads), "--log-level", "warning"],
+            cwd=workdir, env=env,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                if httpx.get(self.base + "/", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        self.close()
+        raise RuntimeError("gunicorn не поднялся за 30 с")
+
+    def client(self) -> Any:
+        return self.httpx.Client(base_url=self.base, follow_redirects=False, timeout=30)
+
+    @staticmethod
+    def request(client: Any, method: str, path: str, data: Optional[Dict[str, str]]) -> tuple:
+        r = client.request(method, path, data=data)
+        return r.status_code, r.content
+
+    def close(self) -> None:
+        self.proc.terminate()
+        try:
+            self.proc.wait(10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ---- замеры ----
+
+def percentile(sorted_ms: List[float], p: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    k = max(0, min(len(sorted_ms) - 1, round(p / 100 * len(sorted_ms) + 0.5) - 1))
+    return sorted_ms[k]
+
+
+def run_step(driver: Any, clients: List[Any], step: Step, ctx: Context, requests: int, warmup: int,
+             fake: Optional[fake_postgrest.FakeSupabase]) -> Dict[str, Any]:
+    def one(i: int) -> tuple:
+        client = clients[i % len(clients)]
+        data = step.data(ctx, i) if step.data else None
+        started = time.perf_counter()
+        try:
+            status, _ = driver.request(client, step.method, step.path(ctx), data)
+        except Exception:
+            status = 0
+        return (time.perf_counter() - started) * 1000, status in step.ok
+
+    for i in range(warmup):
+        one(i)
+    if fake is not None:
+        time.sleep(0.05)  # хвост фоновых вызовов прогрева
+        fake.reset()
+
+    started = time.perf_counter()
+    if len(clients) == 1:
+        results = [one(i) for i in range(requests)]
+    else:
+        with ThreadPoolExecutor(len(clients)) as pool:
+            results = list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+
+    timings = sorted(ms for ms, _ in results)
+    return {
+        "requests": requests,
+        "errors": sum(1 for _, ok in results if not ok),
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "mean_ms": round(sum(timings) / len(timings), 3),
+        "rps": round(requests / wall, 1) if wall else 0.0,
+        "backend_calls": round(fake.stats()["requests"] / requests, 2) if fake is not None else None,
+    }
+
+
+def prepare_context(driver: Any, client: Any) -> Context:
+    ctx = Context()
+    status, body = driver.request(client, "GET", "/menu/search?limit=1", None)
+    if status == 200:
+        items = json.loads(body).get("items") or []
+        if items:
+            ctx.dish_id = int(items[0]["id"])
+    status, body = driver.request(client, "GET", "/admin/bookings", None)
+    m = re.search(rb"/admin/bookings/(\d+)", body or b"")
+    if m:
+        ctx.booking_id = int(m.group(1))
+    return ctx
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, floor_ms: float) -> List[str]:
+    """Регрессии: p95 выросла больше чем на tolerance (и на floor_ms), больше вызовов Supabase, новые ошибки."""
+    problems = []
+    for name, cur in current["routes"].items():
+        base = baseline.get("routes", {}).get(name)
+        if not base:
+            continue
+        if cur["p95_ms"] > base["p95_ms"] * (1 + tolerance) and cur["p95_ms"] - base["p95_ms"] > floor_ms:
+            problems.append(f"{name}: p95 {base['p95_ms']:.1f} -> {cur['p95_ms']:.1f} ms")
+        if cur["backend_calls"] is not None and base.get("backend_calls") is not None \
+                and cur["backend_calls"] > base["backend_calls"] + 0.05:
+            problems.append(f"{name}: Supabase calls/request {base['backend_calls']} -> {cur['backend_calls']}")
+        if cur["errors"] > base.get("errors", 0):
+            problems.append(f"{name}: errors {base.get('errors', 0)} -> {cur['errors']}")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--driver", choices=("testclient", "gunicorn"), default="testclient")
+    parser.add_argument("--supabase", action="store_true", help="гонять через заглушку Supabase")
+    parser.add_argument("--requests", type=int, default=200, help="замеров на маршрут")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=1, help="параллельных клиентов (gunicorn)")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--items", type=int, default=200, help="позиций меню")
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--jitter-ms", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--only", help="маршруты через запятую")
+    parser.add_argument("--save", type=Path, help="записать результат в JSON")
+    parser.add_argument("--compare", type=Path, help="сравнить с сохранённой базовой линией")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимый рост p95 (доля)")
+    parser.add_argument("--floor-ms", type=float, default=1.0, help="рост p95 меньше этого — шум")
+    args = parser.parse_args()
+    # test client делает chdir в копию дерева — пути из командной строки фиксируем заранее
+    save = args.save.resolve() if args.save else None
+    baseline_path = args.compare.resolve() if args.compare else None
+
+    workdir = Path(tempfile.mkdtemp(prefix="monet-bench-"))
+    shutil.copytree(ROOT, workdir, ignore=_COPY_IGNORE, dirs_exist_ok=True)
+
+    menu = fake_postgrest.menu_json(args.items)
+    (workdir / "menu_data.json").write_text(json.dumps(menu, ensure_ascii=False), encoding="utf-8")
+
+    env = dict(os.environ, SUPABASE_URL="", SUPABASE_ANON_KEY="")
+    server = fake = None
+    if args.supabase:
+        server, fake = fake_postgrest.start(items=args.items)
+        fake.configure({"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "error_rate": args.error_rate})
+        env.update(SUPABASE_URL=f"http://127.0.0.1:{server.server_port}", SUPABASE_ANON_KEY=fake_postgrest.ANON_KEY)
+
+    driver: Any = None
+    try:
+        if args.driver == "gunicorn":
+            driver = GunicornDriver(workdir, env, args.workers, args.threads)
+        else:
+            os.environ.update(env)
+            driver = TestClientDriver(workdir)
+        clients = [driver.client() for _ in range(max(1, args.concurrency))]
+        ctx = prepare_context(driver, clients[0])
+
+        only = set(args.only.split(",")) if args.only else None
+        routes: Dict[str, Any] = {}
+        print(f"{'route':22}{'p50':>9}{'p95':>9}{'p99':>9}{'rps':>9}{'sb/req':>8}{'err':>6}")
+        for step in STEPS:
+            if only and step.name not in only:
+                continue
+            res = run_step(driver, clients, step, ctx, args.requests, args.warmup, fake)
+            routes[step.name] = res
+            calls = "-" if res["backend_calls"] is None else f"{res['backend_calls']:.2f}"
+            print(f"{step.name:22}{res['p50_ms']:>9.2f}{res['p95_ms']:>9.2f}{res['p99_ms']:>9.2f}"
+                  f"{res['rps']:>9.0f}{calls:>8}{res['errors']:>6}")
+    finally:
+        if driver is not None:
+            driver.close()
+        if server is not None:
+            server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        "meta": {
+            "driver": args.driver,
+            "supabase": args.supabase,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "workers": args.workers if args.driver == "gunicorn" else None,
+            "threads": args.threads if args.driver == "gunicorn" else None,
+            "latency_ms": args.latency_ms if args.supabase else None,
+            "error_rate": args.error_rate if args.supabase else None,
+            "items": args.items,
+            "python": platform.python_version(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "routes": routes,
+    }
+    if save:
+        save.write_text(json.dumps(result, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"сохранено: {save}")
+    if baseline_path:
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+        for key in ("driver", "supabase", "concurrency", "latency_ms", "items"):
+            if baseline.get("meta", {}).get(key) != result["meta"][key]:
+                print(f"внимание: {key} в базовой линии {baseline['meta'].get(key)!r}, сейчас {result['meta'][key]!r}")
+        problems = compare(result, baseline, args.tolerance, args.floor_ms)
+        for line in problems:
+            print("РЕГРЕССИЯ", line)
+        if problems:
+            sys.exit(1)
+        print("регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
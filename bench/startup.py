@@ -0,0 +1,134 @@
+"""Холодный старт воркера: время `import app`, RSS и загруженные модули — в режиме SQLite/JSON и Supabase.
+
+    python bench/startup.py                         # по 5 свежих интерпретаторов на режим
+    python bench/startup.py --runs 10 --save bench/startup_baseline.json
+    python bench/startup.py --compare bench/startup_baseline.json
+
+Каждый замер — отдельный процесс на копии дерева (как новый воркер gunicorn). Для Supabase
+поднимается bench/fake_postgrest.py и дополнительно меряется первый запрос (в нём
+импортируется стек клиента). В отчёте медианы и признак, попал ли httpx/supabase в sys.modules
+сразу после импорта.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import fake_postgrest  # noqa: E402
+from routes import _COPY_IGNORE, ROOT  # noqa: E402
+
+# выполняется в дочернем процессе: печатает одну строку JSON
+_PROBE = r"""
+import json, resource, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter() - started
+rss_import = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+loaded = {name: name in sys.modules for name in ("httpx", "supabase")}
+modules = len(sys.modules)
+first_query = None
+if app.USE_SUPABASE:
+    started = time.perf_counter()
+    app.list_categories()  # снимок меню мог остаться с прошлого запуска — идём в Supabase напрямую
+    first_query = time.perf_counter() - started
+print(json.dumps({
+    "import_ms": imported * 1000,
+    "first_query_ms": first_query * 1000 if first_query is not None else None,
+    "rss_import_kb": rss_import,
+    "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "modules": modules,
+    "httpx_loaded": loaded["httpx"],
+    "supabase_loaded": loaded["supabase"],
+}))
+"""
+
+
+def probe(workdir: Path, env: Dict[str, str]) -> Dict[str, Any]:
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE], cwd=workdir, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def median(key: str) -> Any:
+        values = [r[key] for r in runs if r[key] is not None]
+        return round(statistics.median(values), 1) if values else None
+
+    return {
+        "runs": len(runs),
+        "import_ms": median("import_ms"),
+        "first_query_ms": median("first_query_ms"),
+        "rss_import_mb": round(median("rss_import_kb") / 1024, 1),
+        "rss_mb": round(median("rss_kb") / 1024, 1),
+        "modules": int(median("modules")),
+        "httpx_loaded": runs[-1]["httpx_loaded"],
+        "supabase_loaded": runs[-1]["supabase_loaded"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--save", type=Path)
+    parser.add_argument("--compare", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимый рост времени/RSS (доля)")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="monet-startup-"))
+    shutil.copytree(ROOT, workdir, ignore=_COPY_IGNORE, dirs_exist_ok=True)
+    server, _ = fake_postgrest.start(items=200)
+    base_env = dict(os.environ)
+    modes = {
+        "sqlite": dict(base_env, SUPABASE_URL="", SUPABASE_ANON_KEY=""),
+        "supabase": dict(base_env, SUPABASE_URL=f"http://127.0.0.1:{server.server_port}",
+                         SUPABASE_ANON_KEY=fake_postgrest.ANON_KEY),
+    }
+    results: Dict[str, Any] = {}
+    try:
+        for mode, env in modes.items():
+            probe(workdir, env)  # первый запуск пишет .pyc и создаёт базы — не считаем
+            results[mode] = summarize([probe(workdir, env) for _ in range(args.runs)])
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'mode':10}{'import':>10}{'1st query':>11}{'RSS':>9}{'modules':>9}  httpx  supabase")
+    for mode, r in results.items():
+        first = "-" if r["first_query_ms"] is None else f"{r['first_query_ms']:.0f}ms"
+        print(f"{mode:10}{r['import_ms']:>8.0f}ms{first:>11}{r['rss_import_mb']:>7.1f}MB{r['modules']:>9}"
+              f"  {'yes' if r['httpx_loaded'] else 'no':5}  {'yes' if r['supabase_loaded'] else 'no'}")
+
+    result = {"python": sys.version.split()[0], "modes": results}
+    if args.save:
+        args.save.write_text(json.dumps(result, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"сохранено: {args.save}")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        problems = []
+        for mode, cur in results.items():
+            base = baseline.get("modes", {}).get(mode)
+            if not base:
+                continue
+            for key in ("import_ms", "rss_import_mb"):
+                if cur[key] > base[key] * (1 + args.tolerance):
+                    problems.append(f"{mode}: {key} {base[key]} -> {cur[key]}")
+            if mode == "sqlite" and cur["httpx_loaded"] and not base["httpx_loaded"]:
+                problems.append("sqlite: httpx снова импортируется при старте")
+        for line in problems:
+            print("РЕГРЕССИЯ", line)
+        if problems:
+            sys.exit(1)
+        print("регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import csv
+import io
+import re
+import zipfile
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from records import Booking, BookingLine
+
+# брони страницы вместе с позициями заказа
+Page = List[Tuple[Booking, List[BookingLine]]]
+# страница выгрузки: брони с id > after_id по возрастанию, не больше limit
+PageFetcher = Callable[[Optional[int], int], Page]
+
+EXPORT_PAGE_SIZE = 500
+# сколько строк копить перед тем, как отдать кусок ответа
+ROWS_PER_CHUNK = 200
+
+# (заголовок, тип): text — строка, int — целое, money — копейки (в файл идут как 48.50)
+COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ("ID брони", "int"),
+    ("Дата", "text"),
+    ("Время", "text"),
+    ("Гостей", "int"),
+    ("Имя", "text"),
+    ("Телефон", "text"),
+    ("Email", "text"),
+    ("Комментарий", "text"),
+    ("Сумма заказа", "money"),
+    ("Создана", "text"),
+    ("Позиция", "text"),
+    ("Кол-во", "int"),
+    ("Цена", "money"),
+    ("Сумма позиции", "money"),
+)
+
+
+def iter_pages(fetch_page: PageFetcher, page_size: int = EXPORT_PAGE_SIZE) -> Iterator[Page]:
+    """Страницы по keyset (id > последнего): в памяти всегда не больше одной страницы."""
+    after_id = None
+    while True:
+        page = fetch_page(after_id, page_size)
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        after_id = page[-1][0].id
+
+
+def iter_rows(pages: Iterable[Page]) -> Iterator[Tuple[Any, ...]]:
+    """Строка на позицию заказа (поля брони повторяются); бронь без заказа — одна строка."""
+    for page in pages:
+        for booking, lines in page:
+            head = (
+                booking.id, booking.date, booking.time, booking.guests, booking.full_name, booking.phone,
+                booking.email, booking.notes, booking.total_cents, booking.created_at or "",
+            )
+            if not lines:
+                yield head + ("", None, None, None)
+            for line in lines:
+                yield head + (line.title, line.qty, line.unit_price_cents, line.line_total_cents)
+
+
+def _money(cents: Optional[int]) -> str:
+    return "" if cents is None else f"{cents / 100:.2f}"
+
+
+# с этих символов Excel и LibreOffice начинают формулу: "=HYPERLINK(...)" в имени гостя сработает
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _csv_cell(value: Any, kind: str) -> Any:
+    """Ячейка CSV; текст, похожий на формулу, экранируем апострофом — Excel покажет его как есть."""
+    if kind == "money":
+        return _money(value)
+    if value is None:
+        return ""
+    if kind == "text":
+        text = str(value)
+        return "'" + text if text.startswith(_FORMULA_PREFIXES) else text
+    return value
+
+
+def csv_chunks(rows: Iterable[Sequence[Any]]) -> Iterator[str]:
+    """CSV кусками по ROWS_PER_CHUNK строк; BOM в начале — чтобы Excel понял UTF-8."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    buf.write("\ufeff")
+    writer.writerow([title for title, _ in COLUMNS])
+    kinds = [kind for _, kind in COLUMNS]
+    pending = 0
+    for row in rows:
+        writer.writerow([_csv_cell(value, kind) for value, kind in zip(row, kinds)])
+        pending += 1
+        if pending >= ROWS_PER_CHUNK:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            pending = 0
+    yield buf.getvalue()
+
+
+# ---- XLSX ----
+
+# символы, запрещённые в XML 1.0 (кроме \t \n \r)
+_XML_ILLEGAL_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Брони" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+# стиль 1 — жирный заголовок, стиль 2 — деньги (#,##0.00)
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '<xf numFmtId="4" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" '
+    'state="frozen"/></sheetView></sheetViews>'
+    '<sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+def _text_cell(value: Any, style: str = "") -> str:
+    text = _XML_ILLEGAL_RE.sub("", str(value))
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    # inlineStr вместо таблицы sharedStrings: её пришлось бы держать в памяти целиком до конца файла
+    return f'<c t="inlineStr"{style}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(row: Sequence[Any], kinds: Sequence[str]) -> str:
+    cells = []
+    for value, kind in zip(row, kinds):
+        if value is None or value == "":
+            cells.append("<c/>")
+        elif kind == "money":
+            cells.append(f'<c s="2"><v>{value / 100}</v></c>')
+        elif kind == "int":
+            cells.append(f"<c><v>{int(value)}</v></c>")
+        else:
+            cells.append(_text_cell(value))
+    return "<row>" + "".join(cells) + "</row>"
+
+
+class _ChunkSink(io.RawIOBase):
+    """Поток, в который пишет ZipFile; накопленные байты забирает генератор ответа."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def xlsx_chunks(rows: Iterable[Sequence[Any]]) -> Iterator[bytes]:
+    """XLSX потоком: лист пишется в zip по мере чтения строк, сжатые куски сразу уходят клиенту.
+
+    Выход не seekable, поэтому zipfile пишет размеры в data descriptor после каждого файла —
+    Excel, LibreOffice и openpyxl такие архивы читают.
+    """
+    sink = _ChunkSink()
+    kinds = [kind for _, kind in COLUMNS]
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, body in (
+            ("[Content_Types].xml", _CONTENT_TYPES),
+            ("_rels/.rels", _ROOT_RELS),
+            ("xl/workbook.xml", _WORKBOOK),
+            ("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS),
+            ("xl/styles.xml", _STYLES),
+        ):
+            zf.writestr(name, body)
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            header = "".join(_text_cell(title, ' s="1"') for title, _ in COLUMNS)
+            sheet.write((_SHEET_HEAD + f"<row>{header}</row>").encode("utf-8"))
+            pending: List[str] = []
+            for row in rows:
+                pending.append(_xlsx_row(row, kinds))
+                if len(pending) >= ROWS_PER_CHUNK:
+                    sheet.write("".join(pending).encode("utf-8"))
+                    pending.clear()
+                    data = sink.drain()
+                    if data:
+                        yield data
+            sheet.write(("".join(pending) + _SHEET_TAIL).encode("utf-8"))
+    yield sink.drain()
+
+
+# формат -> (генератор кусков, mimetype)
+FORMATS: Dict[str, Tuple[Callable[[Iterable[Sequence[Any]]], Iterator[Any]], str]] = {
+    "csv": (csv_chunks, "text/csv; charset=utf-8"),
+    "xlsx": (xlsx_chunks, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
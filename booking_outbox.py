@@ -0,0 +1,290 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from db import SQLiteDatabase
+
+# sender получает пачку [{"idempotency_key": ..., **booking, "items": [...]}, ...]
+# и возвращает {idempotency_key: id брони в удалённой базе} для принятых записей
+Sender = Callable[[List[Dict[str, Any]]], Dict[str, int]]
+
+# ошибка сервиса, а не данных (сеть, 5xx, открытый предохранитель) — попытка не засчитывается
+TransientCheck = Callable[[Exception], bool]
+
+# без новых записей поток просыпается редко: брони других воркеров подберут их потоки
+IDLE_POLL_SECONDS = 30.0
+
+
+def _migration_001_outbox(con) -> None:
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS booking_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            remote_id INTEGER,
+            created_at REAL NOT NULL,
+            sent_at REAL
+        )
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS booking_outbox_due_idx ON booking_outbox(sent_at, next_attempt_at)")
+
+
+def _migration_002_failed(con) -> None:
+    """failed_at — запись исчерпала попытки и больше не отправляется (ждёт разбора или requeue_failed)."""
+    con.execute("ALTER TABLE booking_outbox ADD COLUMN failed_at REAL")
+    con.execute("DROP INDEX IF EXISTS booking_outbox_due_idx")
+    con.execute(
+        "CREATE INDEX IF NOT EXISTS booking_outbox_due_idx ON booking_outbox(sent_at, failed_at, next_attempt_at)"
+    )
+
+
+def _migration_003_retries(con) -> None:
+    """retries — повторы из-за недоступности сервиса: растят паузу, но не попытки."""
+    con.execute("ALTER TABLE booking_outbox ADD COLUMN retries INTEGER NOT NULL DEFAULT 0")
+
+
+class OutboxBacklog(NamedTuple):
+    pending: int  # ждут отправки
+    failed: int   # исчерпали попытки
+
+
+
+class BookingOutbox:
+    """Локальный журнал броней для Supabase: запрос пишет в SQLite и сразу отвечает.
+
+    Фоновый поток забирает созревшие записи пачками и отдаёт их sender'у. Запись сначала
+    «арендуется» (next_attempt_at сдвигается на lease_seconds), поэтому несколько
+    gunicorn-воркеров не шлют одно и то же одновременно; а если аренда истекла посреди
+    отправки, повтор безопасен — на стороне базы бронь уникальна по idempotency_key.
+    Ошибка — повтор с экспоненциальной задержкой (с разбросом) до max_delay.
+
+    Ошибки делятся на временные (is_transient: сеть, 5xx, открытый предохранитель) и отказы
+    сервиса принять данные. Временные только откладывают отправку — сколько бы ни длился
+    сбой, бронь не пропадёт. Если пачку отвергли из-за данных, записи переотправляются
+    по одной: одна битая бронь не держит остальные. Запись, отвергнутая max_attempts раз,
+    помечается failed_at и больше не отправляется.
+
+    Файл журнала открыт с synchronous=FULL: принятая бронь переживает и отключение питания.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        sender: Sender,
+        batch_size: int = 20,
+        base_delay: float = 2.0,
+        max_delay: float = 300.0,
+        lease_seconds: float = 60.0,
+        keep_sent_seconds: float = 7 * 24 * 3600,
+        max_attempts: int = 20,
+        is_transient: TransientCheck = lambda error: False,
+    ) -> None:
+        self.db = SQLiteDatabase(path, synchronous="FULL")
+        self.db.migrate([_migration_001_outbox, _migration_002_failed, _migration_003_retries])
+        self.sender = sender
+        self.batch_size = batch_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self.keep_sent_seconds = keep_sent_seconds
+        self.max_attempts = max_attempts
+        self.is_transient = is_transient
+
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+
+    # ---- запись ----
+
+    def enqueue(self, booking: Dict[str, Any], items: List[Dict[str, Any]]) -> str:
+        key = uuid.uuid4().hex
+        payload = json.dumps({**booking, "items": items}, ensure_ascii=False)
+        now = time.time()
+        with self.db.transaction() as con:
+            con.execute(
+                "INSERT INTO booking_outbox (idempotency_key, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+                (key, payload, now, now),
+            )
+        self.ensure_running()
+        self._wake.set()
+        return key
+
+    # ---- состояние ----
+
+    def backlog(self) -> OutboxBacklog:
+        """Сколько броней ещё не доехало до Supabase: ждут отправки и исчерпали попытки."""
+        row = self.db.connection().execute(
+            "SELECT COUNT(*) - COUNT(failed_at), COUNT(failed_at) FROM booking_outbox WHERE sent_at IS NULL"
+        ).fetchone()
+        return OutboxBacklog(int(row[0]), int(row[1]))
+
+    def oldest_pending_age(self) -> Optional[float]:
+        row = self.db.connection().execute(
+            "SELECT MIN(created_at) FROM booking_outbox WHERE sent_at IS NULL AND failed_at IS NULL"
+        ).fetchone()
+        return (time.time() - row[0]) if row and row[0] is not None else None
+
+    def pending_slots(self) -> List[Tuple[str, str, int]]:
+        """(дата, время, гости) неотправленных броней — их ещё нет в Supabase, но столы они занимают.
+
+        Записи с failed_at тоже: гость считает бронь принятой, пока её не разберут вручную.
+        """
+        rows = self.db.connection().execute("SELECT payload FROM booking_outbox WHERE sent_at IS NULL")
+        out = []
+        for (payload,) in rows:
+            b = json.loads(payload)
+            out.append((b.get("booking_date"), b.get("booking_time"), b.get("guests")))
+        return out
+
+    # ---- отправка ----
+
+    def _claim(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self.db.transaction() as con:
+            rows = con.execute(
+                "SELECT id, idempotency_key, payload, attempts, retries FROM booking_outbox "
+                "WHERE sent_at IS NULL AND failed_at IS NULL AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (now, self.batch_size),
+            ).fetchall()
+            if rows:
+                con.executemany(
+                    "UPDATE booking_outbox SET next_attempt_at = ? WHERE id = ?",
+                    [(now + self.lease_seconds, r["id"]) for r in rows],
+                )
+        return [dict(r) for r in rows]
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** min(attempts, 16)))
+        return delay * random.uniform(0.5, 1.0)
+
+    @staticmethod
+    def _error_text(e: Exception) -> str:
+        return f"{type(e).__name__}: {e}"[:500]
+
+    def flush_once(self) -> int:
+        """Отправляет одну пачку. Возвращает число принятых записей (0 — нечего слать или ошибка)."""
+        rows = self._claim()
+        if not rows:
+            return 0
+
+        batch = [{"idempotency_key": r["idempotency_key"], **json.loads(r["payload"])} for r in rows]
+        errors: Dict[int, str] = {}
+        unavailable: Dict[int, str] = {}  # сервис недоступен — попытка не засчитывается
+        try:
+            accepted = self.sender(batch) or {}
+        except Exception as e:
+            accepted = {}
+            if self.is_transient(e):
+                unavailable = {r["id"]: self._error_text(e) for r in rows}
+            elif len(rows) == 1:
+                errors = {rows[0]["id"]: self._error_text(e)}
+            else:
+                # пачка отвергнута из-за данных — ищем виноватую запись, отправляя по одной
+                outage = None
+                for r, booking in zip(rows, batch):
+                    if outage is not None:
+                        unavailable[r["id"]] = outage
+                        continue
+                    try:
+                        accepted.update(self.sender([booking]) or {})
+                    except Exception as single_error:
+                        if self.is_transient(single_error):
+                            outage = unavailable[r["id"]] = self._error_text(single_error)
+                        else:
+                            errors[r["id"]] = self._error_text(single_error)
+
+        now = time.time()
+        with self.db.transaction() as con:
+            for r in rows:
+                # пауза растёт и от отказов, и от сбоев связи
+                retry_at = now + self._backoff(r["attempts"] + r["retries"])
+                remote_id = accepted.get(r["idempotency_key"])
+                if remote_id is not None:
+                    con.execute(
+                        "UPDATE booking_outbox SET sent_at = ?, remote_id = ?, last_error = NULL WHERE id = ?",
+                        (now, int(remote_id), r["id"]),
+                    )
+                elif r["id"] in unavailable:
+                    con.execute(
+                        "UPDATE booking_outbox SET retries = retries + 1, next_attempt_at = ?, last_error = ? "
+                        "WHERE id = ?",
+                        (retry_at, unavailable[r["id"]], r["id"]),
+                    )
+                elif r["attempts"] + 1 >= self.max_attempts:
+                    con.execute(
+                        "UPDATE booking_outbox SET attempts = attempts + 1, failed_at = ?, last_error = ? WHERE id = ?",
+                        (now, errors.get(r["id"], "not acknowledged"), r["id"]),
+                    )
+                else:
+                    con.execute(
+                        "UPDATE booking_outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? "
+                        "WHERE id = ?",
+                        (retry_at, errors.get(r["id"], "not acknowledged"), r["id"]),
+                    )
+            con.execute(
+                "DELETE FROM booking_outbox WHERE sent_at IS NOT NULL AND sent_at < ?",
+                (now - self.keep_sent_seconds,),
+            )
+        return len(accepted)
+
+    def requeue_failed(self) -> int:
+        """Возвращает записи с failed_at в очередь с обнулёнными попытками (после исправления причины)."""
+        with self.db.transaction() as con:
+            count = con.execute(
+                "UPDATE booking_outbox SET failed_at = NULL, attempts = 0, retries = 0, next_attempt_at = ? "
+                "WHERE sent_at IS NULL AND failed_at IS NOT NULL",
+                (time.time(),),
+            ).rowcount
+        if count:
+            self._wake.set()
+        return count
+
+    def flush(self) -> int:
+        """Отправляет всё созревшее, пока пачки принимаются целиком (для CLI)."""
+        total = 0
+        while True:
+            sent = self.flush_once()
+            total += sent
+            if sent < self.batch_size:
+                return total
+
+    # ---- фоновый поток ----
+
+    def ensure_running(self) -> None:
+        """Запускает поток отправки в текущем процессе (после fork поток родителя не живёт)."""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="booking-outbox", daemon=True)
+            self._thread.start()
+
+    def _seconds_until_due(self) -> float:
+        row = self.db.connection().execute(
+            "SELECT MIN(next_attempt_at) FROM booking_outbox WHERE sent_at IS NULL AND failed_at IS NULL"
+        ).fetchone()
+        if not row or row[0] is None:
+            return IDLE_POLL_SECONDS
+        return max(0.05, min(IDLE_POLL_SECONDS, row[0] - time.time()))
+
+    def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                if self.flush_once() >= self.batch_size:
+                    continue
+                wait = self._seconds_until_due()
+            except Exception:
+                wait = self.base_delay
+            self._wake.wait(wait)
@@ -0,0 +1,260 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Protocol, Tuple
+
+from db import SQLiteDatabase
+
+# 16 байт случайности -> 22 символа base64url; в cookie сессии только токен и номер ревизии
+TOKEN_BYTES = 16
+
+
+class CartFull(Exception):
+    """В корзине уже max_lines разных позиций — новую не добавляем."""
+
+
+class CartState(NamedTuple):
+    revision: int
+    lines: Dict[int, int]  # id позиции -> количество; общий для кеша, менять нельзя
+    expires_at: float
+
+
+class CartBackend(Protocol):
+    """Где лежат корзины. Каждое изменение — одна строка (позиция), а не перезапись всей корзины.
+
+    Для нескольких серверов достаточно реализовать эти методы поверх общего хранилища
+    (Postgres, Redis) — кеш в CartStore сверяет ревизию и чужих изменений не пропустит.
+    """
+
+    def load(self, token: str, now: float) -> Optional[CartState]: ...
+
+    def add(
+        self, token: str, item_id: int, delta: int, expires_at: float, max_lines: Optional[int] = None
+    ) -> Tuple[int, int]: ...
+
+    def remove(self, token: str, item_id: int, expires_at: float) -> int: ...
+
+    def delete(self, token: str) -> None: ...
+
+    def touch(self, token: str, expires_at: float) -> None: ...
+
+    def purge(self, now: float) -> int: ...
+
+
+def _migration_001_carts(con) -> None:
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS carts (
+            token TEXT PRIMARY KEY,
+            revision INTEGER NOT NULL DEFAULT 0,
+            expires_at REAL NOT NULL
+        )
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS carts_expires_idx ON carts(expires_at)")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS cart_lines (
+            token TEXT NOT NULL REFERENCES carts(token) ON DELETE CASCADE,
+            item_id INTEGER NOT NULL,
+            qty INTEGER NOT NULL,
+            PRIMARY KEY (token, item_id)
+        )
+    """)
+
+
+class SQLiteCartBackend:
+    """Корзины в локальном SQLite (instance/carts.sqlite3) — общий для воркеров одного хоста."""
+
+    def __init__(self, path: Path) -> None:
+        self.db = SQLiteDatabase(path)
+        self.db.migrate([_migration_001_carts])
+
+    def load(self, token: str, now: float) -> Optional[CartState]:
+        con = self.db.connection()
+        row = con.execute("SELECT revision, expires_at FROM carts WHERE token = ?", (token,)).fetchone()
+        if row is None or row["expires_at"] <= now:
+            return None
+        # rowid — порядок добавления, как у прежнего dict в сессии
+        lines = {
+            r["item_id"]: r["qty"]
+            for r in con.execute("SELECT item_id, qty FROM cart_lines WHERE token = ? ORDER BY rowid", (token,))
+        }
+        return CartState(row["revision"], lines, row["expires_at"])
+
+    def _bump(self, con, token: str, expires_at: float) -> int:
+        # истёкшая, но ещё не вычищенная корзина не оживает: позиции уходят каскадом, ревизия с 1
+        con.execute("DELETE FROM carts WHERE token = ? AND expires_at <= ?", (token, time.time()))
+        con.execute(
+            "INSERT INTO carts (token, revision, expires_at) VALUES (?, 1, ?) "
+            "ON CONFLICT(token) DO UPDATE SET revision = revision + 1, expires_at = excluded.expires_at",
+            (token, expires_at),
+        )
+        return con.execute("SELECT revision FROM carts WHERE token = ?", (token,)).fetchone()[0]
+
+    def add(
+        self, token: str, item_id: int, delta: int, expires_at: float, max_lines: Optional[int] = None
+    ) -> Tuple[int, int]:
+        """Меняет количество на delta (может быть < 0); возвращает (ревизия, новое количество).
+
+        Новая позиция сверх max_lines — CartFull, корзина не меняется.
+        """
+        with self.db.transaction() as con:
+            revision = self._bump(con, token, expires_at)
+            if max_lines is not None and delta > 0:
+                lines = con.execute(
+                    "SELECT COUNT(*), SUM(item_id = ?) FROM cart_lines WHERE token = ?", (item_id, token)
+                ).fetchone()
+                if lines[0] >= max_lines and not lines[1]:
+                    raise CartFull(max_lines)
+            con.execute(
+                "INSERT INTO cart_lines (token, item_id, qty) VALUES (?, ?, ?) "
+                "ON CONFLICT(token, item_id) DO UPDATE SET qty = qty + excluded.qty",
+                (token, item_id, delta),
+            )
+            qty = con.execute(
+                "SELECT qty FROM cart_lines WHERE token = ? AND item_id = ?", (token, item_id)
+            ).fetchone()[0]
+            if qty <= 0:
+                con.execute("DELETE FROM cart_lines WHERE token = ? AND item_id = ?", (token, item_id))
+                qty = 0
+        return revision, qty
+
+    def remove(self, token: str, item_id: int, expires_at: float) -> int:
+        with self.db.transaction() as con:
+            revision = self._bump(con, token, expires_at)
+            con.execute("DELETE FROM cart_lines WHERE token = ? AND item_id = ?", (token, item_id))
+        return revision
+
+    def delete(self, token: str) -> None:
+        with self.db.transaction() as con:
+            con.execute("DELETE FROM carts WHERE token = ?", (token,))
+
+    def touch(self, token: str, expires_at: float) -> None:
+        with self.db.transaction() as con:
+            con.execute("UPDATE carts SET expires_at = ? WHERE token = ?", (expires_at, token))
+
+    def purge(self, now: float) -> int:
+        with self.db.transaction() as con:
+            return con.execute("DELETE FROM carts WHERE expires_at <= ?", (now,)).rowcount
+
+
+class CartStore:
+    """Корзины на сервере по короткому токену: в cookie сессии — токен и ревизия, а не содержимое.
+
+    Перед backend'ом — LRU в памяти воркера. Запись кеша годится, только если её ревизия
+    совпадает с ревизией из сессии: корзину, изменённую другим воркером, перечитаем из backend'а.
+    Своё изменение применяется к закешированной корзине на месте — без повторного чтения.
+    Срок жизни скользящий: каждое изменение и чтение во второй половине срока продлевают его на ttl.
+    """
+
+    def __init__(
+        self,
+        backend: CartBackend,
+        ttl_seconds: float = 14 * 24 * 3600,
+        cache_entries: int = 4096,
+        purge_interval: float = 3600.0,
+        max_lines: int = 50,
+    ) -> None:
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.cache_entries = cache_entries
+        self.purge_interval = purge_interval
+        self.max_lines = max_lines
+        self._cache: "OrderedDict[str, CartState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_purge = time.time() + purge_interval
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def new_token() -> str:
+        return secrets.token_urlsafe(TOKEN_BYTES)
+
+    # ---- кеш ----
+
+    def _cached(self, token: str, revision: int) -> Optional[CartState]:
+        with self._lock:
+            state = self._cache.get(token)
+            if state is None or state.revision != revision:
+                return None
+            self._cache.move_to_end(token)
+            return state
+
+    def _remember(self, token: str, state: CartState) -> None:
+        with self._lock:
+            self._cache[token] = state
+            self._cache.move_to_end(token)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    def _apply(self, token: str, revision: int, item_id: int, qty: int, expires_at: float) -> None:
+        """Кеш после своего изменения: правим копию, если в кеше была предыдущая ревизия, иначе забываем."""
+        with self._lock:
+            state = self._cache.pop(token, None)
+        if state is None or state.revision != revision - 1:
+            return
+        lines = dict(state.lines)
+        if qty > 0:
+            lines[item_id] = qty
+        else:
+            lines.pop(item_id, None)
+        self._remember(token, CartState(revision, lines, expires_at))
+
+    # ---- чтение и изменения ----
+
+    def get(self, token: str, revision: int) -> Dict[int, int]:
+        """Содержимое корзины (не менять!); неизвестный или истёкший токен — пустая корзина."""
+        now = time.time()
+        state = self._cached(token, revision)
+        if state is None:
+            self.misses += 1
+            state = self.backend.load(token, now)
+            if state is None:
+                return {}
+            self._remember(token, state)
+        else:
+            self.hits += 1
+        if state.expires_at <= now:
+            return {}
+        if state.expires_at - now < self.ttl_seconds / 2:
+            expires_at = now + self.ttl_seconds
+            self.backend.touch(token, expires_at)
+            self._remember(token, state._replace(expires_at=expires_at))
+        return state.lines
+
+    def add(self, token: str, item_id: int, delta: int) -> int:
+        """Прибавляет delta к количеству (отрицательное — убавляет, до нуля — удаляет); вернёт ревизию.
+
+        Новая позиция в корзине, где уже max_lines позиций, — CartFull.
+        """
+        expires_at = self._expiry()
+        revision, qty = self.backend.add(token, item_id, delta, expires_at, self.max_lines)
+        self._apply(token, revision, item_id, qty, expires_at)
+        return revision
+
+    def remove(self, token: str, item_id: int) -> int:
+        expires_at = self._expiry()
+        revision = self.backend.remove(token, item_id, expires_at)
+        self._apply(token, revision, item_id, 0, expires_at)
+        return revision
+
+    def clear(self, token: str) -> None:
+        self.backend.delete(token)
+        with self._lock:
+            self._cache.pop(token, None)
+
+    def _expiry(self) -> float:
+        now = time.time()
+        if now >= self._next_purge:
+            # истёкшие корзины чистим попутно, не чаще раза в purge_interval на воркер
+            self._next_purge = now + self.purge_interval
+            self.backend.purge(now)
+        return now + self.ttl_seconds
+
+    def purge(self) -> int:
+        with self._lock:
+            self._cache.clear()
+        return self.backend.purge(time.time())
+
+    def __len__(self) -> int:
+        return len(self._cache)
@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Tuple, Type, TypeVar
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Вызов не выполнялся: сервис недавно падал, ждём пробного запроса."""
+
+
+class CircuitBreaker:
+    """Предохранитель для внешнего сервиса.
+
+    closed — вызовы идут как есть; после failure_threshold ошибок подряд — open.
+    open — вызовы сразу получают CircuitOpenError (вызывающий код отдаёт fallback без ожидания
+    таймаута); через reset_timeout один вызов пропускается как проба (half_open).
+    Проба удалась — снова closed, нет — open на следующий reset_timeout.
+
+    Ошибкой считаются только исключения из trip_on (сеть, таймауты, 5xx) — ответ
+    «неверный запрос» означает, что сервис жив.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 15.0,
+        trip_on: Tuple[Type[BaseException], ...] = (Exception,),
+        window: int = 100,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.trip_on = trip_on
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        # счётчики
+        self._calls = 0
+        self._failures = 0
+        self._rejected = 0
+        self._opened_total = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._recent: "deque[bool]" = deque(maxlen=window)  # True — ошибка
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def _admit(self) -> Tuple[bool, bool]:
+        """(можно ли звать, это ли пробный вызов)."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True, False
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True, True
+            self._rejected += 1
+            return False, False
+
+    def _record(self, failed: bool, elapsed: float, probe: bool) -> None:
+        with self._lock:
+            self._calls += 1
+            self._latency_total += elapsed
+            self._latency_max = max(self._latency_max, elapsed)
+            self._recent.append(failed)
+            if probe:
+                self._probe_in_flight = False
+
+            if not failed:
+                self._consecutive_failures = 0
+                # запоздавший успех, начатый до размыкания, цепь не замыкает — это дело пробы
+                if self._state != OPEN:
+                    self._state = CLOSED
+                return
+
+            self._failures += 1
+            self._consecutive_failures += 1
+            if probe or self._consecutive_failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._opened_total += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def call(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        allowed, probe = self._admit()
+        if not allowed:
+            raise CircuitOpenError(f"{self.name}: circuit open")
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except self.trip_on:
+            self._record(True, time.perf_counter() - started, probe)
+            raise
+        except BaseException:
+            # сервис ответил (например, ошибкой валидации) — для предохранителя это успех
+            self._record(False, time.perf_counter() - started, probe)
+            raise
+        self._record(False, time.perf_counter() - started, probe)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = len(self._recent)
+            return {
+                "name": self.name,
+                "state": self._state,
+                "calls": self._calls,
+                "failures": self._failures,
+                "rejected": self._rejected,
+                "opened_total": self._opened_total,
+                "consecutive_failures": self._consecutive_failures,
+                "error_rate": (sum(self._recent) / recent) if recent else 0.0,
+                "latency_avg_ms": (self._latency_total / self._calls * 1000) if self._calls else 0.0,
+                "latency_max_ms": self._latency_max * 1000,
+            }
@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, Sequence
+
+Migration = Callable[[sqlite3.Connection], None]
+
+BUSY_TIMEOUT_MS = 5000
+
+
+class SQLiteDatabase:
+    """Доступ к SQLite-файлу: одно соединение на поток, WAL, миграции по PRAGMA user_version.
+
+    Соединения работают в autocommit (isolation_level=None); запись — только через
+    transaction(), который берёт BEGIN IMMEDIATE. Так писатели из разных gunicorn-воркеров
+    ждут друг друга в busy_timeout, а не ловят 'database is locked' при апгрейде блокировки.
+    """
+
+    def __init__(self, path: Path, synchronous: str = "NORMAL") -> None:
+        self.path = Path(path)
+        self.synchronous = synchronous
+        self._local = threading.local()
+
+    def _open(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        con = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        con.row_factory = sqlite3.Row
+        con.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        con.execute("PRAGMA journal_mode = WAL")
+        # в WAL режим NORMAL не теряет целостность, fsync только на checkpoint; последние коммиты
+        # при отключении питания могут пропасть — где это недопустимо, передают synchronous="FULL"
+        con.execute(f"PRAGMA synchronous = {self.synchronous}")
+        con.execute("PRAGMA foreign_keys = ON")
+        return con
+
+    def connection(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        # после fork (gunicorn --preload) соединение родителя использовать нельзя
+        if con is None or self._local.pid != os.getpid():
+            con = self._open()
+            self._local.con = con
+            self._local.pid = os.getpid()
+        return con
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        con = self.connection()
+        if con.in_transaction:
+            # вложенный вызов — работаем в уже открытой транзакции
+            yield con
+            return
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            yield con
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        con.execute("COMMIT")
+
+    def migrate(self, migrations: Sequence[Migration]) -> int:
+        """Применяет миграции с номером больше user_version (migrations[0] — версия 1).
+
+        Вся пачка идёт в одной IMMEDIATE-транзакции, поэтому воркеры, стартующие
+        одновременно, выполнят её ровно один раз.
+        """
+        with self.transaction() as con:
+            version = con.execute("PRAGMA user_version").fetchone()[0]
+            for number, migration in enumerate(migrations, start=1):
+                if number <= version:
+                    continue
+                migration(con)
+                con.execute(f"PRAGMA user_version = {number}")
+                version = number
+        return version
+
+    def close(self) -> None:
+        con = getattr(self._local, "con", None)
+        if con is not None:
+            con.close()
+            self._local.con = None
+
+
+def table_columns(con: sqlite3.Connection, table: str) -> set:
+    cols = set()
+    cur = con.execute(f"PRAGMA table_info({table})")
+    for row in cur.fetchall():
+        # row: (cid, name, type, notnull, dflt_value, pk)
+        cols.add(row[1])
+    return cols
+
+
+def ensure_column(con: sqlite3.Connection, table: str, col: str, col_sql: str) -> None:
+    if col not in table_columns(con, table):
+        con.execute(f"ALTER TABLE {table} ADD COLUMN {col} {col_sql}")
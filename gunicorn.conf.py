@@ -0,0 +1,11 @@
+# gunicorn подхватывает этот файл сам, если запускать из корня проекта: gunicorn app:app
+
+
+def post_worker_init(worker):
+    """Воркер загрузил приложение, но ещё не принимает соединения — прогреваем его здесь."""
+    from app import warm_up
+
+    steps = warm_up()
+    worker.log.info(
+        "воркер %s прогрет: %s", worker.pid, ", ".join(f"{step}={sec * 1000:.0f}ms" for step, sec in steps.items())
+    )
@@ -0,0 +1,93 @@
+from pathlib import Path
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Ширины вариантов: миниатюра в корзине (110px @2x), карточка меню (~300px @2x), страница блюда
+VARIANT_WIDTHS = {"thumb": 240, "card": 640, "hero": 1280}
+VARIANTS_DIR = "variants"
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+
+class ImageProcessingError(ValueError):
+    pass
+
+
+def resolve_static(static_root: Path, src_rel: str) -> Optional[Path]:
+    """Путь static/<src_rel> после resolve(); None, если он выходит за static (../, симлинки)."""
+    root = Path(static_root).resolve()
+    path = (root / (src_rel or "").lstrip("/")).resolve()
+    return path if path.is_relative_to(root) else None
+
+
+def _variant_path(src_rel: str, width: int, ext: str) -> str:
+    src = Path(src_rel)
+    return (src.parent / VARIANTS_DIR / f"{src.stem}-{width}.{ext}").as_posix()
+
+
+def generate_variants(static_root: Path, src_rel: str, reuse_existing: bool = False) -> Dict[str, Dict[str, object]]:
+    """Нарезает картинку static/<src_rel> на варианты по ширине в WebP + JPEG/PNG (fallback).
+
+    Возвращает запись для хранения рядом с image_path::
+
+        {"thumb": {"w": 240, "webp": "uploads/variants/x-240.webp", "fallback": "uploads/variants/x-240.jpg"}, ...}
+
+    Больше оригинала не растягиваем: если картинка уже узкой, варианты получат её ширину.
+    reuse_existing — не пересохранять уже нарезанные файлы (для путей по хешу содержимого).
+    """
+    src_rel = src_rel.lstrip("/")
+    src_path = resolve_static(static_root, src_rel)
+    if src_path is None:
+        raise ImageProcessingError(f"Путь {src_rel} выходит за пределы static")
+    try:
+        with Image.open(src_path) as im:
+            im = ImageOps.exif_transpose(im)
+            has_alpha = im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info)
+            im = im.convert("RGBA" if has_alpha else "RGB")
+            fallback_ext = "png" if has_alpha else "jpg"
+
+            out: Dict[str, Dict[str, object]] = {}
+            rendered: Dict[int, Dict[str, object]] = {}
+            for name, target in VARIANT_WIDTHS.items():
+                width = min(target, im.width)
+                if width not in rendered:
+                    rendered[width] = _render(im, static_root, src_rel, width, fallback_ext, reuse_existing)
+                out[name] = rendered[width]
+            return out
+    except (UnidentifiedImageError, OSError) as e:
+        raise ImageProcessingError(f"Не удалось обработать изображение {src_rel}: {e}") from e
+
+
+def _render(
+    im: Image.Image, static_root: Path, src_rel: str, width: int, fallback_ext: str, reuse_existing: bool
+) -> Dict[str, object]:
+    webp_rel = _variant_path(src_rel, width, "webp")
+    fallback_rel = _variant_path(src_rel, width, fallback_ext)
+    result = {"w": width, "webp": webp_rel, "fallback": fallback_rel}
+    if reuse_existing and (Path(static_root) / webp_rel).is_file() and (Path(static_root) / fallback_rel).is_file():
+        return result
+
+    height = max(1, round(im.height * width / im.width))
+    resized = im if width == im.width else im.resize((width, height), Image.LANCZOS)
+    (Path(static_root) / webp_rel).parent.mkdir(parents=True, exist_ok=True)
+
+    resized.save(Path(static_root) / webp_rel, "WEBP", quality=WEBP_QUALITY, method=6)
+    if fallback_ext == "png":
+        resized.save(Path(static_root) / fallback_rel, "PNG", optimize=True)
+    else:
+        resized.save(Path(static_root) / fallback_rel, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return result
+
+
+def variants_for(static_root: Path, src_rel: str) -> Optional[Dict[str, Dict[str, object]]]:
+    """Варианты для уже лежащей в static картинки; None — если файла нет или он не картинка."""
+    src_rel = (src_rel or "").lstrip("/")
+    src_path = resolve_static(static_root, src_rel) if src_rel else None
+    if src_path is None or not src_path.is_file():
+        return None
+    try:
+        return generate_variants(static_root, src_rel)
+    except ImageProcessingError:
+        return None
@@ -0,0 +1,96 @@
+import threading
+import time
+from typing import Any, Callable, NamedTuple, Optional
+
+
+class Snapshot(NamedTuple):
+    version: int
+    value: Any
+
+
+class _Flight:
+    """Одна загрузка, которую ждут все конкурентные промахи."""
+
+    def __init__(self, generation: int) -> None:
+        self.generation = generation
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class StaleWhileRevalidateCache:
+    """Версионированный кеш: отдаёт устаревшую копию, пока один фоновый поток её обновляет.
+
+    - свежая копия (моложе fresh_seconds) отдаётся сразу;
+    - устаревшая тоже отдаётся сразу, а обновление уходит в фон (не больше одного за раз);
+    - если копии нет или она инвалидирована — все ждут одну общую загрузку (single-flight);
+    - invalidate() не блокирует: следующий get() гарантированно получит данные,
+      загруженные уже после инвалидации.
+    """
+
+    def __init__(self, loader: Callable[[], Any], fresh_seconds: float = 30.0, retry_seconds: float = 5.0) -> None:
+        self._loader = loader
+        self._fresh_seconds = fresh_seconds
+        self._retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Snapshot] = None
+        self._snapshot_generation = -1
+        self._generation = 0
+        self._refresh_at = 0.0
+        self._flight: Optional[_Flight] = None
+
+    @property
+    def version(self) -> int:
+        snap = self._snapshot
+        return snap.version if snap is not None else 0
+
+    def get(self) -> Snapshot:
+        while True:
+            with self._lock:
+                snap = self._snapshot
+                if snap is not None and self._snapshot_generation == self._generation:
+                    if self._flight is None and time.monotonic() >= self._refresh_at:
+                        flight = self._start_flight()
+                        threading.Thread(target=self._run, args=(flight,), daemon=True).start()
+                    return snap
+
+                flight = self._flight
+                owner = flight is None
+                if owner:
+                    flight = self._start_flight()
+
+            if owner:
+                self._run(flight)
+            else:
+                flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            # загрузка могла начаться до invalidate() — тогда проверяем ещё раз
+
+    def invalidate(self) -> None:
+        """Помечает текущую копию недействительной (например, после записи из админки)."""
+        with self._lock:
+            self._generation += 1
+
+    def _start_flight(self) -> _Flight:
+        flight = _Flight(self._generation)
+        self._flight = flight
+        return flight
+
+    def _run(self, flight: _Flight) -> None:
+        try:
+            value = self._loader()
+        except BaseException as e:  # noqa: BLE001 — ошибку получат ожидающие
+            with self._lock:
+                self._flight = None
+                self._refresh_at = time.monotonic() + self._retry_seconds
+            flight.error = e
+            flight.done.set()
+            return
+
+        with self._lock:
+            prev = self._snapshot
+            self._snapshot = Snapshot((prev.version if prev else 0) + 1, value)
+            self._snapshot_generation = flight.generation
+            self._refresh_at = time.monotonic() + self._fresh_seconds
+            self._flight = None
+        flight.done.set()
@@ -0,0 +1,96 @@
+import sys
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from menu_search import MenuSearchIndex
+from records import MenuItem
+
+
+class MenuCatalog:
+    """Снимок меню для одной версии: индекс по id, группы по категориям, готовые цены и поиск.
+
+    Строится один раз на версию меню и дальше только читается; позиции — неизменяемые
+    MenuItem, поисковый индекс (search_index) собирается вместе с ними. Подробности блюда
+    (вино), если их нет в снимке, догружаются через detail() и запоминаются до следующей версии.
+    """
+
+    def __init__(
+        self,
+        version: Hashable,
+        categories: List[Dict[str, Any]],
+        items: List[Dict[str, Any]],
+        to_cents: Callable[[str], int],
+        fmt: Callable[[int], str],
+    ) -> None:
+        self.version = version
+        self._to_cents = to_cents
+        self._fmt = fmt
+
+        self.categories: Tuple[Dict[str, Any], ...] = tuple(
+            {"slug": c.get("slug"), "label": c.get("label")} for c in (categories or [])
+        )
+        self.slugs = frozenset(c["slug"] for c in self.categories)
+
+        prepared = []
+        for raw in items or []:
+            try:
+                prepared.append(self.prepare(raw))
+            except (TypeError, ValueError):
+                continue
+        self.items: Tuple[MenuItem, ...] = tuple(prepared)
+        self.by_id: Dict[int, MenuItem] = {item.id: item for item in prepared}
+
+        grouped: Dict[str, List[MenuItem]] = {c["slug"]: [] for c in self.categories}
+        for item in prepared:
+            grouped.setdefault(item.cat, []).append(item)
+        self.grouped: Dict[str, Tuple[MenuItem, ...]] = {k: tuple(v) for k, v in grouped.items()}
+        self.search_index = MenuSearchIndex(self.items)
+        self._details: Dict[int, MenuItem] = {}
+
+    def prepare(self, raw: Dict[str, Any]) -> MenuItem:
+        """Запись MenuItem из сырой позиции (JSON/Supabase) с посчитанной ценой."""
+        try:
+            cents = int(raw.get("price_cents") or 0)
+        except (TypeError, ValueError):
+            cents = 0
+        if cents <= 0:
+            cents = self._to_cents(str(raw.get("price") or ""))
+        return MenuItem(
+            id=int(raw.get("id") or 0),
+            # slug категории повторяется у десятков позиций — храним одну строку
+            cat=sys.intern(str(raw.get("cat") or "")),
+            title=raw.get("title") or "",
+            price_cents=cents,
+            price=self._fmt(cents),
+            desc=raw.get("desc") or "",
+            img=(raw.get("img") or "img/placeholder.jpg").lstrip("/"),
+            img_variants=raw.get("img_variants") or {},
+            ingredients=tuple(raw.get("ingredients") or ()),
+            allergens=tuple(raw.get("allergens") or ()),
+            wine_title=raw.get("wine_title") or "",
+            wine_text=raw.get("wine_text") or "",
+        )
+
+    def get(self, item_id: int) -> Optional[MenuItem]:
+        try:
+            return self.by_id.get(int(item_id))
+        except (TypeError, ValueError):
+            return None
+
+    def detail(self, item_id: int, fetch: Callable[[int], Optional[Dict[str, Any]]]) -> Optional[MenuItem]:
+        """Позиция со всеми полями: fetch(id) -> сырая позиция или None (тогда — то, что есть в снимке)."""
+        try:
+            item_id = int(item_id)
+        except (TypeError, ValueError):
+            return None
+        item = self._details.get(item_id)
+        if item is not None:
+            return item
+        raw = fetch(item_id)
+        if raw is None:
+            return self.by_id.get(item_id)
+        item = self.prepare(raw)
+        self._details[item_id] = item
+        return item
+
+    def __len__(self) -> int:
+        return len(self.items)
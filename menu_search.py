@@ -0,0 +1,118 @@
+import re
+from bisect import bisect_left
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from records import MenuItem
+
+_WORD_RE = re.compile(r"[^\W_]+")
+
+
+def normalize(text: str) -> str:
+    """Регистр и ё/е не различаем: «Ёжик» и «ежик» — одно слово."""
+    return (text or "").casefold().replace("ё", "е")
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD_RE.findall(normalize(text))
+
+
+class MenuSearchIndex:
+    """Обратный индекс меню: слово -> номера позиций; строится один раз на версию каталога.
+
+    Ищем по названию, описанию, составу и аллергенам; каждое слово запроса — префикс
+    («сыр» найдёт «сырный»), слова объединяются по И. Аллергены позиции — битовая маска
+    (бит на аллерген), исключение «без орехов» — одна операция & на позицию.
+    """
+
+    def __init__(self, items: Sequence[MenuItem]) -> None:
+        self.items: Tuple[MenuItem, ...] = tuple(items)
+
+        postings: Dict[str, Set[int]] = {}
+        title_postings: Dict[str, Set[int]] = {}
+        labels: Dict[str, str] = {}  # нормализованный аллерген -> как его написали впервые
+        for pos, item in enumerate(self.items):
+            for word in tokenize(item.title):
+                title_postings.setdefault(word, set()).add(pos)
+            text = " ".join((item.title, item.desc, *item.ingredients, *item.allergens))
+            for word in tokenize(text):
+                postings.setdefault(word, set()).add(pos)
+            for name in item.allergens:
+                labels.setdefault(normalize(name).strip(), name.strip())
+        labels.pop("", None)
+
+        self._postings: Dict[str, FrozenSet[int]] = {w: frozenset(p) for w, p in postings.items()}
+        self._title_postings: Dict[str, FrozenSet[int]] = {w: frozenset(p) for w, p in title_postings.items()}
+        self._vocab: List[str] = sorted(self._postings)
+        self._title_vocab: List[str] = sorted(self._title_postings)
+
+        keys = sorted(labels)
+        self._allergen_bits: Dict[str, int] = {key: 1 << i for i, key in enumerate(keys)}
+        self.allergens: Tuple[str, ...] = tuple(labels[key] for key in keys)
+        self._masks: Tuple[int, ...] = tuple(
+            self._mask_of(normalize(name).strip() for name in item.allergens) for item in self.items
+        )
+
+    def _mask_of(self, keys: Iterable[str]) -> int:
+        mask = 0
+        for key in keys:
+            mask |= self._allergen_bits.get(key, 0)
+        return mask
+
+    def _prefix(self, prefix: str, postings: Dict[str, FrozenSet[int]], vocab: Sequence[str]) -> Set[int]:
+        found: Set[int] = set()
+        i = bisect_left(vocab, prefix)
+        while i < len(vocab) and vocab[i].startswith(prefix):
+            found |= postings[vocab[i]]
+            i += 1
+        return found
+
+    def allergen_mask(self, names: Iterable[str]) -> int:
+        """Маска аллергенов по названиям из запроса; «орех» совпадёт с «Орехи» (префикс)."""
+        mask = 0
+        for name in names:
+            wanted = normalize(name).strip()
+            if not wanted:
+                continue
+            for key, bit in self._allergen_bits.items():
+                if key.startswith(wanted) or any(w.startswith(wanted) for w in key.split()):
+                    mask |= bit
+        return mask
+
+    def allergen_names(self, mask: int) -> List[str]:
+        return [label for i, label in enumerate(self.allergens) if mask >> i & 1]
+
+    def search(
+        self,
+        query: str = "",
+        exclude_mask: int = 0,
+        cat: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[MenuItem]:
+        """Позиции по запросу без аллергенов из exclude_mask; совпадения в названии — выше, дальше порядок меню."""
+        words = tokenize(query)
+        if words:
+            candidates: Optional[Set[int]] = None
+            for word in words:
+                hits = self._prefix(word, self._postings, self._vocab)
+                candidates = hits if candidates is None else candidates & hits
+                if not candidates:
+                    return []
+        else:
+            candidates = set(range(len(self.items)))
+
+        masks = self._masks
+        positions = [
+            pos for pos in candidates
+            if not masks[pos] & exclude_mask and (cat is None or self.items[pos].cat == cat)
+        ]
+        if words:
+            title_hits = [self._prefix(word, self._title_postings, self._title_vocab) for word in words]
+            positions.sort(key=lambda pos: (-sum(pos in hits for hits in title_hits), pos))
+        else:
+            positions.sort()
+        if limit is not None:
+            positions = positions[:limit]
+        return [self.items[pos] for pos in positions]
+
+    def __len__(self) -> int:
+        return len(self.items)
@@ -0,0 +1,146 @@
+import json
+import mmap
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator, NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: локальная разработка, один процесс
+    fcntl = None
+
+_MAGIC = b"MENUSNAP"
+
+
+class SharedValue(NamedTuple):
+    version: int
+    published_at: float
+    dirty_generation: int
+    value: Any
+
+
+class SharedSnapshot:
+    """Снимок меню в одном файле, общий для всех gunicorn-воркеров на хосте.
+
+    Формат: строка заголовка ``MENUSNAP <version> <published_at> <dirty_gen>``, затем JSON.
+    Файл публикуется атомарно (temp + os.replace); воркеры мапят его только на чтение
+    и заново разбирают JSON лишь когда в заголовке новая версия.
+
+    Рядом лежит ``<name>.dirty`` — каждая запись в меню дописывает в него один байт
+    (O_APPEND атомарен, блокировки не нужны). Снимок, собранный до последней записи
+    (``dirty_generation`` меньше размера файла), считается устаревшим.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.dirty_path = self.path.with_name(self.path.name + ".dirty")
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread_lock = threading.Lock()
+        self._current: Optional[SharedValue] = None
+        self._stamp: Optional[tuple] = None
+
+    # ---- чтение ----
+
+    def _stat_stamp(self) -> Optional[tuple]:
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def read(self) -> Optional[SharedValue]:
+        """Текущий снимок; JSON разбирается только если версия на диске поменялась."""
+        stamp = self._stat_stamp()
+        if stamp is None:
+            return None
+        if stamp == self._stamp and self._current is not None:
+            return self._current
+
+        try:
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                header = mm.readline().split()
+                if len(header) != 4 or header[0] != _MAGIC:
+                    return self._current
+                version = int(header[1])
+                current = self._current
+                if current is not None and current.version == version:
+                    snap = current
+                else:
+                    value = json.loads(mm[mm.tell():])
+                    snap = SharedValue(version, float(header[2]), int(header[3]), value)
+        except (OSError, ValueError):
+            return self._current
+
+        self._current = snap
+        self._stamp = stamp
+        return snap
+
+    def changed(self) -> bool:
+        """Дёшево (один stat): опубликовал ли кто-то новую версию после нашего чтения."""
+        return self._stat_stamp() != self._stamp
+
+    def dirty_generation(self) -> int:
+        try:
+            return self.dirty_path.stat().st_size
+        except OSError:
+            return 0
+
+    def is_stale(self, snap: SharedValue, max_age: float) -> bool:
+        if self.dirty_generation() > snap.dirty_generation:
+            return True
+        return time.time() - snap.published_at >= max_age
+
+    # ---- запись ----
+
+    def mark_dirty(self) -> None:
+        fd = os.open(self.dirty_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, b".")
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def leader(self) -> Iterator[None]:
+        """Эксклюзивное право обновить снимок: за данными в Supabase ходит один процесс."""
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_path, "a+b") as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def publish(self, value: Any, dirty_generation: int) -> SharedValue:
+        """Атомарно записывает новую версию. Вызывать внутри leader()."""
+        prev = self.read()
+        version = (prev.version if prev else 0) + 1
+        published_at = time.time()
+        body = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        header = b"%s %d %.6f %d\n" % (_MAGIC, version, published_at, dirty_generation)
+
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name + ".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+                f.write(body)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        snap = SharedValue(version, published_at, dirty_generation, value)
+        self._current = snap
+        self._stamp = self._stat_stamp()
+        return snap
@@ -0,0 +1,145 @@
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: локальная разработка, один процесс
+    fcntl = None
+
+
+def _as_int(value: Any) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class MenuData:
+    """Изменяемая копия меню внутри JsonMenuStore.edit()."""
+
+    def __init__(self, categories: List[Dict[str, Any]], items: List[Dict[str, Any]], next_id: int) -> None:
+        self.categories = categories
+        self.items = items
+        self._next_id = next_id
+
+    def allocate_id(self) -> int:
+        """Новый id позиции. Уникален между процессами: вызывается только под блокировкой файла."""
+        new_id = self._next_id
+        self._next_id += 1
+        return new_id
+
+
+class JsonMenuStore:
+    """menu_data.json: разобранное содержимое кешируется по mtime/size/inode файла.
+
+    Читатели получают общий кеш (его нельзя менять), запись — только через edit():
+    блокировка <name>.lock (flock, между воркерами), свежее чтение с диска, запись во
+    временный файл и os.replace — читатель никогда не увидит недописанный JSON.
+    """
+
+    def __init__(self, path: Path, default_categories: List[Dict[str, Any]]) -> None:
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self.default_categories = default_categories
+        self._thread_lock = threading.Lock()
+        # (stamp, (categories, items, next_id)) одним атрибутом: данные и их stat меняются атомарно
+        self._cached: Optional[Tuple[tuple, Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]]] = None
+
+    def _file_stamp(self) -> Optional[tuple]:
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def version(self) -> tuple:
+        return ("json",) + (self._file_stamp() or (0, 0, 0))
+
+    def _read_file(self) -> Optional[Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        cats = data.get("categories") if isinstance(data, dict) else None
+        # категории — признак валидного файла; пустой список items тоже валиден
+        if not isinstance(cats, list) or not cats:
+            return None
+        items = data.get("items")
+        items = items if isinstance(items, list) else []
+        next_id = max(_as_int(data.get("next_id")), max((_as_int(x.get("id")) for x in items), default=0) + 1)
+        return cats, items, next_id
+
+    def load(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """(categories, items) — общий кеш, не менять. Файла нет или он битый — пишем дефолтные категории."""
+        _, categories, items = self.load_versioned()
+        return categories, items
+
+    def load_versioned(self) -> Tuple[tuple, List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """(version, categories, items): версия — от того же stat, что и прочитанные данные.
+
+        stat берётся до чтения: если файл заменили между ними, данные окажутся новее версии
+        и следующий вызов просто перечитает файл. Наоборот (старые данные с новой версией) не бывает.
+        """
+        stamp = self._file_stamp()
+        cached = self._cached
+        if cached is not None and stamp is not None and stamp == cached[0]:
+            return ("json",) + stamp, cached[1][0], cached[1][1]
+
+        parsed = self._read_file() if stamp is not None else None
+        if parsed is None:
+            with self.edit():
+                pass  # edit() сам создаст файл с дефолтными категориями
+            return self.load_versioned()
+        self._cached = (stamp, parsed)
+        return ("json",) + stamp, parsed[0], parsed[1]
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.lock_path, "a+b") as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    @contextmanager
+    def edit(self) -> Iterator[MenuData]:
+        """Транзакция над файлом: изменения из блока записываются атомарно; исключение — ничего не пишем."""
+        with self._locked():
+            # читаем заново (не из кеша): между load() и edit() файл мог поменять другой воркер
+            parsed = self._read_file()
+            if parsed is None:
+                parsed = ([dict(c) for c in self.default_categories], [], 1)
+            data = MenuData(*parsed)
+            yield data
+            self._write(data)
+
+    def _write(self, data: MenuData) -> None:
+        payload = {"categories": data.categories, "items": data.items, "next_id": data._next_id}
+        body = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name + ".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(body)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        # свой же кеш сбрасываем сразу: mtime в пределах одной «тики» ФС может не смениться
+        self._cached = None
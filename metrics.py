@@ -0,0 +1,204 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# границы корзин гистограмм, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class RequestTimings:
+    """Разбивка времени одного запроса: фаза -> (секунды, вызовы) и счётчики событий.
+
+    Фазы могут вкладываться (supabase внутри cart), поэтому их сумма не обязана равняться total.
+    """
+
+    __slots__ = ("started", "phases", "calls", "events")
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.events: Dict[str, int] = {}
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing: `supabase;dur=12.3;desc="2 calls", ..., total;dur=40.1`."""
+        parts = []
+        for phase, seconds in self.phases.items():
+            calls = self.calls[phase]
+            desc = f';desc="{calls} calls"' if calls > 1 else ""
+            parts.append(f"{phase};dur={seconds * 1000:.1f}{desc}")
+        for event, n in self.events.items():
+            parts.append(f'{event};desc="{n}"')
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+    def breakdown(self) -> str:
+        """Для лога медленных запросов: `supabase=12ms×2 render=8ms menu_cache_hit=1`."""
+        parts = [
+            f"{phase}={seconds * 1000:.0f}ms" + (f"×{self.calls[phase]}" if self.calls[phase] > 1 else "")
+            for phase, seconds in sorted(self.phases.items(), key=lambda kv: -kv[1])
+        ]
+        parts += [f"{event}={n}" for event, n in self.events.items()]
+        return " ".join(parts)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def begin_request() -> RequestTimings:
+    timings = RequestTimings()
+    _current.set(timings)
+    return timings
+
+
+def end_request() -> None:
+    _current.set(None)
+
+
+def current_request() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """Засекает блок как фазу текущего запроса; вне запроса (фоновые потоки) ничего не делает."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, time.perf_counter() - started)
+
+
+def count_event(name: str) -> None:
+    """Счётчик события в текущем запросе (menu_cache_hit, page_cache_miss, ...)."""
+    timings = _current.get()
+    if timings is not None:
+        timings.events[name] = timings.events.get(name, 0) + 1
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: object) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class MetricsRegistry:
+    """Агрегаты по маршрутам (в пределах процесса) для /admin/metrics в формате Prometheus."""
+
+    def __init__(self, prefix: str = "app", buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests: Dict[Tuple[str, str, str], int] = {}
+        self._durations: Dict[str, Histogram] = {}
+        self._phases: Dict[Tuple[str, str], Histogram] = {}
+        self._phase_calls: Dict[Tuple[str, str], int] = {}
+        self._events: Dict[Tuple[str, str], int] = {}
+
+    def observe(self, route: str, method: str, status: int, timings: RequestTimings) -> None:
+        total = timings.elapsed()
+        with self._lock:
+            key = (route, method, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+            hist = self._durations.get(route)
+            if hist is None:
+                hist = self._durations[route] = Histogram(self.buckets)
+            hist.observe(total)
+            for phase, seconds in timings.phases.items():
+                pkey = (route, phase)
+                phist = self._phases.get(pkey)
+                if phist is None:
+                    phist = self._phases[pkey] = Histogram(self.buckets)
+                phist.observe(seconds)
+                self._phase_calls[pkey] = self._phase_calls.get(pkey, 0) + timings.calls[phase]
+            for name, n in timings.events.items():
+                ekey = (route, name)
+                self._events[ekey] = self._events.get(ekey, 0) + n
+
+    def _histogram_lines(self, name: str, series: Dict[tuple, Histogram], label_names: Tuple[str, ...]) -> List[str]:
+        lines = []
+        for key, hist in sorted(series.items()):
+            labels = dict(zip(label_names, key if isinstance(key, tuple) else (key,)))
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), hist.counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(**labels, le=str(bound))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(**labels)} {hist.sum:.6f}")
+            lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+        return lines
+
+    def render(self, gauges: Iterable[Tuple[str, str, float, Dict[str, str]]] = ()) -> str:
+        """Текст для Prometheus; gauges — (имя, описание, значение, метки) от вызывающего кода."""
+        p = self.prefix
+        with self._lock:
+            out = [
+                f"# HELP {p}_requests_total Обработанные запросы.",
+                f"# TYPE {p}_requests_total counter",
+            ]
+            for (route, method, status), n in sorted(self._requests.items()):
+                out.append(f"{p}_requests_total{_labels(route=route, method=method, status=status)} {n}")
+
+            out += [
+                f"# HELP {p}_request_duration_seconds Время ответа по маршрутам.",
+                f"# TYPE {p}_request_duration_seconds histogram",
+            ]
+            out += self._histogram_lines(f"{p}_request_duration_seconds", self._durations, ("route",))
+
+            out += [
+                f"# HELP {p}_phase_duration_seconds Время фазы за запрос (supabase, menu, cart, render).",
+                f"# TYPE {p}_phase_duration_seconds histogram",
+            ]
+            out += self._histogram_lines(f"{p}_phase_duration_seconds", self._phases, ("route", "phase"))
+
+            out += [
+                f"# HELP {p}_phase_calls_total Вызовы фазы (например, запросы в Supabase).",
+                f"# TYPE {p}_phase_calls_total counter",
+            ]
+            for (route, phase), n in sorted(self._phase_calls.items()):
+                out.append(f"{p}_phase_calls_total{_labels(route=route, phase=phase)} {n}")
+
+            out += [
+                f"# HELP {p}_events_total События запросов (попадания/промахи кешей).",
+                f"# TYPE {p}_events_total counter",
+            ]
+            for (route, name), n in sorted(self._events.items()):
+                out.append(f"{p}_events_total{_labels(route=route, event=name)} {n}")
+
+        seen = set()
+        for name, help_text, value, labels in gauges:
+            if name not in seen:
+                seen.add(name)
+                out += [f"# HELP {p}_{name} {help_text}", f"# TYPE {p}_{name} gauge"]
+            out.append(f"{p}_{name}{_labels(**labels) if labels else ''} {value}")
+        return "\n".join(out) + "\n"
@@ -0,0 +1,100 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Callable, Hashable, Optional
+
+from flask import Request, Response, current_app, request, session
+
+
+@dataclass(frozen=True)
+class CachedPage:
+    body: bytes
+    content_type: str
+    etag: str
+    last_modified: datetime
+
+    @classmethod
+    def from_response(cls, response: Response) -> "CachedPage":
+        body = response.get_data()
+        return cls(
+            body=body,
+            content_type=response.content_type,
+            etag=hashlib.sha256(body).hexdigest()[:32],
+            last_modified=datetime.now(timezone.utc).replace(microsecond=0),
+        )
+
+    def to_response(self, request: Request) -> Response:
+        """Ответ со strong ETag/Last-Modified; на совпавший If-None-Match — 304 без тела."""
+        response = Response(self.body, content_type=self.content_type)
+        response.set_etag(self.etag)
+        response.last_modified = self.last_modified
+        # браузер хранит страницу, но каждый раз сверяется (дёшево: 304)
+        response.cache_control.public = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+
+class PageCache:
+    """LRU готовых страниц. Ключ должен включать всё, от чего зависит HTML (путь, query, версия меню)."""
+
+    def __init__(self, max_entries: int = 512) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedPage]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[CachedPage]:
+        with self._lock:
+            page = self._entries.get(key)
+            if page is not None:
+                self._entries.move_to_end(key)
+            return page
+
+    def put(self, key: Hashable, page: CachedPage) -> None:
+        with self._lock:
+            self._entries[key] = page
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def cache_pages(
+    cache: PageCache,
+    version: Callable[[], Hashable],
+    on_lookup: Callable[[bool], None] = lambda hit: None,
+) -> Callable:
+    """Декоратор view: готовый HTML для GET без flash-сообщений; ключ — путь, query и version().
+
+    Закешированная страница уходит с ETag — повторный запрос с If-None-Match получает 304.
+    on_lookup(hit) — для счётчиков попаданий.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # страница с flash-сообщением одноразовая — её не кешируем и не отдаём из кеша
+            if request.method != "GET" or session.get("_flashes"):
+                return view(*args, **kwargs)
+
+            key = (request.path, request.query_string, version())
+            page = cache.get(key)
+            on_lookup(page is not None)
+            if page is None:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                page = CachedPage.from_response(response)
+                cache.put(key, page)
+            return page.to_response(request)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,46 @@
+import re
+from functools import lru_cache
+from typing import Optional
+
+CURRENCY = "₸"
+
+# Все суммы в приложении — целые cents (сотые доли тенге): 1850 == ₸18.50.
+# Строки с ценой разбираются только на границе (форма админки, старые JSON-данные).
+
+_NOT_PRICE_CHARS = re.compile(r"[^0-9.,]")
+
+
+def parse_cents(text) -> int:
+    """'₸24' / '24' / '24.5' / '24,50' / '1 200' -> cents. Без float, поэтому без дрейфа округления.
+
+    Последний '.' или ',' с 1–2 цифрами после него — дробная часть, остальные разделители
+    считаются разделителями тысяч. Мусор -> 0.
+    """
+    s = _NOT_PRICE_CHARS.sub("", str(text or ""))
+    if not s:
+        return 0
+    whole, frac = s, ""
+    sep = max(s.rfind("."), s.rfind(","))
+    if sep >= 0 and 1 <= len(s) - sep - 1 <= 2:
+        whole, frac = s[:sep], s[sep + 1:]
+    whole = whole.replace(".", "").replace(",", "")
+    if not whole and not frac:
+        return 0
+    return int(whole or 0) * 100 + int(frac.ljust(2, "0"))
+
+
+@lru_cache(maxsize=8192)
+def format_cents(cents: int) -> str:
+    """1800 -> '₸18', 1850 -> '₸18.50'. Цен в меню немного, поэтому строки кешируются."""
+    sign = "-" if cents < 0 else ""
+    whole, frac = divmod(abs(cents), 100)
+    if frac:
+        return f"{sign}{CURRENCY}{whole}.{frac:02d}"
+    return f"{sign}{CURRENCY}{whole}"
+
+
+def money(cents: Optional[int]) -> str:
+    """Jinja-хелпер: сумма в cents -> строка для показа; None -> прочерк."""
+    if cents is None:
+        return "—"
+    return format_cents(int(cents))
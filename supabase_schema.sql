@@ -26,6 +26,9 @@ create table if not exists public.menu_items (
 
 create index if not exists menu_items_category_slug_idx on public.menu_items(category_slug);
 
+-- resized WebP/JPEG variants of image_path (see image_pipeline.py)
+alter table public.menu_items add column if not exists image_variants jsonb;
+
 -- 3) Bookings
 create table if not exists public.bookings (
   id bigserial primary key,
@@ -42,6 +45,16 @@ create table if not exists public.bookings (
 
 create index if not exists bookings_created_at_idx on public.bookings(created_at desc);
 
+-- admin list filters (keyset pagination itself runs on the primary key)
+create extension if not exists pg_trgm;
+create index if not exists bookings_booking_date_idx on public.bookings(booking_date, id desc);
+create index if not exists bookings_phone_trgm_idx on public.bookings using gin (phone gin_trgm_ops);
+create index if not exists bookings_full_name_trgm_idx on public.bookings using gin (full_name gin_trgm_ops);
+
+-- idempotency key from the app's local outbox (booking_outbox.py): a retried batch never duplicates a booking
+alter table public.bookings add column if not exists idempotency_key text;
+create unique index if not exists bookings_idempotency_key_idx on public.bookings(idempotency_key);
+
 -- 4) Booking items (what customer ordered)
 create table if not exists public.booking_items (
   id bigserial primary key,
@@ -56,6 +69,60 @@ create table if not exists public.booking_items (
 );
 
 create index if not exists booking_items_booking_id_idx on public.booking_items(booking_id);
+create index if not exists booking_items_menu_item_id_idx on public.booking_items(menu_item_id);
+
+-- 5) Batch insert used by the outbox flusher: one round trip, one transaction per batch.
+-- Already-known idempotency keys return the stored id and skip the items.
+create or replace function public.create_bookings(bookings jsonb)
+returns table (out_key text, out_booking_id bigint)
+language plpgsql
+as $$
+declare
+  b jsonb;
+  new_id bigint;
+begin
+  for b in select value from jsonb_array_elements(bookings) loop
+    new_id := null;
+    insert into public.bookings (
+      idempotency_key, full_name, email, phone, booking_date, booking_time, guests, notes, cart_total_cents
+    )
+    values (
+      b->>'idempotency_key',
+      b->>'full_name',
+      nullif(b->>'email', ''),
+      b->>'phone',
+      (b->>'booking_date')::date,
+      (b->>'booking_time')::time,
+      (b->>'guests')::integer,
+      b->>'notes',
+      coalesce((b->>'cart_total_cents')::integer, 0)
+    )
+    on conflict (idempotency_key) do nothing
+    returning id into new_id;
+
+    if new_id is null then
+      select id into new_id from public.bookings where idempotency_key = b->>'idempotency_key';
+    else
+      insert into public.booking_items (booking_id, menu_item_id, title, qty, unit_price_cents, line_total_cents, image_path)
+      select
+        new_id,
+        nullif((i->>'menu_item_id')::bigint, 0),
+        i->>'title',
+        (i->>'qty')::integer,
+        (i->>'unit_price_cents')::integer,
+        (i->>'line_total_cents')::integer,
+        i->>'image_path'
+      from jsonb_array_elements(coalesce(b->'items', '[]'::jsonb)) as i;
+    end if;
+
+    out_key := b->>'idempotency_key';
+    out_booking_id := new_id;
+    return next;
+  end loop;
+end;
+$$;
+
+grant execute on function public.create_bookings(jsonb) to anon;
 
 -- =========================
 -- SECURITY (IMPORTANT)
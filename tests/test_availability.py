@@ -0,0 +1,74 @@
+import pytest
+
+from availability import AvailabilityIndex, NoCapacity, SeatingModel, migration_slot_usage
+from db import SQLiteDatabase
+
+DAY = "2030-05-10"
+
+
+@pytest.fixture
+def index(tmp_path):
+    db = SQLiteDatabase(tmp_path / "bookings.sqlite3")
+    db.migrate([migration_slot_usage])
+    model = SeatingModel.from_dict({"tables": {"2": 2, "4": 2, "8": 1}, "last_seating": "21:00"})
+    return db, AvailabilityIndex(model)
+
+
+def test_party_larger_than_largest_table_mixes_sizes(index):
+    db, avail = index
+    with db.transaction() as con:
+        alloc = avail.reserve(con, DAY, "19:00", 10)
+    assert alloc.tables == ((2, 1), (8, 1))
+
+    # восьмиместный занят — та же компания собирается из четвёрок и двоек
+    with db.transaction() as con:
+        alloc = avail.reserve(con, DAY, "19:00", 10)
+    assert alloc.tables == ((2, 1), (4, 2))
+    with db.transaction() as con:
+        with pytest.raises(NoCapacity):
+            avail.reserve(con, DAY, "19:00", 10)
+
+    times = {s["time"] for s in avail.open_slots(db.connection(), DAY, DAY, 10)}
+    assert "19:00" not in times and "12:00" in times
+
+
+def test_reserve_takes_smallest_fitting_table_for_whole_turn(index):
+    db, avail = index
+    with db.transaction() as con:
+        alloc = avail.reserve(con, DAY, "19:00", 3)
+    assert alloc.tables == ((4, 1),)
+    used = db.connection().execute(
+        "SELECT slot, used FROM slot_usage WHERE day = ? AND table_size = 4 ORDER BY slot", (DAY,)
+    ).fetchall()
+    # 120 минут оборота — четыре получасовых слота с 19:00
+    assert [tuple(r) for r in used] == [(38, 1), (39, 1), (40, 1), (41, 1)]
+
+    with db.transaction() as con:
+        avail.release(con, alloc)
+    assert {s["time"] for s in avail.open_slots(db.connection(), DAY, DAY, 3)} >= {"19:00"}
+
+
+def test_over_capacity_is_rejected(index):
+    db, avail = index
+    # восьмеро помещаются за один стол — столы не сдвигаются, второй компании из восьми места нет
+    with db.transaction() as con:
+        avail.reserve(con, DAY, "19:00", 8)
+        with pytest.raises(NoCapacity):
+            avail.reserve(con, DAY, "19:00", 8)
+        # пересекающийся оборот тоже занят, а слот после конца оборота — свободен
+        with pytest.raises(NoCapacity):
+            avail.reserve(con, DAY, "20:30", 7)
+        avail.reserve(con, DAY, "21:00", 7)
+
+    slots = avail.open_slots(db.connection(), DAY, DAY, 8)
+    times = {s["time"] for s in slots}
+    assert "19:00" not in times and "17:30" not in times and "17:00" in times
+    # гостям 2: две двойки и две четвёрки свободны
+    assert {s["time"]: s["tables_left"] for s in avail.open_slots(db.connection(), DAY, DAY, 2)}["19:00"] == 4
+
+
+def test_outside_opening_hours(index):
+    db, avail = index
+    with db.transaction() as con:
+        with pytest.raises(ValueError):
+            avail.reserve(con, DAY, "21:30", 2)
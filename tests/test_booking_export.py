@@ -0,0 +1,31 @@
+import csv
+import io
+
+from booking_export import csv_chunks
+
+
+def _parse(rows):
+    text = "".join(csv_chunks(rows)).lstrip("﻿")
+    return list(csv.reader(io.StringIO(text)))[1:]
+
+
+def test_formula_cells_are_escaped():
+    row = (
+        1, "2026-10-20", "19:00", 2, "=HYPERLINK(\"http://evil\",\"x\")", "+79990000000",
+        "@SUM(A1)", "-1+2\tx", 4850, "", "\tБорщ", 1, 4850, 4850,
+    )
+    [cells] = _parse([row])
+    assert cells[4] == "'=HYPERLINK(\"http://evil\",\"x\")"
+    assert cells[5] == "'+79990000000"
+    assert cells[6] == "'@SUM(A1)"
+    assert cells[7] == "'-1+2\tx"
+    assert cells[10] == "'\tБорщ"
+    # числа и деньги не трогаем
+    assert cells[0] == "1" and cells[8] == "48.50" and cells[11] == "1"
+
+
+def test_plain_text_is_unchanged():
+    row = (2, "2026-10-20", "19:00", 2, "Анна", "8 999 000-00-00", "a@b.ru", "", None, "", "", None, None, None)
+    [cells] = _parse([row])
+    assert cells[4:8] == ["Анна", "8 999 000-00-00", "a@b.ru", ""]
+    assert cells[8] == ""
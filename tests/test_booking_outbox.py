@@ -0,0 +1,91 @@
+import pytest
+
+from booking_outbox import BookingOutbox
+
+
+class PoisonSender:
+    """Отвергает любую пачку, где есть бронь с guests < 0 (как ошибка приведения типа в RPC)."""
+
+    def __init__(self):
+        self.calls = []
+        self.next_id = 100
+
+    def __call__(self, batch):
+        self.calls.append(len(batch))
+        if any(b["guests"] < 0 for b in batch):
+            raise ValueError("invalid input syntax")
+        accepted = {}
+        for b in batch:
+            self.next_id += 1
+            accepted[b["idempotency_key"]] = self.next_id
+        return accepted
+
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    sender = PoisonSender()
+    box = BookingOutbox(tmp_path / "outbox.sqlite3", sender, base_delay=0, max_attempts=3)
+    monkeypatch.setattr(box, "ensure_running", lambda: None)  # без фонового потока
+    return box, sender
+
+
+def _enqueue(box, guests):
+    box.enqueue({"full_name": "Гость", "guests": guests, "booking_date": "2026-10-20", "booking_time": "19:00"}, [])
+
+
+def test_bad_row_does_not_block_batch(outbox):
+    box, sender = outbox
+    for guests in (2, -1, 3):
+        _enqueue(box, guests)
+
+    assert box.flush_once() == 2
+    assert sender.calls == [3, 1, 1, 1]
+    assert box.backlog() == (1, 0)
+
+
+def test_row_is_parked_after_max_attempts(outbox):
+    box, _ = outbox
+    _enqueue(box, -1)
+    for _ in range(3):
+        box.db.connection().execute("UPDATE booking_outbox SET next_attempt_at = 0")
+        box.flush_once()
+
+    assert box.backlog() == (0, 1)
+    assert box.flush_once() == 0  # проваленная запись больше не берётся
+    assert box.oldest_pending_age() is None
+
+    assert box.requeue_failed() == 1
+    assert box.backlog() == (1, 0)
+
+
+class Outage(ConnectionError):
+    pass
+
+
+def test_outage_neither_bisects_nor_parks(tmp_path, monkeypatch):
+    calls = []
+
+    def down(batch):
+        calls.append(len(batch))
+        raise Outage("connection refused")
+
+    box = BookingOutbox(
+        tmp_path / "outbox.sqlite3", down, base_delay=0, max_attempts=3,
+        is_transient=lambda e: isinstance(e, Outage),
+    )
+    monkeypatch.setattr(box, "ensure_running", lambda: None)
+    for guests in (2, 3):
+        _enqueue(box, guests)
+    for _ in range(10):
+        box.db.connection().execute("UPDATE booking_outbox SET next_attempt_at = 0")
+        box.flush_once()
+
+    assert calls == [2] * 10  # по одной не переотправляем
+    assert box.backlog() == (2, 0)  # сбой связи попытки не тратит
+    row = box.db.connection().execute("SELECT MAX(attempts), MIN(retries) FROM booking_outbox").fetchone()
+    assert tuple(row) == (0, 10)
+
+
+def test_outbox_file_is_fully_synchronous(outbox):
+    box, _ = outbox
+    assert box.db.connection().execute("PRAGMA synchronous").fetchone()[0] == 2  # FULL
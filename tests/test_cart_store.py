@@ -0,0 +1,34 @@
+import time
+
+import pytest
+
+from cart_store import CartFull, CartStore, SQLiteCartBackend
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CartStore(SQLiteCartBackend(tmp_path / "carts.sqlite3"), ttl_seconds=60, max_lines=3)
+
+
+def test_expired_token_starts_empty_cart(store):
+    token = store.new_token()
+    store.add(token, 1, 2)
+    revision = store.add(token, 2, 1)
+    # срок вышел, purge ещё не проходил
+    with store.backend.db.transaction() as con:
+        con.execute("UPDATE carts SET expires_at = ? WHERE token = ?", (time.time() - 1, token))
+    assert store.get(token, revision) == {}
+
+    revision = store.add(token, 3, 1)
+    assert revision == 1
+    assert store.get(token, revision) == {3: 1}
+
+
+def test_max_lines(store):
+    token = store.new_token()
+    for item_id in (1, 2, 3):
+        revision = store.add(token, item_id, 1)
+    with pytest.raises(CartFull):
+        store.add(token, 4, 1)
+    revision = store.add(token, 3, 1)  # количество уже лежащей позиции менять можно
+    assert store.get(token, revision) == {1: 1, 2: 1, 3: 2}
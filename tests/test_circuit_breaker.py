@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class Down(ConnectionError):
+    pass
+
+
+def fail():
+    raise Down("timeout")
+
+
+def test_closed_open_half_open_closed():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05, trip_on=(Down,))
+    for _ in range(2):
+        with pytest.raises(Down):
+            breaker.call(fail)
+    assert breaker.state == OPEN
+
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        breaker.call(calls.append, 1)  # открыт — сервис не зовём
+    assert calls == []
+
+    time.sleep(0.06)
+    # проба не удалась — снова open на reset_timeout
+    with pytest.raises(Down):
+        breaker.call(fail)
+    assert breaker.state == OPEN
+
+    time.sleep(0.06)
+
+    def probe():
+        assert breaker.state == HALF_OPEN
+        return "ok"
+
+    assert breaker.call(probe) == "ok"
+    assert breaker.state == CLOSED
+    assert breaker.stats()["opened_total"] == 2
+
+
+def test_non_trip_errors_keep_circuit_closed():
+    breaker = CircuitBreaker("test", failure_threshold=1, trip_on=(Down,))
+    with pytest.raises(ValueError):
+        breaker.call(int, "не число")  # сервис ответил — это не отказ
+    assert breaker.state == CLOSED
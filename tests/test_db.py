@@ -0,0 +1,38 @@
+import pytest
+
+from db import SQLiteDatabase
+
+
+def _recorder(log, number, fail=False):
+    def migration(con):
+        log.append(number)
+        con.execute(f"CREATE TABLE t{number} (id INTEGER)")
+        if fail:
+            raise RuntimeError("миграция упала")
+    return migration
+
+
+def test_migrations_run_in_order_once(tmp_path):
+    log = []
+    db = SQLiteDatabase(tmp_path / "app.sqlite3")
+    assert db.migrate([_recorder(log, 1), _recorder(log, 2)]) == 2
+    assert log == [1, 2]
+
+    # при новом запуске выполняются только добавленные в конец
+    reopened = SQLiteDatabase(tmp_path / "app.sqlite3")
+    assert reopened.migrate([_recorder(log, 1), _recorder(log, 2), _recorder(log, 3)]) == 3
+    assert log == [1, 2, 3]
+    assert reopened.connection().execute("PRAGMA user_version").fetchone()[0] == 3
+
+
+def test_failed_migration_rolls_back_whole_batch(tmp_path):
+    log = []
+    db = SQLiteDatabase(tmp_path / "app.sqlite3")
+    with pytest.raises(RuntimeError):
+        db.migrate([_recorder(log, 1), _recorder(log, 2, fail=True)])
+    con = db.connection()
+    assert con.execute("PRAGMA user_version").fetchone()[0] == 0
+    assert con.execute("SELECT COUNT(*) FROM sqlite_master WHERE name LIKE 't%'").fetchone()[0] == 0
+
+    assert db.migrate([_recorder(log, 1), _recorder(log, 2)]) == 2
+    assert log == [1, 2, 1, 2]
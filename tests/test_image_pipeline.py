@@ -0,0 +1,41 @@
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from image_pipeline import ImageProcessingError, generate_variants, resolve_static, variants_for
+
+
+def _image(path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new("RGB", (50, 40), "red").save(path, "JPEG")
+
+
+def test_variants_inside_static(tmp_path):
+    static = tmp_path / "static"
+    _image(static / "img" / "x.jpg")
+    variants = variants_for(static, "/img/x.jpg")
+    assert variants["thumb"]["webp"] == "img/variants/x-50.webp"
+    assert (static / "img" / "variants" / "x-50.jpg").is_file()
+
+
+def test_traversal_outside_static_is_rejected(tmp_path):
+    static = tmp_path / "static"
+    static.mkdir()
+    _image(tmp_path / "outside" / "x.jpg")
+
+    assert resolve_static(static, "../outside/x.jpg") is None
+    assert variants_for(static, "../outside/x.jpg") is None
+    with pytest.raises(ImageProcessingError):
+        generate_variants(static, "/../outside/x.jpg")
+    assert not (tmp_path / "outside" / "variants").exists()
+
+
+def test_symlink_out_of_static_is_rejected(tmp_path):
+    static = tmp_path / "static"
+    static.mkdir()
+    _image(tmp_path / "outside" / "x.jpg")
+    (static / "link").symlink_to(tmp_path / "outside")
+
+    assert variants_for(static, "link/x.jpg") is None
+    assert not (tmp_path / "outside" / "variants").exists()
@@ -0,0 +1,28 @@
+from menu_store import JsonMenuStore
+
+CATEGORIES = [{"slug": "mains", "label": "Основное"}]
+
+
+def test_write_during_load_is_not_tagged_with_new_version(tmp_path):
+    store = JsonMenuStore(tmp_path / "menu.json", CATEGORIES)
+    with store.edit() as data:
+        data.items.append({"id": data.allocate_id(), "title": "Старое"})
+
+    read_file = store._read_file
+
+    def read_then_concurrent_write():
+        parsed = read_file()
+        # другой воркер успевает записать между чтением и любым последующим stat
+        other = JsonMenuStore(store.path, CATEGORIES)
+        with other.edit() as data:
+            data.items[0]["title"] = "Новое"
+        return parsed
+
+    store._read_file = read_then_concurrent_write
+    version, _, items = store.load_versioned()
+    store._read_file = read_file
+
+    assert items[0]["title"] == "Старое"
+    assert version != store.version()  # старые данные не получили версию новой записи
+    version, _, items = store.load_versioned()
+    assert items[0]["title"] == "Новое" and version == store.version()
@@ -0,0 +1,46 @@
+import pytest
+from flask import Flask, flash, get_flashed_messages, redirect
+
+from page_cache import PageCache, cache_pages
+
+
+@pytest.fixture
+def site():
+    app = Flask(__name__)
+    app.secret_key = "test"
+    cache = PageCache()
+    calls = []
+
+    @app.route("/")
+    @cache_pages(cache, version=lambda: 1)
+    def index():
+        calls.append(1)
+        return "<p>меню</p>" + "".join(get_flashed_messages())  # как base.html
+
+    @app.route("/save")
+    def save():
+        flash("Сохранено")
+        return redirect("/")
+
+    return app.test_client(), cache, calls
+
+
+def test_cached_page_answers_304_to_matching_etag(site):
+    client, cache, calls = site
+    first = client.get("/")
+    assert first.status_code == 200 and first.headers["ETag"]
+
+    again = client.get("/", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304 and again.data == b""
+    assert len(calls) == 1 and len(cache) == 1
+
+
+def test_page_with_flash_is_not_cached(site):
+    client, cache, calls = site
+    client.get("/save")
+    client.get("/")  # страница с сообщением
+    assert len(calls) == 1 and len(cache) == 0
+
+    client.get("/")
+    client.get("/")
+    assert len(calls) == 2 and len(cache) == 1
@@ -0,0 +1,22 @@
+import pytest
+
+from pricing import format_cents, parse_cents
+
+
+@pytest.mark.parametrize("text, cents", [
+    ("18.5", 1850),
+    ("1,5", 150),
+    ("1.234,56", 123456),
+    ("₸24", 2400),
+    ("1 200", 120000),
+    ("1,234", 123400),  # три цифры после разделителя — тысячи, не дробь
+    ("", 0),
+    ("бесплатно", 0),
+])
+def test_parse_cents(text, cents):
+    assert parse_cents(text) == cents
+
+
+def test_format_round_trip():
+    assert format_cents(1850) == "₸18.50"
+    assert parse_cents(format_cents(123456)) == 123456
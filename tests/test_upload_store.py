@@ -0,0 +1,20 @@
+import io
+
+from upload_store import UploadStore
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+
+
+def test_gc_keeps_referenced_blobs(tmp_path):
+    store = UploadStore(tmp_path / "static", tmp_path / "uploads.sqlite3", max_bytes=1024)
+    used = store.save(io.BytesIO(PNG))
+    unused = store.save(io.BytesIO(PNG + b"\x01"))
+    variant = tmp_path / "static" / unused.rel_path
+    variant = variant.parent / "variants" / f"{unused.digest}-640.webp"
+    variant.parent.mkdir()
+    variant.write_bytes(b"x")
+
+    assert store.gc([used.rel_path], grace_seconds=3600) == []  # только что загружены
+    assert store.gc(["/" + used.rel_path], grace_seconds=0) == [unused.rel_path]
+    assert (tmp_path / "static" / used.rel_path).is_file()
+    assert not (tmp_path / "static" / unused.rel_path).exists() and not variant.exists()
@@ -0,0 +1,150 @@
+import hashlib
+import os
+import re
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterable, List, Optional
+
+from db import SQLiteDatabase
+
+CHUNK_SIZE = 64 * 1024
+
+# Сигнатуры поддерживаемых форматов (смотрим на байты, а не на расширение/Content-Type клиента)
+_CONTENT_TYPES = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+
+# uploads/ab/<sha256>.jpg и варианты uploads/ab/variants/<sha256>-640.webp — неизменяемые
+HASHED_URL_RE = re.compile(r"/uploads/[0-9a-f]{2}/(?:variants/)?[0-9a-f]{64}(?:-\d+)?\.[a-z0-9]+$")
+
+
+def _migration_001_blobs(con) -> None:
+    # refcount и released_at не используются: что занято, gc узнаёт от вызывающего по самим ссылкам
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            digest TEXT PRIMARY KEY,
+            rel_path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            content_type TEXT NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            released_at REAL
+        )
+    """)
+
+
+class UploadRejected(ValueError):
+    pass
+
+
+def sniff_content_type(head: bytes) -> Optional[str]:
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return None
+
+
+@dataclass(frozen=True)
+class StoredBlob:
+    digest: str
+    rel_path: str  # путь относительно static, например "uploads/ab/ab12….jpg"
+    size: int
+    content_type: str
+    created: bool  # False — такой файл уже был, сохранили только ссылку
+
+
+class UploadStore:
+    """Хранилище загрузок по хешу содержимого.
+
+    Файл потоково пишется во временный, по дороге считается sha256 и проверяется размер;
+    тип определяется по сигнатуре. Одинаковые картинки лежат на диске один раз; индекс
+    блобов в SQLite, а gc удаляет те, которых нет среди переданных ему ссылок.
+    """
+
+    def __init__(self, static_root: Path, index_path: Path, max_bytes: int, subdir: str = "uploads") -> None:
+        self.static_root = Path(static_root)
+        self.subdir = subdir
+        self.root = self.static_root / subdir
+        self.tmp_dir = self.root / ".tmp"
+        self.max_bytes = max_bytes
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.db = SQLiteDatabase(index_path)
+        self.db.migrate([_migration_001_blobs])
+
+    # ---- запись ----
+
+    def save(self, stream: BinaryIO) -> StoredBlob:
+        hasher = hashlib.sha256()
+        size = 0
+        content_type = None
+        fd, tmp = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if content_type is None:
+                        content_type = sniff_content_type(chunk[:16])
+                        if content_type is None:
+                            raise UploadRejected("Неподдерживаемый формат файла")
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise UploadRejected(f"Файл больше {self.max_bytes // (1024 * 1024)} МБ")
+                    hasher.update(chunk)
+                    out.write(chunk)
+            if content_type is None:
+                raise UploadRejected("Пустой файл")
+
+            digest = hasher.hexdigest()
+            rel_path = f"{self.subdir}/{digest[:2]}/{digest}.{_CONTENT_TYPES[content_type]}"
+            dest = self.static_root / rel_path
+            created = not dest.exists()
+            if created:
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                os.chmod(tmp, 0o644)
+                os.replace(tmp, dest)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+        with self.db.transaction() as con:
+            con.execute(
+                "INSERT OR IGNORE INTO blobs (digest, rel_path, size, content_type, created_at) VALUES (?, ?, ?, ?, ?)",
+                (digest, rel_path, size, content_type, time.time()),
+            )
+        return StoredBlob(digest, rel_path, size, content_type, created)
+
+    # ---- сборка мусора ----
+
+    def gc(self, referenced: Iterable[str], grace_seconds: float = 24 * 3600) -> List[str]:
+        """Удаляет блобы старше grace_seconds, которых нет в referenced (пути относительно static).
+
+        Вместе с блобом уходят его варианты. grace_seconds защищает только что загруженные
+        картинки, блюдо с которыми ещё не сохранено.
+        """
+        keep = {Path(rel or "").name.split(".", 1)[0] for rel in referenced}
+        cutoff = time.time() - grace_seconds
+        with self.db.transaction() as con:
+            rows = con.execute("SELECT digest, rel_path FROM blobs WHERE created_at < ?", (cutoff,)).fetchall()
+            removed = []
+            for digest, rel_path in rows:
+                if digest in keep:
+                    continue
+                blob = self.static_root / rel_path
+                blob.unlink(missing_ok=True)
+                for variant in (blob.parent / "variants").glob(f"{digest}-*"):
+                    variant.unlink(missing_ok=True)
+                con.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+                removed.append(rel_path)
+        return removed